@@ -2,6 +2,7 @@
 import log
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery
 from django.shortcuts import redirect
 from accounts.forms import VokoUserCreationForm, VokoUserChangeForm
 from accounts.models import (VokoUser, UserProfile, ReadOnlyVokoUser,
@@ -9,7 +10,7 @@ from accounts.models import (VokoUser, UserProfile, ReadOnlyVokoUser,
 from finance.models import Payment
 from mailing.helpers import get_template_by_id, render_mail_template, mail_user
 from ordering.core import get_current_order_round
-from ordering.models import Order
+from ordering.models import grouped_deletes
 from django.utils.safestring import mark_safe
 from hijack.contrib.admin import HijackUserAdminMixin
 from django.apps import apps
@@ -144,7 +145,7 @@ def roles(self):
     p = sorted(["<a title='%s'>%s</a>" % (
         x, short_name(x)) for x in self.groups.all()]
         )
-    if self.user_permissions.count():
+    if self.has_user_permissions:
         p += ['+']
     value = ', '.join(p)
     return mark_safe("<nobr>%s</nobr>" % value)
@@ -158,8 +159,13 @@ def phone(self):
     return self.userprofile.phone_number
 
 
+def _succeeded_payment_exists():
+    return Exists(Payment.objects.filter(succeeded=True,
+                                         order__user=OuterRef("pk")))
+
+
 def has_paid(self):
-    return Payment.objects.filter(succeeded=True, order__user=self).exists()
+    return self.has_paid_payment
 
 
 has_paid.boolean = True
@@ -178,11 +184,9 @@ class HasPaidFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() == "yes":
-            return queryset.distinct().filter(
-                orders__payments__succeeded=True)
+            return queryset.filter(_succeeded_payment_exists())
         elif self.value() == "no":
-            return queryset.distinct().exclude(
-                orders__payments__succeeded=True)
+            return queryset.filter(~_succeeded_payment_exists())
         else:
             return queryset.all()
 
@@ -230,6 +234,44 @@ class VokoUserBaseAdmin(UserAdmin):
         UserProfileInline,
     ]
 
+    def get_queryset(self, request):
+        """
+        Annotate everything the list_display columns need, so the
+        changelist doesn't run queries per row.
+        """
+        current_order_round = get_current_order_round()
+        paid = Q(orders__paid=True)
+        first_payment = Payment.objects.filter(
+            succeeded=True, order__user=OuterRef("pk")).order_by("id")
+        permissions = VokoUser.user_permissions.through.objects.filter(
+            vokouser=OuterRef("pk"))
+
+        return super(VokoUserBaseAdmin, self).get_queryset(request)\
+            .select_related("userprofile", "email_confirmation")\
+            .prefetch_related("groups")\
+            .annotate(
+                balance_amount=F("running_balance__amount"),
+                has_paid_payment=_succeeded_payment_exists(),
+                has_user_permissions=Exists(permissions),
+                first_payment_created=Subquery(
+                    first_payment.values("created")[:1]),
+                last_order_modified=Max("orders__modified", filter=paid),
+                paid_orders_count=Count("orders", filter=paid),
+                paid_orders_round_count=Count(
+                    "orders",
+                    filter=paid & Q(orders__order_round=current_order_round)),
+            )
+
+    def delete_model(self, request, obj):
+        # Deleting users cascades to their orders; update the order totals
+        # and product counters in bulk
+        with grouped_deletes():
+            super(VokoUserBaseAdmin, self).delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with grouped_deletes():
+            super(VokoUserBaseAdmin, self).delete_queryset(request, queryset)
+
     def email_confirmed(self, obj):
         if obj.email_confirmation:
             return obj.email_confirmation.is_confirmed
@@ -239,18 +281,12 @@ class VokoUserBaseAdmin(UserAdmin):
     @staticmethod
     def orders_round(obj):
         # Orders in this round
-        current_order_round = get_current_order_round()
-        orders = Order.objects.filter(order_round=current_order_round,
-                                      user=obj,
-                                      paid=True).count()
-        return orders
+        return obj.paid_orders_round_count
 
     @staticmethod
     def last_order(obj):
         # Most recent order
-        order = Order.objects.filter(user=obj, paid=True)\
-            .order_by("-modified").first()
-        return order.modified if order else None
+        return obj.last_order_modified
 
     @staticmethod
     def debit(obj):
@@ -262,15 +298,11 @@ class VokoUserBaseAdmin(UserAdmin):
 
     @staticmethod
     def total_orders(obj):
-        return Order.objects.filter(user=obj, paid=True).count()
+        return obj.paid_orders_count
 
     @staticmethod
     def first_payment(obj):
-        try:
-            return Payment.objects.filter(succeeded=True, order__user=obj)\
-                .order_by('id').first().created
-        except AttributeError:
-            return
+        return obj.first_payment_created
 
     @staticmethod
     def has_drivers_license(obj):
@@ -88,7 +88,15 @@ class UserProfile(TimeStampedModel):
         return "Profile for user: %s" % self.user
 
 
-class VokoUserManager(BaseUserManager):
+class VokoUserQuerySet(models.query.QuerySet):
+    def round_mail_recipients(self):
+        """
+        Users who didn't opt out of order round mails
+        """
+        return self.filter(models.Q(userprofile__isnull=True) | models.Q(userprofile__orderround_mail_optout=False))
+
+
+class VokoUserManager(BaseUserManager.from_queryset(VokoUserQuerySet)):
     def create_user(self, email, first_name, last_name, password=None):
         if not email:
             msg = "Users must have an email address"
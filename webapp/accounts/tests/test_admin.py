@@ -249,3 +249,51 @@ class VokoUserAdminTest(TestCase):
         self.assertIn("email", self.admin.list_display)
         self.assertIn("first_name", self.admin.list_display)
         self.assertIn("last_name", self.admin.list_display)
+
+    def test_changelist_annotations(self):
+        """Test the list_display columns read the annotated values."""
+        from datetime import datetime
+        import pytz
+        from finance.models import Payment
+        from ordering.models import Order, OrderRound
+
+        now = datetime.now(pytz.utc)
+        order_round = OrderRound.objects.create(open_for_orders=now, closed_for_orders=now, collect_datetime=now)
+        user = VokoUserFactory.create()
+        UserProfile.objects.create(user=user, phone_number="0612345678")
+        order = Order.objects.create(user=user, order_round=order_round, paid=True)
+        Order.objects.create(user=user, order_round=order_round)
+        payment = Payment.objects.create(order=order, succeeded=True, amount=10.00)
+        Balance.objects.create(user=user, type="DR", amount=2.5)
+
+        obj = self.admin.get_queryset(MockRequest()).get(pk=user.pk)
+
+        self.assertTrue(obj.has_paid_payment)
+        self.assertEqual(self.admin.total_orders(obj), 1)
+        self.assertEqual(self.admin.last_order(obj), Order.objects.get(pk=order.pk).modified)
+        self.assertEqual(self.admin.first_payment(obj), payment.created)
+        self.assertEqual(self.admin.debit(obj), 2.5)
+        self.assertEqual(self.admin.credit(obj), 0)
+
+    def test_changelist_queries_do_not_depend_on_number_of_users(self):
+        """Test the changelist doesn't run queries per user."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        admin_user = VokoUserFactory.create(is_staff=True, is_superuser=True)
+        self.client.force_login(admin_user)
+        url = reverse("admin:accounts_vokouser_changelist")
+        self.client.get(url)  # warm up caches
+
+        for _ in range(2):
+            UserProfile.objects.create(user=VokoUserFactory.create())
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        for _ in range(5):
+            UserProfile.objects.create(user=VokoUserFactory.create())
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertEqual(len(few), len(many))
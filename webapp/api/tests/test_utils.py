@@ -2,7 +2,7 @@
 import json
 from django.test import TestCase
 
-from api.utils import CSVResponse, JSONResponse
+from api.utils import CSVResponse, JSONResponse, StreamingCSVResponse, StreamingJSONResponse
 
 
 class JSONResponseTest(TestCase):
@@ -81,3 +81,68 @@ class CSVResponseTest(TestCase):
         self.assertIn("First", content)
         self.assertIn("Second", content)
         self.assertIn("Third", content)
+
+
+class StreamingJSONResponseTest(TestCase):
+    """Tests for the StreamingJSONResponse class."""
+
+    def _content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_returns_json_content_type(self):
+        """Test response has JSON content type."""
+        response = StreamingJSONResponse(iter([{"key": "value"}]))
+
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_returns_json_data(self):
+        """Test response contains the rows as a JSON list."""
+        data = [{"name": "Test", "count": 42}, {"name": "Other", "nested": {"key": [1, 2]}}]
+        response = StreamingJSONResponse(iter(data))
+
+        self.assertEqual(json.loads(self._content(response)), data)
+
+    def test_handles_empty_rows(self):
+        """Test handles no rows at all."""
+        response = StreamingJSONResponse(iter([]))
+
+        self.assertEqual(json.loads(self._content(response)), [])
+
+    def test_rows_are_produced_while_streaming(self):
+        """Test rows are not consumed before the response is read."""
+        produced = []
+
+        def rows():
+            for i in range(3):
+                produced.append(i)
+                yield {"i": i}
+
+        response = StreamingJSONResponse(rows())
+        self.assertEqual(produced, [])
+
+        self._content(response)
+        self.assertEqual(produced, [0, 1, 2])
+
+
+class StreamingCSVResponseTest(TestCase):
+    """Tests for the StreamingCSVResponse class."""
+
+    def test_returns_csv_content_type(self):
+        """Test response has CSV content type."""
+        response = StreamingCSVResponse(iter([{"key": "value"}]))
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+    def test_csv_has_headers_and_rows(self):
+        """Test CSV contains the header of the first row and all rows."""
+        data = [{"name": "First", "value": 1}, {"name": "Second", "value": 2}]
+        response = StreamingCSVResponse(iter(data))
+
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(lines, ["name,value", "First,1", "Second,2"])
+
+    def test_handles_empty_rows(self):
+        """Test handles no rows at all."""
+        response = StreamingCSVResponse(iter([]))
+
+        self.assertEqual(b"".join(response.streaming_content), b"")
@@ -4,10 +4,14 @@ from datetime import timedelta
 from decimal import Decimal
 
 from django.contrib.auth.models import Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from vokou.testing import VokoTestCase
-from ordering.models import OrderRound
+from ordering.models import OrderRound, RoundStatistics
+from accounts.models import EmailConfirmation
+from ordering.tests.factories import OrderFactory, OrderProductFactory, ProductFactory
 
 
 class OrdersAPIViewTest(VokoTestCase):
@@ -94,6 +98,41 @@ class OrdersAPIViewTest(VokoTestCase):
         self.assertIn("total_revenue", data[0])
         self.assertIn("markup_percentage", data[0])
 
+    def test_orders_json_serves_round_statistics(self):
+        """Test JSON view serves the statistics snapshot of the round."""
+        self.login()
+        self.user.groups.add(self.it_group)
+        order_round = self._create_order_round()
+        product = ProductFactory(order_round=order_round)
+        OrderProductFactory(order__order_round=order_round, order__paid=True, product=product,
+                            amount=2, retail_price=Decimal("2.50"))
+
+        data = json.loads(self.client.get("/api/orders.json").content)
+
+        self.assertEqual(data[0]["number_of_orders"], 1)
+        self.assertEqual(data[0]["number_of_ordering_members"], 1)
+        self.assertEqual(Decimal(str(data[0]["total_revenue"])), Decimal("5.00"))
+        self.assertEqual(data[0]["number_of_products"], 1)
+        self.assertEqual(data[0]["numbers_of_suppliers"], 1)
+        self.assertTrue(RoundStatistics.objects.filter(order_round=order_round).exists())
+
+    def test_orders_json_queries_do_not_depend_on_number_of_rounds(self):
+        """Test JSON view reads stored statistics in a single query."""
+        self.login()
+        self.user.groups.add(self.it_group)
+        self._create_order_round()
+        RoundStatistics.objects.fill_missing()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get("/api/orders.json")
+
+        for _ in range(3):
+            self._create_order_round()
+        RoundStatistics.objects.fill_missing()
+        with CaptureQueriesContext(connection) as many:
+            self.client.get("/api/orders.json")
+
+        self.assertEqual(len(few), len(many))
+
 
 class AccountsAPIViewTest(VokoTestCase):
     """Tests for the Accounts API views."""
@@ -149,7 +188,7 @@ class AccountsAPIViewTest(VokoTestCase):
         self.user.groups.add(self.it_group)
 
         response = self.client.get("/api/accounts.json")
-        data = json.loads(response.content)
+        data = json.loads(b"".join(response.streaming_content))
 
         self.assertIsInstance(data, list)
         # Should contain at least the current user
@@ -166,9 +205,43 @@ class AccountsAPIViewTest(VokoTestCase):
         self.user.groups.add(self.it_group)
 
         response = self.client.get("/api/accounts.csv")
-        content = response.content.decode("utf-8")
+        content = b"".join(response.streaming_content).decode("utf-8")
 
         # CSV should have headers including optional fields
         first_line = content.split("\n")[0]
         self.assertIn("created_date", first_line)
         self.assertIn("is_active", first_line)
+
+    def test_accounts_json_returns_first_paid_order_date(self):
+        """Test JSON view returns the date of the first paid order."""
+        self.login()
+        self.user.groups.add(self.it_group)
+        EmailConfirmation.objects.filter(user=self.user).update(is_confirmed=True)
+        OrderFactory(user=self.user, paid=False)
+        first = OrderFactory(user=self.user, paid=True)
+        OrderFactory(user=self.user, paid=True)
+
+        response = self.client.get("/api/accounts.json")
+        data = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(data[0]["first_order_date"], first.modified.date().isoformat())
+        self.assertIn("confirmed_date", data[0])
+
+    def test_accounts_csv_queries_do_not_depend_on_number_of_users(self):
+        """Test CSV view reads all users in a single query."""
+        self.login()
+        self.user.groups.add(self.it_group)
+
+        def get_csv():
+            b"".join(self.client.get("/api/accounts.csv").streaming_content)  # warm up caches
+            with CaptureQueriesContext(connection) as queries:
+                content = b"".join(self.client.get("/api/accounts.csv").streaming_content)
+            return queries, content
+
+        few, _ = get_csv()
+        for _ in range(3):
+            OrderFactory(paid=True)
+        many, content = get_csv()
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(content.decode("utf-8").splitlines()), 5)
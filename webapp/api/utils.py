@@ -1,8 +1,10 @@
 import csv
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import datetime
 import simplejson as json
 
+from vokou.utils import Echo
+
 
 def CSVResponse(data):
     response = HttpResponse(content_type='text/csv')
@@ -16,16 +18,51 @@ def CSVResponse(data):
     return response
 
 
-def JSONResponse(data):
-    def default(o):
-        if isinstance(o, (datetime.date, datetime.datetime)):
-            return o.isoformat()
+def _json_default(o):
+    if isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
+
 
+def JSONResponse(data):
     response_data = json.dumps(
         data,
         sort_keys=True,
         indent=1,
-        default=default
+        default=_json_default
     )
 
     return HttpResponse(response_data, content_type="application/json")
+
+
+def StreamingCSVResponse(rows):
+    """
+    Like CSVResponse, but writes the (dict) rows while they are produced,
+    so :rows: can be a generator over a large queryset
+    """
+    def lines():
+        writer = csv.writer(Echo())
+        field_names = None
+        for row in rows:
+            if field_names is None:
+                field_names = list(row.keys())
+                yield writer.writerow(field_names)
+            yield writer.writerow(row.values())
+
+    return StreamingHttpResponse(lines(), content_type='text/csv')
+
+
+def StreamingJSONResponse(rows):
+    """
+    Like JSONResponse, but writes the JSON array one row at a time while
+    the rows are produced
+    """
+    def chunks():
+        separator = '[\n'
+        for row in rows:
+            item = json.dumps(row, sort_keys=True, indent=1,
+                              default=_json_default)
+            yield separator + ' ' + item.replace('\n', '\n ')
+            separator = ',\n'
+        yield '[]' if separator == '[\n' else '\n]'
+
+    return StreamingHttpResponse(chunks(), content_type="application/json")
@@ -1,10 +1,13 @@
 from braces.views import GroupRequiredMixin
+from django.db.models import OuterRef, Subquery
 from django.views.generic import View
-from ordering.models import OrderRound
+from ordering.models import Order, OrderRound, RoundStatistics
 from pytz import UTC
 from datetime import datetime
-from .utils import CSVResponse, JSONResponse
+from .utils import (CSVResponse, JSONResponse, StreamingCSVResponse,
+                    StreamingJSONResponse)
 from accounts.models import VokoUser
+from vokou.utils import CSV_EXPORT_CHUNK_SIZE
 
 
 class OrdersAPIView(GroupRequiredMixin, View):
@@ -15,27 +18,24 @@ class OrdersAPIView(GroupRequiredMixin, View):
         data = []
         order_rounds = OrderRound.objects.all() \
             .filter(closed_for_orders__lt=now) \
+            .select_related('statistics') \
             .order_by("open_for_orders")
         for order_round in order_rounds:
-            products = order_round.products.all()
-            suppliers = set()
-            for product in products:
-                suppliers.add(product.supplier.name)
-            paid_orders = order_round.orders.filter(paid=True)
-            ordering_members = set()
-            for order in paid_orders:
-                ordering_members.add(order.user.id)
-            members = VokoUser.objects \
-                .filter(created__lt=order_round.open_for_orders)
+            try:
+                statistics = order_round.statistics
+            except RoundStatistics.DoesNotExist:
+                # Closed since the last statistics cron run
+                statistics = RoundStatistics.objects.refresh(order_round)
 
             data.append({
                 'open_for_orders_date': order_round.open_for_orders.date(),
-                'number_of_orders': order_round.number_of_orders(),
-                'number_of_ordering_members': len(ordering_members),
-                'number_of_members': members.count(),
-                'total_revenue': order_round.total_revenue(),
-                'number_of_products': products.count(),
-                'numbers_of_suppliers': len(suppliers),
+                'number_of_orders': statistics.number_of_orders,
+                'number_of_ordering_members':
+                    statistics.number_of_ordering_members,
+                'number_of_members': statistics.number_of_members,
+                'total_revenue': statistics.total_revenue,
+                'number_of_products': statistics.number_of_products,
+                'numbers_of_suppliers': statistics.number_of_suppliers,
                 'markup_percentage': order_round.markup_percentage
             })
         return data
@@ -55,9 +55,19 @@ class AccountsAPIView(GroupRequiredMixin, View):
     group_required = ('IT', 'Promo')
 
     def get_raw_data(self, include_empty_fields):
-        data = []
-        users = VokoUser.objects.all()
-        for user in users:
+        """
+        Yield the data per user, read in one (chunked) query
+        """
+        first_paid_order = Order.objects \
+            .filter(user=OuterRef('pk'), paid=True) \
+            .order_by('modified') \
+            .values('modified')[:1]
+        users = VokoUser.objects \
+            .select_related('email_confirmation') \
+            .annotate(first_paid_order_modified=Subquery(first_paid_order)) \
+            .order_by('pk')
+
+        for user in users.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
             field = {
                 'created_date': user.created.date(),  # rounded to day
                 'is_active': user.is_active,
@@ -75,22 +85,20 @@ class AccountsAPIView(GroupRequiredMixin, View):
             elif include_empty_fields:
                 field['activated_date'] = None
 
-            paid_orders = user.orders.filter(paid=True).order_by("modified")
-            first_paid_order = paid_orders.first()
-            if first_paid_order:
-                field['first_order_date'] = first_paid_order.modified.date()
+            if user.first_paid_order_modified:
+                field['first_order_date'] = \
+                    user.first_paid_order_modified.date()
             elif include_empty_fields:
                 field['first_order_date'] = None
 
-            data.append(field)
-        return data
+            yield field
 
 
 class AccountsJSONView(AccountsAPIView):
     def get(self, request, *args, **kwargs):
-        return JSONResponse(self.get_raw_data(False))
+        return StreamingJSONResponse(self.get_raw_data(False))
 
 
 class AccountsCSVView(AccountsAPIView):
     def get(self, request):
-        return CSVResponse(self.get_raw_data(True))
+        return StreamingCSVResponse(self.get_raw_data(True))
@@ -1,8 +1,21 @@
 import os
 import sys
 
+import pytest
+
 # Add webapp to path so Django can find the apps
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # pytest-django will handle Django setup automatically using the
 # DJANGO_SETTINGS_MODULE from pyproject.toml
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Cached values (e.g. the current order round) must not leak between
+    # tests, as database state is reset without calling save()/delete()
+    from django.core.cache import cache
+
+    cache.clear()
+    yield
+    cache.clear()
@@ -67,7 +67,8 @@ class BalanceAdmin(DeleteDisabledMixin, admin.ModelAdmin):
     actions = [export_as_csv_action(
         "CSV Export",
         fields=('id', 'created', 'user', 'type',
-                'formatted_amount', 'notes', 'balance_type'))]
+                'formatted_amount', 'notes', 'balance_type'),
+        select_related=('user', 'correction', 'payment', 'order'))]
 
     def is_correction(self, obj):
         return obj.correction is not None
@@ -1,7 +1,7 @@
 from braces.views import GroupRequiredMixin
 from django.http import HttpResponse
 from django.views.generic import View, TemplateView
-from ordering.models import OrderRound, OrderProductCorrection
+from ordering.models import OrderRound, OrderProduct, OrderProductCorrection, Supplier
 import simplejson as json  # Decimal support
 from collections import OrderedDict
 
@@ -18,27 +18,27 @@ class JsonRoundOverview(GroupRequiredMixin, View):
     def gather_data(order_round):
         ret = {'suppliers': OrderedDict()}
 
-        for supplier in order_round.suppliers():
+        order_totals = order_round.paid_orderproducts() \
+            .totals_per('product__supplier')
+        correction_totals = OrderProductCorrection.objects.filter(
+            order_product__order__order_round=order_round
+        ).totals_per('order_product__product__supplier')
+
+        for supplier in Supplier.objects.filter(
+                id__in=order_totals.keys()).order_by('name'):
+            corrections = correction_totals.get(supplier.id)
             d = dict()
-            d['total_amount'] = order_round.supplier_total_order_sum(supplier)
-
-            corrections = OrderProductCorrection.objects.filter(
-                order_product__order__order_round=order_round,
-                order_product__product__supplier=supplier
-            )
-            d['supplier_corrections_exc'] = sum(
-                [c.calculate_supplier_refund()
-                 for c in corrections.filter(charge_supplier=True)]
-            )
-            d['voko_corrections_inc'] = sum(
-                [c.calculate_refund()
-                 for c in corrections.filter(charge_supplier=False)]
-            )
+            d['total_amount'] = order_totals[supplier.id]['cost']
+            d['supplier_corrections_exc'] = \
+                corrections['supplier_exc'] if corrections else 0
+            d['voko_corrections_inc'] = \
+                corrections['voko_inc'] if corrections else 0
 
             d['to_pay'] = d['total_amount'] - d['supplier_corrections_exc']
             ret['suppliers'][supplier.name] = d
 
-        ret['total_profit'] = order_round.total_profit()
+        ret['total_profit'] = sum(
+            [totals['profit'] for totals in order_totals.values()])
 
         return ret
 
@@ -61,7 +61,14 @@ class YearOverview(GroupRequiredMixin, TemplateView):
         ctx = super(YearOverview, self).get_context_data(**kwargs)
         ctx['year'] = year
         # Rounds that opened in :year:
-        ctx['rounds'] = OrderRound.objects.filter(
+        rounds = OrderRound.objects.filter(
             open_for_orders__year=self.kwargs['year']).order_by('-id')
 
+        # Totals of all rounds in one query
+        totals = OrderProduct.objects.filter(order__order_round__in=rounds) \
+            .paid().totals_per('order__order_round')
+        for order_round in rounds:
+            order_round.totals = totals.get(order_round.id)
+
+        ctx['rounds'] = rounds
         return ctx
@@ -0,0 +1,28 @@
+from django_cron import CronJobBase, Schedule
+from log import buffered_events, log_event
+
+from finance.models import RunningBalance
+
+
+class RebuildRunningBalances(CronJobBase):
+    """
+    Repairs the running balances of users
+
+    Cron runs every 24 hours
+
+    The running balances are kept up to date when balances are saved or
+    deleted, but bulk updates bypass them; see also the rebuild_balances
+    management command
+    """
+
+    RUN_EVERY_MINS = 60 * 24  # 24 hours
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "finance.rebuild_running_balances"
+
+    @buffered_events()
+    def do(self):
+        mismatches = RunningBalance.objects.rebuild()
+        for user_id, stored, amount in mismatches:
+            log_event(event="Fixed running balance of user %s: stored %s, history %s" % (user_id, stored, amount))
+        print("Fixed %d running balance(s)" % len(mismatches))
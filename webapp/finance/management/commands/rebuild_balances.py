@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from finance.models import RunningBalance
+
+
+class Command(BaseCommand):
+    help = "Check running balances against the full Balance history and fix the ones that are off"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report differences, don't fix them",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = RunningBalance.objects.rebuild(dry_run=options["dry_run"])
+
+        for user_id, stored, amount in mismatches:
+            self.stdout.write("User %s: running balance %s, history %s" % (user_id, stored, amount))
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All running balances match the history"))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING("%d running balance(s) differ" % len(mismatches)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Fixed %d running balance(s)" % len(mismatches)))
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.29 on 2026-10-18 16:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+
+
+def fill_running_balances(apps, schema_editor):
+    Balance = apps.get_model("finance", "Balance")
+    RunningBalance = apps.get_model("finance", "RunningBalance")
+
+    totals = defaultdict(Decimal)
+    for user_id, balance_type, amount in Balance.objects.values_list("user", "type", "amount").iterator():
+        totals[user_id] += amount if balance_type == "CR" else -amount
+
+    RunningBalance.objects.bulk_create(
+        [RunningBalance(user_id=user_id, amount=amount) for user_id, amount in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0033_userprofile_orderround_mail_optout'),
+        ('finance', '0020_auto_20230213_1752'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunningBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='running_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.RunPython(fill_running_balances, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,10 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import (BigIntegerField, Case, DecimalField, F, Sum,
+                              Value, When)
+from django.db.models.functions import Cast, Round
 from django.conf import settings
 from django_extensions.db.models import TimeStampedModel
 
@@ -60,6 +66,10 @@ class BalanceManager(models.Manager):
     use_for_related_fields = True
 
     def _credit(self):
+        user = getattr(self, "instance", None)
+        if user is not None:
+            return RunningBalance.objects.amount_for(user)
+
         credit_objs = self.get_queryset().filter(type="CR")
         debit_objs = self.get_queryset().filter(type="DR")
         credit_sum = sum([b.amount for b in credit_objs])
@@ -78,6 +88,35 @@ class BalanceManager(models.Manager):
         _debit = self._debit()
         return _debit if _debit > 0 else 0
 
+    def create_many(self, balances):
+        """
+        Save new :balances: with one insert, with the same check and
+        running balance updates as Balance.save(). Returns the balances.
+        """
+        amounts = defaultdict(Decimal)
+        for balance in balances:
+            balance.check_amount()
+            amounts[balance.user_id] += balance.signed_amount
+
+        with transaction.atomic():
+            balances = self.bulk_create(balances)
+            RunningBalance.objects.add_many(amounts)
+        return balances
+
+    def delete_many(self, balance_ids):
+        """
+        Delete the balances with :balance_ids: in bulk, with the same
+        running balance updates as Balance.delete()
+        """
+        with transaction.atomic():
+            balances = self.filter(pk__in=balance_ids)
+            amounts = defaultdict(Decimal)
+            for user_id, type_, amount in balances.values_list(
+                    "user", "type", "amount"):
+                amounts[user_id] -= amount if type_ == "CR" else -amount
+            RunningBalance.objects.add_many(amounts)
+            return balances.delete()
+
 
 class Balance(TimeStampedModel):
     """
@@ -102,15 +141,37 @@ class Balance(TimeStampedModel):
     def __str__(self):
         return "[%s] %s: %s" % (self.user, self.type, self.amount)
 
-    def save(self, **kwargs):
+    def check_amount(self):
         """ Sanity check, the amount may not be zero or less. """
         if self.amount <= 0:
             raise ValueError("Amount may not be zero or negative. "
                              "Amount was: %s" % self.amount)
-        super(Balance, self).save(**kwargs)
+
+    def save(self, **kwargs):
+        self.check_amount()
+
+        with transaction.atomic():
+            if self.pk is not None:
+                orig = Balance.objects.filter(pk=self.pk).first()
+                if orig:
+                    RunningBalance.objects.add(orig.user_id,
+                                               -orig.signed_amount)
+            super(Balance, self).save(**kwargs)
+            RunningBalance.objects.add(self.user_id, self.signed_amount)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            RunningBalance.objects.add(self.user_id, -self.signed_amount)
+            return super(Balance, self).delete(*args, **kwargs)
 
     objects = BalanceManager()
 
+    @property
+    def signed_amount(self):
+        """ Amount as it counts towards the user's balance """
+        amount = Decimal(str(self.amount))
+        return amount if self.type == "CR" else -amount
+
     # The following functions are used for csv export
 
     def _is_correction(self):
@@ -147,3 +208,98 @@ class Balance(TimeStampedModel):
             return "+%s" % decimal
         elif self.type == 'DR':
             return "-%s" % decimal
+
+
+class RunningBalanceManager(models.Manager):
+    def add(self, user_id, amount):
+        """
+        Atomically add :amount: (negative for debit) to the balance of
+        :user_id:
+        """
+        if not amount:
+            return
+        self.bulk_create([RunningBalance(user_id=user_id)],
+                         ignore_conflicts=True)
+        self.filter(user_id=user_id).update(amount=F("amount") + amount)
+
+    def add_many(self, amounts):
+        """
+        Like add(), for a dict of user id => amount, in two queries
+        """
+        amounts = {user_id: amount for user_id, amount in amounts.items()
+                   if amount}
+        if not amounts:
+            return
+        self.bulk_create([RunningBalance(user_id=user_id)
+                          for user_id in amounts], ignore_conflicts=True)
+        self.filter(user_id__in=amounts).update(amount=F("amount") + Case(
+            *[When(user_id=user_id, then=Value(amount))
+              for user_id, amount in amounts.items()],
+            output_field=DecimalField(max_digits=10, decimal_places=2)))
+
+    def amount_for(self, user):
+        """
+        Return credit minus debit of :user:. Uses the balance_amount
+        annotation when present (see VokoUserBaseAdmin.get_queryset).
+        """
+        if hasattr(user, "balance_amount"):
+            amount = user.balance_amount
+        else:
+            amount = self.filter(user=user).values_list(
+                "amount", flat=True).first()
+        return amount if amount is not None else Decimal("0")
+
+    @staticmethod
+    def totals_from_history():
+        """
+        Return {user id: credit minus debit} calculated from all Balance
+        objects, summed as integer cents so the result is exact.
+        """
+        cents = Cast(Round(F("amount") * 100), output_field=BigIntegerField())
+        rows = Balance.objects.order_by().values_list("user").annotate(
+            total=Sum(Case(When(type="DR", then=-cents), default=cents,
+                           output_field=BigIntegerField())))
+        return {user_id: (Decimal(total) / 100).quantize(Decimal(".01"))
+                for user_id, total in rows}
+
+    def rebuild(self, dry_run=False):
+        """
+        Compare running balances with the Balance history and fix them.
+        Return list of (user id, stored amount, amount from history) for
+        all balances that were off.
+        """
+        totals = self.totals_from_history()
+        stored = dict(self.values_list("user", "amount"))
+
+        zero = Decimal("0")
+        mismatches = [
+            (user_id, stored.get(user_id, zero), totals.get(user_id, zero))
+            for user_id in sorted(set(totals) | set(stored))
+            if stored.get(user_id, zero) != totals.get(user_id, zero)
+        ]
+        if dry_run or not mismatches:
+            return mismatches
+
+        with transaction.atomic():
+            for user_id, _, amount in mismatches:
+                self.update_or_create(user_id=user_id,
+                                      defaults={"amount": amount})
+        return mismatches
+
+
+class RunningBalance(models.Model):
+    """
+    A user's credit minus debit, kept up to date on every Balance change,
+    so it can be read from one row instead of summing all transactions.
+    Rebuild from history with the rebuild_balances management command.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                primary_key=True,
+                                related_name="running_balance",
+                                on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    objects = RunningBalanceManager()
+
+    def __str__(self):
+        return "%s: %s" % (self.user_id, self.amount)
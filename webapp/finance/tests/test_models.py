@@ -1,5 +1,11 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+
 from accounts.tests.factories import VokoUserFactory
-from finance.models import Balance, Payment
+from finance.cron import RebuildRunningBalances
+from finance.models import Balance, Payment, RunningBalance
 from finance.tests.factories import PaymentFactory, BalanceFactory
 from vokou.testing import VokoTestCase
 
@@ -73,3 +79,75 @@ class TestBalanceManager(VokoTestCase):
 
         self.assertEqual(self.vokouser.balance.credit(), 0)
         self.assertEqual(self.vokouser.balance.debit(), 0)
+
+
+class TestRunningBalance(VokoTestCase):
+    def setUp(self):
+        self.vokouser = VokoUserFactory()
+
+    def amount(self):
+        return RunningBalance.objects.get(user=self.vokouser).amount
+
+    def test_balance_changes_are_added(self):
+        credit = self.vokouser.balance.create(type="CR", amount=Decimal("12.10"))
+        debit = self.vokouser.balance.create(type="DR", amount=Decimal("2.05"))
+        self.assertEqual(self.amount(), Decimal("10.05"))
+
+        debit.amount = Decimal("3.05")
+        debit.save()
+        self.assertEqual(self.amount(), Decimal("9.05"))
+
+        credit.delete()
+        self.assertEqual(self.amount(), Decimal("-3.05"))
+        self.assertEqual(self.vokouser.balance.debit(), Decimal("3.05"))
+
+    def test_create_many_and_delete_many(self):
+        other = VokoUserFactory()
+        balances = Balance.objects.create_many([
+            Balance(user=self.vokouser, type="CR", amount=Decimal("12.10")),
+            Balance(user=self.vokouser, type="DR", amount=Decimal("2.05")),
+            Balance(user=other, type="CR", amount=Decimal("1.00")),
+        ])
+        self.assertEqual(self.amount(), Decimal("10.05"))
+        self.assertEqual(other.balance.credit(), Decimal("1.00"))
+
+        Balance.objects.delete_many([balances[0].pk, balances[2].pk])
+        self.assertEqual(self.amount(), Decimal("-2.05"))
+        self.assertEqual(other.balance.credit(), Decimal("0"))
+        self.assertEqual(Balance.objects.get(), balances[1])
+
+    def test_create_many_checks_amounts(self):
+        with self.assertRaises(ValueError):
+            Balance.objects.create_many([
+                Balance(user=self.vokouser, type="CR", amount=Decimal("1")),
+                Balance(user=self.vokouser, type="CR", amount=Decimal("0")),
+            ])
+        self.assertFalse(Balance.objects.exists())
+
+    def test_balance_is_read_with_one_query(self):
+        self.vokouser.balance.create(type="CR", amount=Decimal("5"))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.vokouser.balance.credit(), Decimal("5"))
+
+    def test_rebuild_fixes_running_balances(self):
+        self.vokouser.balance.create(type="CR", amount=Decimal("0.10"))
+        self.vokouser.balance.create(type="CR", amount=Decimal("0.20"))
+        RunningBalance.objects.filter(user=self.vokouser).update(amount=0)
+
+        self.assertEqual(RunningBalance.objects.rebuild(dry_run=True),
+                         [(self.vokouser.id, Decimal("0"), Decimal("0.30"))])
+        self.assertEqual(self.amount(), Decimal("0"))
+
+        out = StringIO()
+        call_command("rebuild_balances", stdout=out)
+        self.assertIn("Fixed 1 running balance(s)", out.getvalue())
+        self.assertEqual(self.amount(), Decimal("0.30"))
+        self.assertEqual(RunningBalance.objects.rebuild(), [])
+
+    def test_cron_rebuilds_running_balances(self):
+        self.vokouser.balance.create(type="CR", amount=Decimal("0.10"))
+        RunningBalance.objects.filter(user=self.vokouser).update(amount=5)
+
+        RebuildRunningBalances().do()
+
+        self.assertEqual(self.amount(), Decimal("0.10"))
@@ -197,7 +197,7 @@ class TestConfirmTransaction(FinanceTestCase):
         self.assertEqual(
             debit.notes, "Debit van %s voor bestelling #%s" % (payment.order.total_price, payment.order.id)
         )
-        self.mock_mail_confirmation.assert_called_once_with()
+        self.mock_mail_confirmation.assert_called_once_with(shortages=[])
 
     def test_nothing_is_changed_when_payment_already_confirmed(self):
         self.order.paid = True
@@ -60,7 +60,8 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
             messages.error(request, "Geen bestelling gevonden")
             return redirect(reverse('view_products'))
 
-        log_event(event="Finalizing order %s" % order_to_pay.id, user=order_to_pay.user)
+        log_event(event="Finalizing order %s" % order_to_pay.id, user=order_to_pay.user,
+                  order_id=order_to_pay.id)
         order_to_pay.finalized = True  # Freeze order
         order_to_pay.save()
 
@@ -69,7 +70,7 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
         log_event(
             event="Initiating payment (creating transaction) for order %d "
                   "and amount %f" %
-                  (order_to_pay.id, amount_to_pay), user=order_to_pay.user)
+                  (order_to_pay.id, amount_to_pay), user=order_to_pay.user, order_id=order_to_pay.id)
 
         # Extra context for debugging before starting external call
         try:
@@ -81,6 +82,7 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
                 "[DEBUG] Payment pre-checks for order %s" % order_to_pay.id
             ),
             user=order_to_pay.user,
+            order_id=order_to_pay.id,
             extra=(
                 "finalized=%s, paid=%s, succeeded_payment_exists=%s, round_is_open=%s"
                 % (
@@ -98,7 +100,8 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
                       "is %f and user's credit is %f" %
                       (order_to_pay.id, order_to_pay.total_price,
                        order_to_pay.user.balance.credit()),
-                user=order_to_pay.user
+                user=order_to_pay.user,
+                order_id=order_to_pay.id
             )
 
             self._message_payment_unnecessary()
@@ -120,7 +123,8 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
                 event="Payment for order %s canceled because "
                       "order round %s is closed" %
                       (order_to_pay.id, order_to_pay.order_round.id),
-                user=order_to_pay.user)
+                user=order_to_pay.user,
+                order_id=order_to_pay.id)
             return redirect(reverse('finish_order', args=(order_to_pay.id,)))
 
         # Start the payment
@@ -139,6 +143,7 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
             log_event(
                 event=("[DEBUG] Mollie payment created for order %s") % order_to_pay.id,
                 user=order_to_pay.user,
+                order_id=order_to_pay.id,
                 extra=("mollie_id=%s, status=%s, checkout_url=%s") % (mollie_id, status, checkout_url),
             )
         except Exception as e:
@@ -148,6 +153,7 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
                     "[ERROR] Failed to create Mollie payment for order %s: %s"
                 ) % (order_to_pay.id, e),
                 user=order_to_pay.user,
+                order_id=order_to_pay.id,
             )
             messages.error(request, "Het aanmaken van de betaling is mislukt. Probeer het later opnieuw.")
             # Un-freeze order so user can retry
@@ -165,12 +171,14 @@ class CreateTransactionView(LoginRequiredMixin, MollieMixin, FormView):
                 "[DEBUG] Stored local Payment for order %s with mollie_id=%s"
             ) % (order_to_pay.id, mollie_id),
             user=order_to_pay.user,
+            order_id=order_to_pay.id,
         )
 
         redirect_url = results.checkout_url
         log_event(
             event=("[DEBUG] Redirecting user to Mollie checkout for order %s") % (order_to_pay.id),
             user=order_to_pay.user,
+            order_id=order_to_pay.id,
             extra=("checkout_url=%s") % redirect_url,
         )
         return redirect(redirect_url)
@@ -220,6 +228,7 @@ class ConfirmTransactionView(LoginRequiredMixin, MollieMixin, TemplateView):
             log_event(
                 event=("[DEBUG] ConfirmTransactionView: order already paid"),
                 user=order.user,
+                order_id=order.id,
                 extra=("order_id=%s") % order.id,
             )
             context['payment_succeeded'] = True
@@ -233,6 +242,7 @@ class ConfirmTransactionView(LoginRequiredMixin, MollieMixin, TemplateView):
             log_event(
                 event=("[WARN] ConfirmTransactionView: No pending Payment found"),
                 user=order.user,
+                order_id=order.id,
                 extra=("order_id=%s") % order_id,
             )
             raise Http404
@@ -240,6 +250,7 @@ class ConfirmTransactionView(LoginRequiredMixin, MollieMixin, TemplateView):
         log_event(
             event=("[DEBUG] ConfirmTransactionView: Fetching Mollie payment status"),
             user=order.user,
+            order_id=order.id,
             extra=("mollie_id=%s, order_id=%s") % (payment.mollie_id, order_id),
         )
         try:
@@ -248,6 +259,7 @@ class ConfirmTransactionView(LoginRequiredMixin, MollieMixin, TemplateView):
             log_event(
                 event=("[ERROR] ConfirmTransactionView: Failed to fetch Mollie payment"),
                 user=order.user,
+                order_id=order.id,
                 extra=("mollie_id=%s, order_id=%s, error=%s") % (payment.mollie_id, order_id, e),
             )
             context['payment_succeeded'] = False
@@ -257,6 +269,7 @@ class ConfirmTransactionView(LoginRequiredMixin, MollieMixin, TemplateView):
         log_event(
             event=("[DEBUG] ConfirmTransactionView: Mollie payment status fetched"),
             user=order.user,
+            order_id=order.id,
             extra=("mollie_id=%s, status=%s, is_paid=%s") % (payment.mollie_id, status, success),
         )
 
@@ -274,16 +287,19 @@ class ConfirmTransactionView(LoginRequiredMixin, MollieMixin, TemplateView):
                 log_event(
                     event="Payment %s for order %s and amount %f succeeded" %
                           (payment.id, payment.order.id, payment.amount),
-                    user=payment.order.user)
+                    user=payment.order.user,
+                    order_id=payment.order_id, payment_id=payment.id)
 
             else:
                 log_event(event="Payment %s was already paid" % payment.id,
-                          user=payment.order.user)
+                          user=payment.order.user,
+                          order_id=payment.order_id, payment_id=payment.id)
 
         else:
             log_event(
                 event=("Payment failed in confirm view"),
                 user=payment.order.user,
+                order_id=payment.order_id, payment_id=payment.id,
                 extra=("payment_id=%s, order_id=%s, amount=%s, status=%s") % (payment.id, payment.order.id,
                                                                               payment.amount, status),
             )
@@ -323,6 +339,7 @@ class PaymentWebHook(MollieMixin, View):
             log_event(
                 event=("[ERROR] Webhook: Failed to fetch Mollie payment"),
                 user=payment.order.user,
+                order_id=payment.order_id, payment_id=payment.id,
                 extra=("mollie_id=%s, order_id=%s, error=%s") % (payment.mollie_id, payment.order.id, e),
             )
             return HttpResponse("error", status=500)
@@ -331,6 +348,7 @@ class PaymentWebHook(MollieMixin, View):
         log_event(
             event=("[DEBUG] Webhook Mollie status fetched"),
             user=payment.order.user,
+            order_id=payment.order_id, payment_id=payment.id,
             extra=("mollie_id=%s, status=%s, is_paid=%s, order_id=%s") % (payment.mollie_id, status, success,
                                                                           payment.order.id),
         )
@@ -340,7 +358,8 @@ class PaymentWebHook(MollieMixin, View):
                 event="Payment %s for order %s and amount %f "
                       "failed via callback (Mollie status=%s)" %
                       (payment.id, payment.order.id, payment.amount, status),
-                user=payment.order.user)
+                user=payment.order.user,
+                order_id=payment.order_id, payment_id=payment.id)
             return HttpResponse("")
 
         # Successful payment!
@@ -352,7 +371,8 @@ class PaymentWebHook(MollieMixin, View):
             event="Payment %s for order %s and amount %f "
                   "succeeded via callback" %
                   (payment.id, payment.order.id, payment.amount),
-            user=payment.order.user)
+            user=payment.order.user,
+            order_id=payment.order_id, payment_id=payment.id)
 
         if payment.order.paid is False:
             # Order has not been paid, but the payment has now been confirmed
@@ -376,7 +396,8 @@ class PaymentWebHook(MollieMixin, View):
                           "order %s via callback!" % (
                               payment.order.order_round.id,
                               payment.order.id),
-                    user=payment.order.user)
+                    user=payment.order.user,
+                    order_id=payment.order_id, payment_id=payment.id)
 
                 payment.order.mail_failure_notification()
 
@@ -402,7 +423,8 @@ class CancelPaymentView(View):
         order_to_pay.save()
 
         log_event(event="Payment for order %s canceled" % order_to_pay.id,
-                  user=order_to_pay.user)
+                  user=order_to_pay.user,
+                  order_id=order_to_pay.id)
 
         return HttpResponseRedirect(
             reverse("finish_order", args=(order_to_pay.pk,)))
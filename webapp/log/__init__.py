@@ -1,13 +1,109 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import DEBUG, ERROR, INFO, WARNING
+
+from django.conf import settings
+
+# Events logged while buffering, activated by buffered_events()
+_buffer = ContextVar("log_event_buffer", default=None)
+
+# Events written with one of these prefixes get the matching level
+_PREFIX_LEVELS = (
+    ("[DEBUG]", DEBUG),
+    ("[WARN]", WARNING),
+    ("[ERROR]", ERROR),
+)
+
+
+def _level_of(event):
+    for prefix, level in _PREFIX_LEVELS:
+        if event.startswith(prefix):
+            return level
+    return INFO
+
+
+def is_enabled_for(level):
+    """
+    Whether events of :level: are always stored (see EVENT_LOG_LEVEL)
+    """
+    return level >= settings.EVENT_LOG_LEVEL
+
+
+def _is_kept(level):
+    if is_enabled_for(level):
+        return True
+    sample_rate = settings.EVENT_LOG_SAMPLE_RATE
+    return sample_rate > 0 and random.random() < sample_rate
 
 
 def log_event(operator=None,
               user=None,
               event="",
-              extra=None):
+              extra=None,
+              level=None,
+              order_id=None,
+              payment_id=None):
+    """
+    Store an event. :level: defaults to the level of the event's
+    [DEBUG]/[WARN]/[ERROR] prefix, or INFO. Pass :order_id: and
+    :payment_id: for events about an order or payment, so they can be
+    looked up.
+    Inside buffered_events() the event is written when the buffer is
+    flushed instead of right away.
+    """
+    from log.models import EventLog
+
+    if level is None:
+        level = _level_of(event)
+    if not _is_kept(level):
+        return
+
+    entry = EventLog(operator=operator,
+                     user=user,
+                     event=event,
+                     extra=extra,
+                     level=level,
+                     order_id=order_id,
+                     payment_id=payment_id)
+
+    buffer = _buffer.get()
+    if buffer is None:
+        entry.save()
+        return
 
+    buffer.append(entry)
+    if len(buffer) >= settings.EVENT_LOG_BUFFER_SIZE:
+        flush_events()
+
+
+def flush_events():
+    """
+    Write the buffered events with a single query
+    """
     from log.models import EventLog
 
-    EventLog.objects.create(operator=operator,
-                            user=user,
-                            event=event,
-                            extra=extra)
+    buffer = _buffer.get()
+    if not buffer:
+        return
+    entries = buffer[:]
+    del buffer[:]
+    EventLog.objects.bulk_create(entries)
+
+
+@contextmanager
+def buffered_events():
+    """
+    Collect the events logged during a request (or any other unit of work,
+    like a cron run) and write them in bulk at the end, also when an
+    exception is raised.
+    Can be used as a decorator too.
+    """
+    token = _buffer.set([])
+    try:
+        yield
+    finally:
+        try:
+            flush_events()
+        finally:
+            _buffer.reset(token)
@@ -4,7 +4,8 @@ from vokou.admin import DeleteDisabledMixin
 
 
 class EventLogAdmin(DeleteDisabledMixin, admin.ModelAdmin):
-    list_display = ["created", "event", "operator", "user"]
+    list_display = ["created", "level", "event", "operator", "user", "order_id", "payment_id"]
+    list_filter = ["level"]
     ordering = ("-id", )
     search_fields = ['event', 'operator__email', 'user__email']
 
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django_cron import CronJobBase, Schedule
+
+from log.models import EventLog
+
+
+class PruneEventLog(CronJobBase):
+    """
+    Archives and deletes events older than their retention period
+    (see EVENT_LOG_RETENTION)
+
+    cron runs every day
+    """
+
+    RUN_EVERY_MINS = 60 * 24
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "log.prune_eventlog"
+
+    def do(self):
+        deleted = EventLog.objects.prune(archive_dir=settings.EVENT_LOG_ARCHIVE_DIR)
+        print("Deleted %d expired event(s)" % deleted)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from log.models import EventLog
+
+
+class Command(BaseCommand):
+    help = "Archive and delete events older than their retention period (see EVENT_LOG_RETENTION)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many events would be deleted",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.EVENT_LOG_ARCHIVE_DIR,
+            help="Directory for the archive file (default: EVENT_LOG_ARCHIVE_DIR)",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            for policy, expired in EventLog.objects.expired():
+                self.stdout.write(
+                    "%s (%d days): %d event(s)" % (policy.get("filter", "other"), policy["days"], expired.count())
+                )
+            return
+
+        deleted = EventLog.objects.prune(archive_dir=options["archive_dir"])
+        self.stdout.write(self.style.SUCCESS("Deleted %d expired event(s)" % deleted))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.29 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log', '0007_alter_eventlog_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventlog',
+            name='level',
+            field=models.PositiveSmallIntegerField(choices=[(10, 'Debug'), (20, 'Info'), (30, 'Warning'), (40, 'Error')], default=20),
+        ),
+    ]
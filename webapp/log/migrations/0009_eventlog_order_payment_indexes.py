@@ -0,0 +1,35 @@
+# Generated by Django 4.2.29 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log', '0008_eventlog_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventlog',
+            name='order_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventlog',
+            name='payment_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='eventlog',
+            index=models.Index(fields=['user', 'created'], name='log_eventlo_user_id_b9fd7f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventlog',
+            index=models.Index(fields=['level', 'created'], name='log_eventlo_level_acc394_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventlog',
+            index=models.Index(fields=['created'], name='log_eventlo_created_9ba7e1_idx'),
+        ),
+    ]
@@ -1,11 +1,83 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+from logging import DEBUG, ERROR, INFO, WARNING
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 from accounts.models import VokoUser
 
+ARCHIVE_FIELDS = ("id", "created", "level", "event", "extra",
+                  "operator_id", "user_id", "order_id", "payment_id")
+
+
+class EventLogManager(models.Manager):
+    def expired(self):
+        """
+        Yield (policy, queryset of expired events) per retention policy in
+        EVENT_LOG_RETENTION. An event falls under the first policy it
+        matches.
+        """
+        now = timezone.now()
+        earlier = models.Q()
+        for policy in settings.EVENT_LOG_RETENTION:
+            matches = models.Q(**policy.get("filter", {}))
+            cutoff = now - timedelta(days=policy["days"])
+            yield policy, self.filter(matches, created__lt=cutoff) \
+                .exclude(earlier)
+            earlier |= matches
+
+    def prune(self, archive_dir=None, batch_size=1000):
+        """
+        Delete the expired events, after appending them to a gzipped JSON
+        lines file in :archive_dir: (if given).
+        Return the number of deleted events.
+        """
+        archive = None
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            filename = "eventlog-%s.jsonl.gz" % \
+                timezone.now().strftime("%Y%m%d%H%M%S")
+            archive = gzip.open(os.path.join(archive_dir, filename), "at")
+
+        deleted = 0
+        try:
+            for _, expired in self.expired():
+                deleted += self._delete_in_batches(expired, archive,
+                                                   batch_size)
+        finally:
+            if archive is not None:
+                archive.close()
+        return deleted
+
+    @staticmethod
+    def _delete_in_batches(queryset, archive, batch_size):
+        deleted = 0
+        while True:
+            rows = list(queryset.order_by("id")
+                        .values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                return deleted
+            if archive is not None:
+                for row in rows:
+                    archive.write(json.dumps(row, default=str) + "\n")
+            deleted += EventLog.objects.filter(
+                pk__in=[row["id"] for row in rows]).delete()[0]
+
 
 class EventLog(TimeStampedModel):
     class Meta:
         app_label = "log"
+        indexes = [
+            models.Index(fields=["user", "created"]),
+            models.Index(fields=["level", "created"]),
+            models.Index(fields=["created"]),
+        ]
+
+    objects = EventLogManager()
 
     id = models.AutoField(primary_key=True)
     operator = models.ForeignKey(VokoUser,
@@ -18,6 +90,15 @@ class EventLog(TimeStampedModel):
                              on_delete=models.SET_NULL)
     event = models.CharField(max_length=255)
     extra = models.TextField(blank=True, null=True)
+    level = models.PositiveSmallIntegerField(default=INFO, choices=(
+        (DEBUG, "Debug"),
+        (INFO, "Info"),
+        (WARNING, "Warning"),
+        (ERROR, "Error"),
+    ))
+    # Not foreign keys, so the log survives deleting the order or payment
+    order_id = models.IntegerField(null=True, blank=True, db_index=True)
+    payment_id = models.IntegerField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.event
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from logging import DEBUG, ERROR, INFO, WARNING
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from log import buffered_events, log_event
+from log.models import EventLog
+
+
+class LogEventTest(TestCase):
+    """Tests for log_event and buffered_events."""
+
+    def test_event_is_written_right_away_without_buffer(self):
+        """Test events are stored immediately outside buffered_events."""
+        log_event(event="Something happened")
+        self.assertEqual(EventLog.objects.get().event, "Something happened")
+
+    def test_level_follows_event_prefix(self):
+        """Test level defaults to the level of the event prefix."""
+        log_event(event="[DEBUG] details")
+        log_event(event="[WARN] careful")
+        log_event(event="[ERROR] broken")
+        log_event(event="Plain")
+        log_event(event="Explicit", level=WARNING)
+
+        self.assertEqual(
+            list(EventLog.objects.order_by("id").values_list("level", flat=True)),
+            [DEBUG, WARNING, ERROR, INFO, WARNING],
+        )
+
+    @override_settings(EVENT_LOG_LEVEL=INFO, EVENT_LOG_SAMPLE_RATE=0)
+    def test_events_below_level_are_dropped(self):
+        """Test events below EVENT_LOG_LEVEL are not stored."""
+        log_event(event="[DEBUG] details")
+        log_event(event="Plain")
+        self.assertEqual(list(EventLog.objects.values_list("event", flat=True)), ["Plain"])
+
+    @override_settings(EVENT_LOG_LEVEL=INFO, EVENT_LOG_SAMPLE_RATE=0.5)
+    def test_events_below_level_are_sampled(self):
+        """Test a fraction of the events below EVENT_LOG_LEVEL is kept."""
+        with patch("log.random.random", side_effect=[0.1, 0.9]):
+            log_event(event="[DEBUG] kept")
+            log_event(event="[DEBUG] dropped")
+        self.assertEqual(list(EventLog.objects.values_list("event", flat=True)), ["[DEBUG] kept"])
+
+    def test_buffered_events_are_written_in_one_query(self):
+        """Test buffered events are written together at the end."""
+        with CaptureQueriesContext(connection) as queries:
+            with buffered_events():
+                for i in range(5):
+                    log_event(event="Event %d" % i)
+                self.assertFalse(EventLog.objects.exists())
+
+        self.assertEqual(EventLog.objects.count(), 5)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("INSERT")]), 1)
+
+    def test_buffer_is_flushed_on_exception(self):
+        """Test buffered events are written when an exception is raised."""
+        with self.assertRaises(ValueError):
+            with buffered_events():
+                log_event(event="Before the crash")
+                raise ValueError()
+
+        self.assertEqual(EventLog.objects.get().event, "Before the crash")
+
+    @override_settings(EVENT_LOG_BUFFER_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        """Test the buffer is written when it reaches EVENT_LOG_BUFFER_SIZE."""
+        with buffered_events():
+            log_event(event="One")
+            log_event(event="Two")
+            self.assertEqual(EventLog.objects.count(), 2)
+            log_event(event="Three")
+            self.assertEqual(EventLog.objects.count(), 2)
+
+        self.assertEqual(EventLog.objects.count(), 3)
+
+    def test_buffered_events_as_decorator(self):
+        """Test buffered_events can decorate a function, like a cron job."""
+        @buffered_events()
+        def job():
+            log_event(event="From job")
+            return EventLog.objects.count()
+
+        self.assertEqual(job(), 0)
+        self.assertEqual(EventLog.objects.count(), 1)
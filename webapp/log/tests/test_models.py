@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from logging import DEBUG
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from accounts.tests.factories import VokoUserFactory
+from log import log_event
 from log.models import EventLog
 
 
@@ -108,3 +117,54 @@ class EventLogModelTest(TestCase):
         log.refresh_from_db()
 
         self.assertIsNone(log.user)
+
+
+class EventLogRetentionTest(TestCase):
+    """Tests for pruning and archiving expired events."""
+
+    def _event(self, days_old, **kwargs):
+        log = EventLog.objects.create(**kwargs)
+        EventLog.objects.filter(pk=log.pk).update(created=timezone.now() - timedelta(days=days_old))
+        return log
+
+    @override_settings(EVENT_LOG_RETENTION=(
+        {"filter": {"level__lte": DEBUG}, "days": 30},
+        {"filter": {"event__startswith": "Mail "}, "days": 90},
+        {"days": 365},
+    ))
+    def test_prune_applies_first_matching_policy(self):
+        """Test every event is expired by the first policy it matches."""
+        kept = [
+            self._event(10, event="[DEBUG] recent", level=DEBUG),
+            self._event(60, event="Mail sent: recent"),
+            self._event(200, event="Order paid"),
+        ]
+        self._event(40, event="[DEBUG] Mail old", level=DEBUG)
+        self._event(100, event="Mail sent: old")
+        self._event(400, event="Order paid long ago")
+
+        self.assertEqual(EventLog.objects.prune(), 3)
+        self.assertEqual(set(EventLog.objects.all()), set(kept))
+
+    @override_settings(EVENT_LOG_RETENTION=({"days": 30},))
+    def test_prune_archives_expired_events(self):
+        """Test expired events are written to a gzipped JSON lines file."""
+        old = self._event(40, event="Old event", order_id=12, payment_id=34)
+        self._event(10, event="Recent event")
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            EventLog.objects.prune(archive_dir=archive_dir, batch_size=1)
+            [filename] = os.listdir(archive_dir)
+            with gzip.open(os.path.join(archive_dir, filename), "rt") as archive:
+                rows = [json.loads(line) for line in archive]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["id"], old.id)
+        self.assertEqual(rows[0]["event"], "Old event")
+        self.assertEqual((rows[0]["order_id"], rows[0]["payment_id"]), (12, 34))
+        self.assertEqual(list(EventLog.objects.values_list("event", flat=True)), ["Recent event"])
+
+    def test_log_event_stores_order_and_payment(self):
+        """Test log_event stores the order and payment references."""
+        log_event(event="Payment succeeded", order_id=5, payment_id=7)
+        self.assertEqual(EventLog.objects.get(order_id=5).payment_id, 7)
@@ -5,8 +5,9 @@ from django.contrib import admin
 from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.urls import path
+from django.utils import timezone
 
-from mailing.models import MailTemplate, MailTemplateTag
+from mailing.models import MailTemplate, MailTemplateTag, OutgoingMail
 
 
 class ApplyTagsForm(forms.Form):
@@ -89,5 +90,21 @@ class MailTemplateAdmin(admin.ModelAdmin):
         })
 
 
+class OutgoingMailAdmin(admin.ModelAdmin):
+    list_display = ["id", "recipient", "subject", "status", "attempts", "created", "sent_at"]
+    list_filter = ["status"]
+    search_fields = ["recipient", "subject"]
+    ordering = ("-id",)
+    raw_id_fields = ["user"]
+    readonly_fields = ["attempts", "last_error", "sent_at"]
+    actions = ["requeue"]
+
+    @admin.action(description="Opnieuw versturen")
+    def requeue(self, request, queryset):
+        updated = queryset.update(status=OutgoingMail.STATUS_QUEUED, attempts=0, send_after=timezone.now())
+        self.message_user(request, f"{updated} mail(s) opnieuw in de wachtrij gezet.")
+
+
 admin.site.register(MailTemplate, MailTemplateAdmin)
 admin.site.register(MailTemplateTag)
+admin.site.register(OutgoingMail, OutgoingMailAdmin)
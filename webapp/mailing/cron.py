@@ -0,0 +1,22 @@
+from django_cron import CronJobBase, Schedule
+from log import buffered_events
+
+from mailing.models import OutgoingMail
+
+
+class SendQueuedMail(CronJobBase):
+    """
+    Sends the mails waiting in the outbox (see send_queued_mail command)
+
+    cron runs every minute
+    """
+
+    RUN_EVERY_MINS = 1
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "mailing.send_queued_mail"
+
+    @buffered_events()
+    def do(self):
+        sent, failed = OutgoingMail.objects.send_queued()
+        print("Sent %d mail(s), %d failed" % (sent, failed))
@@ -1,40 +1,85 @@
 from django.conf import settings
 import log
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.template import Template, Context
 import html2text
-from mailing.models import MailTemplate
+from mailing.models import MailTemplate, OutgoingMail
 from email.utils import formataddr
 
+# template id => (modified, (subject, html body, from email) Templates)
+_compiled_templates = {}
 
-def render_mail_template(template, **kwargs):
-    body_tpl = Template(template.html_body)
-    subject_tpl = Template(template.subject)
-    from_email_tpl = Template(template.from_email)
-    context = Context(kwargs)
 
-    rendered_subject = subject_tpl.render(context)
-    rendered_from_email = from_email_tpl.render(context)
-    rendered_html_body = body_tpl.render(context)
+def _compile(template):
+    """
+    Return compiled (subject, html body, from email) Templates of :template:,
+    cached per template id and modification time.
+    """
+    if template.pk is None:
+        return (Template(template.subject), Template(template.html_body), Template(template.from_email))
+
+    modified, compiled = _compiled_templates.get(template.pk, (None, None))
+    if compiled is None or modified != template.modified:
+        compiled = (Template(template.subject), Template(template.html_body), Template(template.from_email))
+        _compiled_templates[template.pk] = (template.modified, compiled)
+    return compiled
+
 
+def _html_to_text(html):
+    # HTML2Text keeps state between calls, so it can't be shared
     h2t = html2text.HTML2Text()
     h2t.body_width = 0
-    rendered_plain_body = h2t.handle(rendered_html_body)
+    return h2t.handle(html)
 
-    return (
-        rendered_subject,
-        rendered_html_body,
-        rendered_plain_body,
-        rendered_from_email
-    )
+
+def render_mail_template(template, **kwargs):
+    return next(render_mail_template_many(template, [kwargs]))
+
+
+def render_mail_template_many(template, contexts):
+    """
+    Render :template: once for every dict in :contexts:, compiling it only
+    once. Yields (subject, html body, plain body, from email) tuples.
+    """
+    subject_tpl, body_tpl, from_email_tpl = _compile(template)
+
+    last_html_body = last_plain_body = None
+    for kwargs in contexts:
+        context = Context(kwargs)
+
+        rendered_subject = subject_tpl.render(context)
+        rendered_from_email = from_email_tpl.render(context)
+        rendered_html_body = body_tpl.render(context)
+
+        # Mailings often don't differ per recipient
+        if rendered_html_body != last_html_body:
+            last_html_body = rendered_html_body
+            last_plain_body = _html_to_text(rendered_html_body)
+
+        yield (
+            rendered_subject,
+            rendered_html_body,
+            last_plain_body,
+            rendered_from_email
+        )
 
 
 def get_template_by_id(template_id):
+    key = MailTemplate.cache_key(template_id)
+    template = cache.get(key)
+    if template is not None:
+        return template
+
     try:
-        return MailTemplate.objects.get(id=template_id)
+        template = MailTemplate.objects.get(id=template_id)
     except MailTemplate.DoesNotExist:
         if settings.DEBUG:
             return MailTemplate(title="TEST")
+        return
+
+    cache.set(key, template, settings.MAIL_TEMPLATE_CACHE_TIMEOUT)
+    return template
 
 
 def mail_user(user, subject, html_body, plain_body, from_email):
@@ -45,4 +90,38 @@ def mail_user(user, subject, html_body, plain_body, from_email):
               from_email=from_email if from_email else default_from_email,
               recipient_list=[recipient],
               html_message=html_body)
-    log.log_event(user=user, event="Mail sent: %s" % subject, extra=html_body)
+    # The body is only worth storing when debugging
+    log.log_event(user=user, event="Mail sent: %s" % subject,
+                  extra=html_body if log.is_enabled_for(log.DEBUG) else None)
+
+
+def queue_mail(user, subject, html_body, plain_body, from_email):
+    """
+    Like mail_user, but puts the mail in the outbox instead of sending it
+    right away. Use this for bulk mailings; the send_queued_mail command
+    sends it.
+    """
+    mail = _outgoing_mail(user, subject, html_body, plain_body, from_email)
+    mail.save()
+    log.log_event(user=user, event="Mail queued: %s" % subject, extra="Outbox #%d" % mail.id)
+    return mail
+
+
+def queue_mails(mails):
+    """
+    Like queue_mail, for an iterable of (user, subject, html body, plain
+    body, from email) tuples, inserted in one query and without an event
+    per mail. Returns the list of OutgoingMails.
+    """
+    return OutgoingMail.objects.bulk_create([_outgoing_mail(*mail) for mail in mails])
+
+
+def _outgoing_mail(user, subject, html_body, plain_body, from_email):
+    return OutgoingMail(
+        user=user,
+        recipient=formataddr((user.get_full_name(), user.email)),
+        from_email=from_email if from_email else settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        html_body=html_body,
+        plain_body=plain_body,
+    )
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.models import OutgoingMail
+
+
+class Command(BaseCommand):
+    help = "Send the mails waiting in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MAIL_QUEUE_BATCH_SIZE,
+            help="Mails to send per SMTP connection",
+        )
+        parser.add_argument(
+            "--throttle",
+            type=float,
+            default=settings.MAIL_QUEUE_THROTTLE,
+            help="Seconds to wait between batches",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=settings.MAIL_QUEUE_MAX_ATTEMPTS,
+            help="Attempts before a mail is marked as failed",
+        )
+
+    def handle(self, *args, **options):
+        sent, failed = OutgoingMail.objects.send_queued(
+            batch_size=options["batch_size"],
+            max_attempts=options["max_attempts"],
+            throttle=options["throttle"],
+        )
+        self.stdout.write("Sent %d mail(s), %d failed" % (sent, failed))
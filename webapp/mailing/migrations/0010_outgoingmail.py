@@ -0,0 +1,42 @@
+# Generated by Django 4.2.29 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('mailing', '0009_mailtemplatetag_mailtemplate_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingMail',
+            fields=[
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('recipient', models.CharField(max_length=255)),
+                ('from_email', models.CharField(max_length=255)),
+                ('subject', models.CharField(max_length=255)),
+                ('html_body', models.TextField()),
+                ('plain_body', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'In wachtrij'), ('sending', 'Wordt verstuurd'), ('sent', 'Verstuurd'), ('failed', 'Mislukt')], default='queued', max_length=10)),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outgoing_mails', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Uitgaande mail',
+                'verbose_name_plural': 'Uitgaande mails',
+                'indexes': [models.Index(fields=['status', 'send_after'], name='mailing_out_status_d94c68_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,11 @@
-from django.db import models
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import models, transaction
+from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 from tinymce.models import HTMLField
 
@@ -21,3 +28,173 @@ class MailTemplate(TimeStampedModel):
 
     def __str__(self):
         return "%s (%s)" % (self.title, self.subject)
+
+    @staticmethod
+    def cache_key(template_id):
+        """ Key of the cached template, see mailing.helpers.get_template_by_id """
+        return "mailing.template.%s" % template_id
+
+    def save(self, **kwargs):
+        super(MailTemplate, self).save(**kwargs)
+        cache.delete(self.cache_key(self.pk))
+
+    def delete(self, *args, **kwargs):
+        cache.delete(self.cache_key(self.pk))
+        return super(MailTemplate, self).delete(*args, **kwargs)
+
+
+class OutgoingMailManager(models.Manager):
+    def due(self):
+        return self.filter(status=OutgoingMail.STATUS_QUEUED, send_after__lte=timezone.now())
+
+    def claim(self, batch_size):
+        """
+        Mark up to :batch_size: due mails as being sent and return them,
+        skipping mails claimed by another worker.
+        """
+        with transaction.atomic():
+            due = self.due().select_for_update(skip_locked=True).order_by("id")
+            ids = list(due.values_list("id", flat=True)[:batch_size])
+            self.filter(id__in=ids).update(status=OutgoingMail.STATUS_SENDING, modified=timezone.now())
+        return list(self.filter(id__in=ids).order_by("id"))
+
+    def requeue_stale(self, older_than=timedelta(hours=1)):
+        """
+        Requeue mails left in 'sending' by a worker that died
+        """
+        return self.filter(status=OutgoingMail.STATUS_SENDING, modified__lt=timezone.now() - older_than).update(
+            status=OutgoingMail.STATUS_QUEUED
+        )
+
+    def send_queued(self, batch_size=None, max_attempts=None, throttle=None):
+        """
+        Send all due mails, in batches that each reuse one SMTP connection.
+        Waits :throttle: seconds between batches. Failed mails are retried
+        later, until :max_attempts: is reached.
+        Returns (number sent, number failed).
+        """
+        batch_size = batch_size or settings.MAIL_QUEUE_BATCH_SIZE
+        max_attempts = max_attempts or settings.MAIL_QUEUE_MAX_ATTEMPTS
+        throttle = settings.MAIL_QUEUE_THROTTLE if throttle is None else throttle
+
+        self.requeue_stale()
+        sent = failed = 0
+        while True:
+            batch = self.claim(batch_size)
+            if not batch:
+                break
+
+            batch_sent, batch_failed = self._send_batch(batch, max_attempts)
+            sent += batch_sent
+            failed += batch_failed
+            if not batch_sent:
+                # Probably the mail server is down, try again next run
+                break
+
+            if len(batch) == batch_size:
+                time.sleep(throttle)
+        return sent, failed
+
+    @staticmethod
+    def _send_batch(batch, max_attempts):
+        """
+        Send :batch: over one SMTP connection, recording the result per mail.
+        Returns (number sent, number failed).
+        """
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            for mail in batch:
+                mail.mark_failed(e, max_attempts)
+            return 0, len(batch)
+
+        sent = failed = 0
+        try:
+            for mail in batch:
+                try:
+                    connection.send_messages([mail.as_message(connection)])
+                except Exception as e:
+                    mail.mark_failed(e, max_attempts)
+                    failed += 1
+                else:
+                    mail.mark_sent()
+                    sent += 1
+        finally:
+            connection.close()
+        return sent, failed
+
+
+class OutgoingMail(TimeStampedModel):
+    """
+    Mail waiting in the outbox, sent by the send_queued_mail command.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUSES = (
+        (STATUS_QUEUED, "In wachtrij"),
+        (STATUS_SENDING, "Wordt verstuurd"),
+        (STATUS_SENT, "Verstuurd"),
+        (STATUS_FAILED, "Mislukt"),
+    )
+
+    class Meta:
+        verbose_name = "Uitgaande mail"
+        verbose_name_plural = "Uitgaande mails"
+        indexes = [models.Index(fields=["status", "send_after"])]
+
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, related_name="outgoing_mails", on_delete=models.SET_NULL
+    )
+    recipient = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    html_body = models.TextField()
+    plain_body = models.TextField()
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_QUEUED)
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutgoingMailManager()
+
+    def __str__(self):
+        return "%s: %s (%s)" % (self.recipient, self.subject, self.status)
+
+    def as_message(self, connection=None):
+        message = EmailMultiAlternatives(
+            subject=self.subject,
+            body=self.plain_body,
+            from_email=self.from_email,
+            to=[self.recipient],
+            connection=connection,
+        )
+        message.attach_alternative(self.html_body, "text/html")
+        return message
+
+    def mark_sent(self):
+        self.status = self.STATUS_SENT
+        self.sent_at = timezone.now()
+        self.attempts += 1
+        self.last_error = ""
+        self.save(update_fields=["status", "sent_at", "attempts", "last_error", "modified"])
+
+    def mark_failed(self, error, max_attempts):
+        """
+        Record :error: and retry later with exponential backoff, or give up
+        after :max_attempts:
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = self.STATUS_FAILED
+        else:
+            self.status = self.STATUS_QUEUED
+            self.send_after = timezone.now() + timedelta(minutes=2**self.attempts)
+        self.save(update_fields=["status", "send_after", "attempts", "last_error", "modified"])
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 from unittest import mock
 
+from django.template import Template
 from django.test import TestCase, override_settings
 from django.core import mail
 
-from mailing.helpers import render_mail_template, get_template_by_id, mail_user
+from mailing.helpers import render_mail_template, render_mail_template_many, get_template_by_id, mail_user
 from mailing.models import MailTemplate
 from accounts.tests.factories import VokoUserFactory
 
@@ -72,6 +73,40 @@ class RenderMailTemplateTest(TestCase):
         self.assertEqual(from_email, "user@example.com")
 
 
+class RenderMailTemplateManyTest(TestCase):
+    """Tests for the render_mail_template_many function."""
+
+    def setUp(self):
+        self.template = MailTemplate.objects.create(
+            title="Test", subject="Hi {{ user.first_name }}", html_body="<p>Hello <b>{{ user.first_name }}</b></p>"
+        )
+
+    def test_renders_every_context(self):
+        """Test one rendered tuple is returned per context."""
+        users = [VokoUserFactory.create(first_name=name) for name in ("Jan", "Piet")]
+
+        rendered = list(render_mail_template_many(self.template, ({"user": user} for user in users)))
+
+        self.assertEqual([r[0] for r in rendered], ["Hi Jan", "Hi Piet"])
+        self.assertEqual(rendered[1][2].strip(), "Hello **Piet**")
+        self.assertEqual(rendered[0], render_mail_template(self.template, user=users[0]))
+
+    def test_template_is_compiled_once(self):
+        """Test compiled templates are reused until the template is modified."""
+        user = VokoUserFactory.create()
+
+        with mock.patch("mailing.helpers.Template", wraps=Template) as template_cls:
+            list(render_mail_template_many(self.template, [{"user": user}] * 3))
+            render_mail_template(self.template, user=user)
+            self.assertEqual(template_cls.call_count, 3)
+
+            self.template.html_body = "<p>Changed</p>"
+            self.template.save()
+            subject, html, plain, from_email = render_mail_template(self.template, user=user)
+            self.assertEqual(template_cls.call_count, 6)
+            self.assertEqual(html, "<p>Changed</p>")
+
+
 class GetTemplateByIdTest(TestCase):
     """Tests for the get_template_by_id function."""
 
@@ -83,6 +118,18 @@ class GetTemplateByIdTest(TestCase):
 
         self.assertEqual(result, template)
 
+    def test_template_is_cached_until_saved(self):
+        """Test repeated lookups don't query, until the template changes."""
+        template = MailTemplate.objects.create(title="Test Template", html_body="<p>Test</p>")
+        get_template_by_id(template.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_template_by_id(template.id), template)
+
+        template.title = "Changed"
+        template.save()
+        self.assertEqual(get_template_by_id(template.id).title, "Changed")
+
     @override_settings(DEBUG=True)
     def test_returns_placeholder_in_debug(self):
         """Test returns placeholder template in DEBUG mode when not found."""
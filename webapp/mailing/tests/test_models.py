@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
 from django.test import TestCase
+from django.utils import timezone
 
-from mailing.models import MailTemplate, MailTemplateTag
+from accounts.tests.factories import VokoUserFactory
+from mailing.helpers import queue_mail
+from mailing.models import MailTemplate, MailTemplateTag, OutgoingMail
 
 
 class MailTemplateModelTest(TestCase):
@@ -62,3 +69,68 @@ class MailTemplateModelTest(TestCase):
     def test_tag_str(self):
         tag = MailTemplateTag.objects.create(name="bestel")
         self.assertEqual(str(tag), "bestel")
+
+
+class OutgoingMailTest(TestCase):
+    """Tests for the outbox."""
+
+    def setUp(self):
+        self.user = VokoUserFactory.create(first_name="Jan", last_name="Janssen", email="jan@example.com")
+
+    def _queue(self, subject="Test Subject"):
+        return queue_mail(self.user, subject, "<p>Test</p>", "Test", "")
+
+    def test_queue_mail_does_not_send(self):
+        """Test queue_mail only stores the mail."""
+        queued = self._queue()
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(queued.status, OutgoingMail.STATUS_QUEUED)
+        self.assertIn("jan@example.com", queued.recipient)
+
+    def test_send_queued_sends_in_batches_over_one_connection_each(self):
+        """Test all due mails are sent, one connection per batch."""
+        for i in range(5):
+            self._queue("Mail %d" % i)
+
+        with mock.patch("mailing.models.get_connection", wraps=mail.get_connection) as get_connection:
+            sent, failed = OutgoingMail.objects.send_queued(batch_size=2, throttle=0)
+
+        self.assertEqual((sent, failed), (5, 0))
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual([m.subject for m in mail.outbox], ["Mail %d" % i for i in range(5)])
+        self.assertFalse(OutgoingMail.objects.exclude(status=OutgoingMail.STATUS_SENT).exists())
+        self.assertIsNotNone(OutgoingMail.objects.first().sent_at)
+
+    def test_mails_scheduled_for_later_are_not_sent(self):
+        """Test mails waiting for a retry are skipped."""
+        queued = self._queue()
+        OutgoingMail.objects.filter(pk=queued.pk).update(send_after=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual(OutgoingMail.objects.send_queued(throttle=0), (0, 0))
+
+    def test_failed_mail_is_retried_and_eventually_marked_failed(self):
+        """Test errors are recorded and retried until max_attempts."""
+        queued = self._queue()
+
+        with mock.patch.object(OutgoingMail, "as_message", side_effect=RuntimeError("SMTP error")):
+            self.assertEqual(OutgoingMail.objects.send_queued(max_attempts=2, throttle=0), (0, 1))
+            queued.refresh_from_db()
+            self.assertEqual(queued.status, OutgoingMail.STATUS_QUEUED)
+            self.assertEqual(queued.attempts, 1)
+            self.assertEqual(queued.last_error, "SMTP error")
+
+            OutgoingMail.objects.filter(pk=queued.pk).update(send_after=timezone.now())
+            OutgoingMail.objects.send_queued(max_attempts=2, throttle=0)
+            queued.refresh_from_db()
+            self.assertEqual(queued.status, OutgoingMail.STATUS_FAILED)
+            self.assertEqual(queued.attempts, 2)
+
+    def test_stale_sending_mail_is_requeued(self):
+        """Test mails claimed by a worker that died are sent again."""
+        queued = self._queue()
+        OutgoingMail.objects.filter(pk=queued.pk).update(
+            status=OutgoingMail.STATUS_SENDING, modified=timezone.now() - timedelta(hours=2)
+        )
+
+        self.assertEqual(OutgoingMail.objects.send_queued(throttle=0), (1, 0))
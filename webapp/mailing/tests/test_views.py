@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
-from unittest import mock
-
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from mailing.models import MailTemplate
+from log.models import EventLog
+from mailing.models import MailTemplate, OutgoingMail
 from accounts.tests.factories import VokoUserFactory
 from vokou.testing import VokoTestCase
 
@@ -127,20 +129,38 @@ class SendMailViewTest(VokoTestCase):
         response = self.client.get(reverse("admin_send_mail", kwargs={"pk": self.template.pk}))
         self.assertEqual(response.status_code, 302)
 
-    @mock.patch("mailing.views.mail_user")
-    @mock.patch("mailing.views.log_event")
-    def test_sends_mail_to_users(self, mock_log, mock_mail_user):
-        """Test sends mail to users in session."""
+    def test_sends_mail_to_users(self):
+        """Test queues one mail per user in session and logs one event."""
         self.login()
         self.user.is_staff = True
         self.user.save()
 
-        recipient = VokoUserFactory.create()
+        recipients = VokoUserFactory.create_batch(3)
 
-        self._setup_session_with_user_ids([recipient.pk])
+        self._setup_session_with_user_ids([recipient.pk for recipient in recipients])
 
         response = self.client.get(reverse("admin_send_mail", kwargs={"pk": self.template.pk}))
 
         # Should redirect after sending
         self.assertEqual(response.status_code, 302)
-        mock_mail_user.assert_called_once()
+        self.assertEqual(sorted(OutgoingMail.objects.values_list("user", flat=True)),
+                         sorted(recipient.pk for recipient in recipients))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(list(EventLog.objects.values_list("event", flat=True)),
+                         ["Mailing 'Test Template' in de wachtrij gezet voor 3 leden"])
+
+    def test_number_of_queries_does_not_depend_on_number_of_users(self):
+        """Test the mails are queued in bulk."""
+        self.login()
+        self.user.is_staff = True
+        self.user.save()
+        url = reverse("admin_send_mail", kwargs={"pk": self.template.pk})
+
+        def send(count):
+            self._setup_session_with_user_ids([user.pk for user in VokoUserFactory.create_batch(count)])
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            return len(queries)
+
+        send(1)  # warm up the caches
+        self.assertEqual(send(2), send(10))
@@ -4,7 +4,7 @@ from django.http import HttpResponseRedirect
 from django.views.generic import TemplateView, ListView, View
 from accounts.models import VokoUser, SleepingVokoUser
 from log import log_event
-from mailing.helpers import render_mail_template, mail_user
+from mailing.helpers import render_mail_template, render_mail_template_many, queue_mails
 from mailing.models import MailTemplate
 
 
@@ -52,25 +52,17 @@ class SendMailView(StaffuserRequiredMixin, View):
 
         self._send_mails()
 
-        messages.success(request, "De mailing is verstuurd!")
+        messages.success(request, "De mailing wordt op de achtergrond verstuurd!")
         return HttpResponseRedirect("/")
 
     def _send_mails(self):
-        for user in self.users:
-            (
-                subject,
-                html_message,
-                plain_message,
-                from_email
-            ) = render_mail_template(
-                self.template,
-                user=user,
-                order_round=self.current_order_round
-            )
-
-            mail_user(user, subject, html_message, plain_message, from_email)
-
-            log_event(operator=self.request.user,
-                      user=user,
-                      event="Mail verstuurd met onderwerp '%s'" % subject,
-                      extra=html_message)
+        rendered = render_mail_template_many(
+            self.template,
+            ({"user": user, "order_round": self.current_order_round}
+             for user in self.users)
+        )
+        mails = queue_mails((user,) + tuple(mail) for user, mail in zip(self.users, rendered))
+
+        log_event(operator=self.request.user,
+                  event="Mailing '%s' in de wachtrij gezet voor %d leden" % (self.template.title, len(mails)),
+                  extra="Outbox #%d t/m #%d" % (mails[0].id, mails[-1].id) if mails else None)
@@ -1,11 +1,14 @@
-import csv
 import sys
 
 from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.db import OperationalError, ProgrammingError
-from django.http import HttpResponse
-from finance.models import Balance
-from vokou.admin import DeleteDisabledMixin
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.template.response import TemplateResponse
+from finance.models import Balance, Payment
+from vokou.admin import DeleteDisabledMixin, streaming_csv_response
+from vokou.utils import CSV_EXPORT_CHUNK_SIZE
 
 from ordering.core import create_orderround_ahead
 
@@ -21,11 +24,22 @@ from .models import (
     ProductStock,
     ProductUnit,
     Supplier,
+    _cents,
+    _from_cents,
 )
 
 
 class OrderProductInline(admin.TabularInline):
     model = OrderProduct
+    fields = ("product", "amount", "retail_price", "base_price")
+    # A select with every product ever made the change page time out
+    raw_id_fields = ("product",)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super(OrderProductInline, self).get_queryset(request).select_related(
+            "product__supplier", "product__order_round"
+        )
 
 
 def create_credit_for_order(modeladmin, request, queryset):
@@ -63,6 +77,26 @@ def dutch_decimal(value):
     return str(value).replace(".", ",")
 
 
+def _financial_export_rows(orders):
+    dd = dutch_decimal
+    for order in orders.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+        # Why multiple payments? Because of (historical) corner case with
+        # double payment.
+        actually_paid = _from_cents(order.paid_cents)
+        yield [
+            order.id,
+            "{0} ({1})".format(order.user, order.user_id),
+            order.modified.date(),
+            order.order_round_id,
+            dd(order.products_total),
+            dd(order.member_fee),
+            dd(order.order_round.transaction_costs),
+            dd(actually_paid),
+            dd(order.debit.amount - actually_paid),
+            dd(order.debit.amount),
+        ]
+
+
 def export_orders_for_financial_admin(modeladmin, request, queryset):
     field_names = [
         "Bestelling ID",
@@ -77,34 +111,20 @@ def export_orders_for_financial_admin(modeladmin, request, queryset):
         "Totaalbedrag",
     ]
 
-    response = HttpResponse(content_type="text/csv; charset=utf-8")
-    response["Content-Disposition"] = "attachment; filename=orders_export.csv"
-
-    writer = csv.writer(response)
-    writer.writerow(field_names)
-
-    for order in queryset.filter(paid=True):
-        # Why multiple payments? Because of (historical) corner case with
-        # double payment.
-        payments = order.payments.filter(succeeded=True)
-        actually_paid = sum([p.amount for p in payments])
-
-        dd = dutch_decimal
-        row = [
-            order.id,
-            "{0} ({1})".format(order.user, order.user_id),
-            order.modified.date(),
-            order.order_round_id,
-            dd(sum([odp.total_retail_price for odp in order.orderproducts.all()])),
-            dd(order.member_fee),
-            dd(order.order_round.transaction_costs),
-            dd(actually_paid).replace(".", ","),
-            dd(order.debit.amount - actually_paid),
-            dd(order.debit.amount),
-        ]
-        writer.writerow(row)
-
-    return response
+    paid_cents = (
+        Payment.objects.filter(order=OuterRef("pk"), succeeded=True)
+        .order_by()
+        .values("order")
+        .annotate(total=Sum(_cents("amount")))
+        .values("total")
+    )
+    orders = (
+        queryset.filter(paid=True)
+        .with_totals()
+        .select_related("user", "debit")
+        .annotate(paid_cents=Coalesce(Subquery(paid_cents), 0))
+    )
+    return streaming_csv_response("orders_export.csv", _financial_export_rows(orders), header=field_names)
 
 
 export_orders_for_financial_admin.short_description = "Exporteer voor financiële admin"
@@ -113,10 +133,46 @@ export_orders_for_financial_admin.short_description = "Exporteer voor financiël
 class OrderAdmin(DeleteDisabledMixin, admin.ModelAdmin):
     list_display = ["id", "modified", "order_round", "user", "finalized", "paid", "total_price"]
     ordering = ("-id",)
-    # inlines = [OrderProductInline]  ## causes timeout
+    inlines = [OrderProductInline]
     list_filter = ("paid", "finalized", "order_round")
+    raw_id_fields = ("user", "debit")
     actions = (create_credit_for_order, export_orders_for_financial_admin)
 
+    def get_queryset(self, request):
+        return super(OrderAdmin, self).get_queryset(request).with_totals().select_related("user")
+
+
+def create_corrections_for_products(modeladmin, request, queryset):
+    """
+    Admin action to register products as not delivered at all.
+    Like delete_selected, it first shows the orders that would be
+    credited and only creates the corrections once that is confirmed.
+    """
+    if request.POST.get("post"):
+        corrections = queryset.create_corrections()
+        messages.success(request, "%d correcties aangemaakt." % len(corrections))
+        return None
+
+    order_products = (
+        queryset.uncorrected_order_products()
+        .select_related("order__user", "product__supplier")
+        .order_by("product__name", "order_id")
+    )
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        "title": "Correcties bevestigen",
+        "opts": modeladmin.model._meta,
+        "queryset": queryset,
+        "order_products": order_products,
+        "total": order_products.totals()["revenue"],
+        "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+    }
+    request.current_app = modeladmin.admin_site.name
+    return TemplateResponse(request, "ordering/admin/confirm_corrections.html", context)
+
+
+create_corrections_for_products.short_description = "Niet geleverd: maak correcties voor alle bestellingen"
+
 
 # Generate actions for categories
 def generate_action(category):
@@ -164,7 +220,7 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     ordering = ("-id",)
     list_filter = ("order_round", "supplier", "category", "new")
-    actions = prod_cat_actions
+    actions = [create_corrections_for_products] + prod_cat_actions
     list_per_page = 500
 
 
@@ -1,28 +1,32 @@
 # -*- coding: utf-8 -*-
 import json
-from decimal import Decimal, ROUND_DOWN
+from decimal import Decimal
 
-import openpyxl
 import re
 from collections import defaultdict
-from tempfile import NamedTemporaryFile
+from itertools import groupby
 from braces.views import GroupRequiredMixin
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
 from django.urls import reverse
 from django.db import IntegrityError
-from django.db.models import Q
+from django.db.models import Max, Prefetch, Q
 from django.db.models.aggregates import Sum, Count
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseBadRequest, \
+    HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect
 from django.utils.datastructures import MultiValueDictKeyError
+from django.utils.functional import cached_property
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import ListView, DetailView, TemplateView, View, \
     FormView
-import os
 import sys
 from accounts.models import VokoUser
-from .core import get_current_order_round
+from .core import correction_json_cache_key, get_correction_report, \
+    get_current_order_round
 from .forms import UploadProductListForm
+from .product_import import import_product_list
 from .models import OrderProduct, Order, OrderRound, Supplier, \
     OrderProductCorrection, Product, DraftProduct, \
     ProductCategory, ProductStock, ProductUnit
@@ -118,52 +122,93 @@ class OrderAdminUserOrderProductsPerOrderRound(GroupRequiredMixin, ListView):
 
 
 class OrderAdminCorrectionJson(GroupRequiredMixin, View):
+    """
+    Members, their paid orders and the uncorrected order products of a round,
+    for the dropdowns of the correction page.
+
+    The JSON is cached per round until a correction is made or a paid order
+    changes. Its version (the last correction id at the time it was built)
+    is sent in the X-Correction-Version header; ?since=<version> returns just
+    the order products corrected after that, so the page can update its
+    dropdowns without fetching everything again.
+    """
     group_required = ('Uitdeelcoordinatoren', 'Financien', 'Admin')
 
     def get(self, request, *args, **kwargs):
-        return HttpResponse(
-            self.orders_json(),
-            content_type="application/json"
-        )
-
-    def orders_json(self):
         order_round = OrderRound.objects.get(pk=self.kwargs.get('pk'))
-        data = []
-        users = set([o.user for o in order_round.orders.all()])
-        users = sorted(users, key=lambda x: x.first_name)
-
-        for user in users:
-            orders = []
-            for order in user.orders.filter(order_round=order_round,
-                                            paid=True).select_related():
-                order_products = []
-                for order_product in order.orderproducts.filter(
-                        correction__isnull=True):
-                    order_products.append({
-                        "id": order_product.id,
-                        "name": "%s (%s)" % (
-                            order_product.product.name,
-                            order_product.product.supplier.name
-                        ),
-                        "amount": order_product.amount
-                    })
-
-                if not order_products:
-                    continue
 
-                orders.append({
-                    "id": order.id,
-                    "total_price": float(order.total_price),
-                    "order_products": order_products
-                })
+        since = request.GET.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return HttpResponseBadRequest()
+            return JsonResponse(self.corrected_since(order_round, since))
+
+        key = correction_json_cache_key(order_round.pk)
+        payload = cache.get(key)
+        if payload is None:
+            # Determine the version first: corrections made while building
+            # are then also reported as changes since this version
+            version = self.corrections(order_round).aggregate(
+                version=Max('id'))['version'] or 0
+            payload = {"version": version,
+                       "json": self.orders_json(order_round)}
+            cache.set(key, payload, settings.CORRECTION_CACHE_TIMEOUT)
+
+        response = HttpResponse(payload["json"],
+                                content_type="application/json")
+        response['X-Correction-Version'] = payload["version"]
+        return response
+
+    @staticmethod
+    def corrections(order_round):
+        return OrderProductCorrection.objects.filter(
+            order_product__order__order_round=order_round)
+
+    def corrected_since(self, order_round, since):
+        corrected = list(self.corrections(order_round).filter(
+            id__gt=since).order_by('id').values_list('id', 'order_product_id'))
+        return {
+            "version": corrected[-1][0] if corrected else since,
+            "corrected": [order_product_id for _, order_product_id in corrected],
+        }
+
+    def orders_json(self, order_round):
+        orders = Order.objects.filter(
+            order_round=order_round, paid=True
+        ).with_totals().select_related(
+            'user'
+        ).prefetch_related(
+            Prefetch('orderproducts',
+                     queryset=OrderProduct.objects.filter(
+                         correction__isnull=True
+                     ).select_related('product__supplier').order_by('id'),
+                     to_attr='uncorrected_orderproducts')
+        ).order_by('user__first_name', 'user_id', 'id')
 
-            if not orders:
+        data = []
+        for user, user_orders in groupby(orders, key=lambda o: o.user):
+            user_orders = [{
+                "id": order.id,
+                "total_price": float(order.total_price),
+                "order_products": [{
+                    "id": order_product.id,
+                    "name": "%s (%s)" % (
+                        order_product.product.name,
+                        order_product.product.supplier.name
+                    ),
+                    "amount": order_product.amount
+                } for order_product in order.uncorrected_orderproducts]
+            } for order in user_orders if order.uncorrected_orderproducts]
+
+            if not user_orders:
                 continue
 
             data.append({
                 "name": user.get_full_name(),
                 "id": user.id,
-                "orders": orders
+                "orders": user_orders
             })
 
         return json.dumps(data)
@@ -185,98 +230,50 @@ class OrderAdminCorrection(GroupRequiredMixin, TemplateView):
                                                  order_id=order_id,
                                                  order__user_id=user_id)
 
-        OrderProductCorrection.objects.create(
+        correction = OrderProductCorrection.objects.create(
             order_product=order_product,
             supplied_percentage=supplied_percentage,
             notes=notes,
             charge_supplier=charge_supplier
         )
 
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            # The correction page updates itself, see
+            # OrderAdminCorrectionJson
+            return JsonResponse({
+                "id": correction.id,
+                "order_product_id": order_product.id,
+                "credit": str(correction.credit.amount),
+            })
+
         messages.add_message(request, messages.SUCCESS,
                              "De correctie is succesvol aangemaakt.")
 
         return redirect(
             reverse('orderadmin_correction', args=args, kwargs=kwargs))
 
-    def supplier_corrections(self):
-        order_round = OrderRound.objects.get(pk=self.kwargs.get('pk'))
-        """
-        corrections[supplier][product]=
-                  {  'corrections'    : corrections[],
-                     'amount'         : int,
-                     'total_supplied' : precentage
-                  }
-        """
-        corr_sppl = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-
-        # get all corrections for suppliers in this order round
-        corrections = OrderProductCorrection.objects.filter(
-            order_product__order__order_round=order_round).filter(
-            charge_supplier=True).order_by(
-            "order_product__product__supplier", "order_product__order__user")
+    @cached_property
+    def order_round(self):
+        return OrderRound.objects.get(pk=self.kwargs.get('pk'))
 
-        # build corrections per supplier per product
-        for correction in corrections:
-            product = correction.order_product.product
-            supplier = product.supplier
-            corr_sppl[supplier][product]['corrections'].append(correction)
+    @cached_property
+    def report(self):
+        return get_correction_report(self.order_round)
 
+    def supplier_corrections(self):
         """
-        now we have all corrections per supplier per product,
-        we can calculate totals
+        [{name, refund, products: [{name, amount, perc_supplied,
+          supplier_refund, member_refund, corrections: [...]}]}]
         """
-        for s, prd in corr_sppl.items():
-            for p, tpp in prd.items():
-                # calculate totals per product
-                tpp['amount'] = self.calc_amount(tpp['corrections'])
-                tpp['perc_supplied'] = self.calc_supplied(tpp['corrections'])
-                # and convert defaultdict to normal dict for use in template
-                corr_sppl[s][p] = dict(tpp)
-
-        # convert defaultdict to dict for use in template
-        for s, op in corr_sppl.items():
-            corr_sppl[s] = dict(op)
-
-        return dict(corr_sppl)
+        return self.report["suppliers"]
 
     def voko_corrections(self):
-        order_round = OrderRound.objects.get(pk=self.kwargs.get('pk'))
-        # get all corrections for VOKO in this order round
-        return OrderProductCorrection.objects.filter(
-            order_product__order__order_round=order_round).filter(
-                charge_supplier=False).order_by(
-                "order_product__order__user")
-
-    def calc_amount(self, product_corrections):
-        """
-        helper function to calculate total amount ordered
-        """
-        total_ordered = 0
-        for correction in product_corrections:
-            total_ordered += correction.order_product.amount
-        return total_ordered
-
-    def calc_supplied(self, supplier_corrections):
-        """
-        helper function to calculate total percentage suppplied
-        """
-        total_suppl = 0
-        total_ordered = 0
-        for corr in supplier_corrections:
-            total_ordered += corr.order_product.amount
-            total_suppl += corr.order_product.amount * corr.supplied_percentage
-
-        corr_perc = Decimal(total_suppl / total_ordered).quantize(
-            Decimal('.01'), rounding=ROUND_DOWN)
-        return corr_perc
+        return self.report["voko"]
 
     def products(self):
         # TODO also return stock products
-        order_round = OrderRound.objects.get(pk=self.kwargs.get('pk'))
-        return order_round.products.all().order_by('name')
-
-    def order_round(self):
-        return OrderRound.objects.get(pk=self.kwargs.get('pk'))
+        return self.order_round.products.select_related(
+            'supplier', 'unit').order_by('name')
 
 
 class OrderAccounts(GroupRequiredMixin, DetailView):
@@ -303,24 +300,7 @@ class OrderAdminMassCorrection(GroupRequiredMixin, View):
 
 
 class ProductAdminMixin(GroupRequiredMixin):
-    def _convert_price(self, price):
-        if type(price) is str:
-            price = price.lstrip('\\u20ac')  # Strip off euro sign
-        else:
-            price = str(price)
-        price = price.strip()
-        # price = price.replace(".", ",")
-        return price
-
-    def _convert_number(self, value):
-        if isinstance(value, (int, float)):
-            return value
-        str_value = str(value or "").strip()  # Treat whitespace, empty string and None as None
-        if len(str_value) == 0:
-            return None
-        return float(str_value.replace(",", "."))
-
-    @property
+    @cached_property
     def supplier(self):
         return Supplier.objects.get(id=self.kwargs['supplier'])
 
@@ -344,68 +324,27 @@ class UploadProductList(FormView, ProductAdminMixin):
 
     def form_valid(self, form):
         try:
-            self.create_draft_products_from_spreadsheet(
-                self.request.FILES['product_list'])
+            report = import_product_list(
+                self.request.FILES['product_list'],
+                self.supplier, self.current_order_round)
         except Exception as e:
             messages.add_message(
                 self.request, messages.ERROR,
                 "Bestand kon niet worden ingelezen. Error: %s" % e)
+        else:
+            self._add_report_messages(report)
 
         return redirect(reverse('create_draft_products', kwargs=self.kwargs))
 
-    def create_draft_products_from_spreadsheet(self, file_handler):
-        f = NamedTemporaryFile(delete=False, suffix="." + file_handler.name.split(".")[-1])
-        f.write(file_handler.read())
-        f.close()
-
-        workbook = None
-
-        try:
-            workbook = openpyxl.load_workbook(f.name, read_only=True, data_only=True)
-            sheet = workbook.active
-            PRODUCT_NAME, DESCRIPTION, UNIT, PRICE, MAX, CATEGORY = list(
-                range(0, 6))
-
-            self._delete_current_drafts()
-
-            for idx, row in enumerate(sheet.rows):
-                name, description, unit, price, maximum, category = (
-                    row[PRODUCT_NAME].value,
-                    row[DESCRIPTION].value,
-                    row[UNIT].value,
-                    row[PRICE].value,
-                    row[MAX].value,
-                    row[CATEGORY].value
-                )
-
-                if not name or idx == 0:
-                    continue  # skips header and empty rows
-
-                self._create_draft_product(
-                    {'name': name,
-                     'description': description if description else "",
-                     'unit': unit,
-                     'base_price': self._convert_price(price),
-                     'maximum_total_order': self._convert_number(maximum),
-                     'category': category}
-                )
-        finally:
-            if workbook is not None:
-                workbook.close()
-            if os.path.exists(f.name):
-                os.remove(f.name)
-
-    def _create_draft_product(self, data):
-        return DraftProduct.objects.create(
-            supplier=self.supplier,
-            order_round=self.current_order_round,
-            data=data
-        )
-
-    def _delete_current_drafts(self):
-        DraftProduct.objects.filter(
-            order_round=self.current_order_round,
-            supplier=self.supplier).delete()
+    def _add_report_messages(self, report):
+        messages.add_message(self.request, messages.SUCCESS, str(report))
+        errors = report.errors()
+        if errors:
+            messages.add_message(
+                self.request, messages.WARNING,
+                "Ongeldige rijen: %s%s" % (
+                    "; ".join("rij %s (%s): %s" % error for error in errors),
+                    " en meer" if report.invalid > len(errors) else ""))
 
 
 class CreateDraftProducts(TemplateView, ProductAdminMixin):
@@ -415,11 +354,15 @@ class CreateDraftProducts(TemplateView, ProductAdminMixin):
         return UploadProductListForm()
 
     def draft_products(self):
-        for dp in DraftProduct.objects.filter(
-                order_round=self.current_order_round,
-                supplier=self.supplier).order_by('is_valid', 'id'):
-            dp.validate()
-            yield dp
+        draft_products = list(DraftProduct.objects.filter(
+            order_round=self.current_order_round,
+            supplier=self.supplier).order_by('id'))
+        # Drafts are validated when they're created; this only catches
+        # drafts that weren't validated yet
+        DraftProduct.objects.validate_many(
+            [dp for dp in draft_products if dp.is_valid is None])
+        # Invalid drafts first
+        return sorted(draft_products, key=lambda dp: dp.is_valid)
 
     def category_choices(self):
         return [pc.name for pc in ProductCategory.objects.all()]
@@ -462,12 +405,9 @@ class CreateDraftProducts(TemplateView, ProductAdminMixin):
             yield tmp[index]
 
     def create_draft_products(self):
-        for data in self._generate_data_dict_for_draft_products():
-            DraftProduct.objects.create(
-                supplier=self.supplier,
-                order_round=self.current_order_round,
-                data=data
-            )
+        DraftProduct.objects.create_many(
+            self.supplier, self.current_order_round,
+            list(self._generate_data_dict_for_draft_products()))
 
     def post(self, *args, **kwargs):
         old_draft_products = DraftProduct.objects.filter(
@@ -487,12 +427,9 @@ class CreateRealProducts(TemplateView, ProductAdminMixin):
         return super(CreateRealProducts, self).get(*args, **kwargs)
 
     def create_products(self):
-        for dp in DraftProduct.objects.filter(
-                supplier=self.supplier,
-                order_round=self.current_order_round):
-            prod = dp.create_product()
-            dp.delete()
-            prod.determine_if_product_is_new_and_set_label()
+        return DraftProduct.objects.publish(DraftProduct.objects.filter(
+            supplier=self.supplier,
+            order_round=self.current_order_round))
 
 
 class ProductAdminMain(GroupRequiredMixin, ListView):
@@ -518,21 +455,14 @@ class RedirectToMailingView(GroupRequiredMixin, DetailView):
     model = OrderRound
 
     def get(self, request, *args, **kwargs):
-        queryset = []
+        queryset = VokoUser.objects.none()
         mailing_id = None
 
-        def _user_has_no_orders_in_current_round(voko_user):
-            current_order_round = get_current_order_round()
-            return not Order.objects.filter(order_round=current_order_round,
-                                            user=voko_user, paid=True).exists()
-
         if kwargs['mailing_type'] == "round-open":
             mailing_id = 11  # Order round open
-            queryset = VokoUser.objects.filter(Q(can_activate=True)
-                                               & (Q(userprofile__isnull=True)
-                                                  | Q(userprofile__orderround_mail_optout=False)))
+            queryset = VokoUser.objects.filter(can_activate=True).round_mail_recipients()
 
-        user_ids = [user.pk for user in queryset]
+        user_ids = list(queryset.values_list("pk", flat=True))
         request.session['mailing_user_ids'] = user_ids
 
         return HttpResponseRedirect(
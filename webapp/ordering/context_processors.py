@@ -1,3 +1,6 @@
+from django.utils.functional import SimpleLazyObject
+
+from ordering.core import get_cart
 from ordering.models import PickupLocation
 
 
@@ -6,3 +9,15 @@ def pickup_locations(request):
     return {
         'pickup_locations': locations
     }
+
+
+def cart(request):
+    """
+    The member's open order, resolved once per request and only when a
+    template uses it
+    """
+    if not request.user.is_authenticated:
+        return {}
+    return {
+        'cart': SimpleLazyObject(lambda: get_cart(request.user))
+    }
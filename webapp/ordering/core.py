@@ -1,10 +1,18 @@
 import re
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 import pytz
 from accounts.models import VokoUser
 from constance import config
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
 from log import log_event
 from pytz import UTC
 from tzlocal import get_localzone
@@ -12,6 +20,26 @@ from tzlocal import get_localzone
 from ordering import models
 
 
+CURRENT_ORDER_ROUND_CACHE_KEY = "ordering.current_order_round"
+UNIT_INDEX_CACHE_KEY = "ordering.unit_index"
+
+# Per-request memo, activated by vokou.middleware.OrderRoundMiddleware
+_request_cache = ContextVar("ordering_request_cache", default=None)
+
+
+@contextmanager
+def request_cache():
+    """
+    Memoize the current order round for the duration of a request
+    (or any other unit of work, like a cron run).
+    """
+    token = _request_cache.set({})
+    try:
+        yield
+    finally:
+        _request_cache.reset(token)
+
+
 def get_current_order_round():
     """
     Return the current order round.
@@ -19,9 +47,141 @@ def get_current_order_round():
     If there's not current or next order round, return the previous one.
     If there's no order round at all, return None.
 
+    The result is memoized per request and shared between processes through
+    Django's cache until the next open, close or collect boundary of any
+    round is crossed, or until an OrderRound is saved or deleted.
+
     :return: OrderRound object || None
     """
+    memo = _request_cache.get()
+    if memo is not None and "current_order_round" in memo:
+        return memo["current_order_round"]
+
     now = datetime.now(UTC)
+    cached = cache.get(CURRENT_ORDER_ROUND_CACHE_KEY)
+    if cached is not None and cached["valid_from"] <= now and (
+        cached["valid_until"] is None or now < cached["valid_until"]
+    ):
+        order_round = cached["order_round"]
+    else:
+        order_round = _find_current_order_round(now)
+        valid_until = _next_order_round_boundary(now)
+
+        timeout = settings.CURRENT_ORDER_ROUND_CACHE_TIMEOUT
+        if valid_until is not None:
+            timeout = min(timeout, max(int((valid_until - now).total_seconds()), 1))
+
+        cache.set(
+            CURRENT_ORDER_ROUND_CACHE_KEY,
+            {"order_round": order_round, "valid_from": now, "valid_until": valid_until},
+            timeout,
+        )
+
+    if memo is not None:
+        memo["current_order_round"] = order_round
+    return order_round
+
+
+def invalidate_current_order_round():
+    """
+    Drop the cached current order round, e.g. after an OrderRound changed.
+    """
+    cache.delete(CURRENT_ORDER_ROUND_CACHE_KEY)
+    memo = _request_cache.get()
+    if memo is not None:
+        memo.pop("current_order_round", None)
+
+
+class Cart(object):
+    """
+    The open order of a member in the current round, with its number of
+    products and total price, as shown in the menu
+    """
+
+    def __init__(self, order=None):
+        self.order = order
+
+    @property
+    def count(self):
+        return self.order.products_count if self.order else 0
+
+    @property
+    def total_price(self):
+        return self.order.total_price if self.order else Decimal(0)
+
+
+def get_cart(user):
+    """
+    Return the Cart of :user: with a single query, memoized per request
+    (see request_cache). Unlike OrderManager.get_current_order, this never
+    creates an order.
+    """
+    memo = _request_cache.get()
+    key = ("cart", user.pk)
+    if memo is not None and key in memo:
+        return memo[key]
+
+    order = None
+    order_round = get_current_order_round()
+    if order_round is not None:
+        order = (
+            models.Order.objects.with_totals()
+            .filter(paid=False, user=user, order_round=order_round)
+            .annotate(products_count=Count("orderproducts"))
+            .order_by("-pk")
+            .first()
+        )
+
+    cart = Cart(order)
+    if memo is not None:
+        memo[key] = cart
+    return cart
+
+
+def invalidate_cart(user_id):
+    """
+    Drop the memoized Cart of :user_id:, e.g. after its products changed.
+    """
+    memo = _request_cache.get()
+    if memo is not None:
+        memo.pop(("cart", user_id), None)
+
+
+def correction_json_cache_key(order_round_id):
+    """ Key of the cached correction admin JSON, see OrderAdminCorrectionJson """
+    return "ordering.correction_json.%s" % order_round_id
+
+
+def correction_report_cache_key(order_round_id):
+    """ Key of the cached correction report, see get_correction_report """
+    return "ordering.correction_report.%s" % order_round_id
+
+
+def get_correction_report(order_round):
+    """
+    Return the correction report of :order_round: (see
+    CorrectionQuerySet.report), cached until its corrections change.
+    """
+    key = correction_report_cache_key(order_round.pk)
+    report = cache.get(key)
+    if report is None:
+        report = models.OrderProductCorrection.objects.filter(
+            order_product__order__order_round=order_round
+        ).report()
+        cache.set(key, report, settings.CORRECTION_CACHE_TIMEOUT)
+    return report
+
+
+def invalidate_corrections(order_round_id):
+    """
+    Drop the cached correction admin JSON and correction report of
+    :order_round_id:, e.g. after a correction was made or a paid order
+    changed.
+    """
+    cache.delete_many([correction_json_cache_key(order_round_id), correction_report_cache_key(order_round_id)])
+
+
+def _find_current_order_round(now):
     order_rounds = models.OrderRound.objects.all()
 
     # Exact match to open round(s)
@@ -40,6 +200,20 @@ def get_current_order_round():
         return filtered.order_by("-open_for_orders")[0]
 
 
+def _next_order_round_boundary(now):
+    """
+    Return the first open, close or collect moment of any round after :now:,
+    or None when there is none.
+    """
+    boundaries = models.OrderRound.objects.aggregate(
+        next_open=Min("open_for_orders", filter=Q(open_for_orders__gt=now)),
+        next_close=Min("closed_for_orders", filter=Q(closed_for_orders__gt=now)),
+        next_collect=Min("collect_datetime", filter=Q(collect_datetime__gt=now)),
+    )
+    upcoming = [b for b in boundaries.values() if b is not None]
+    return min(upcoming) if upcoming else None
+
+
 def get_latest_order_round():
     """
     Return the most recent finished order round, after collecting time
@@ -82,11 +256,11 @@ def get_or_create_order(user):
         raise RuntimeError("Nog geen bestelronde aangemaakt!")
 
     order = (
-        models.Order.objects.filter(paid=False, user=user, order_round=get_current_order_round()).order_by("id").last()
+        models.Order.objects.filter(paid=False, user=user, order_round=current_order_round).order_by("id").last()
     )
 
     if order is None:
-        order = models.Order.objects.create(paid=False, user=user, order_round=get_current_order_round())
+        order = models.Order.objects.create(paid=False, user=user, order_round=current_order_round)
     return order
 
 
@@ -96,6 +270,78 @@ def get_order_product(product, order):
         return existing_ops[0]
 
 
+def update_order_products(order, amounts):
+    """
+    Set the ordered amount of many products of :order: at once.
+
+    :amounts: dict of product id => amount, where 0 removes the product.
+    Products with a maximum total order are checked against their
+    availability; when not enough is available they're not ordered.
+
+    Uses two queries for reading and one bulk statement per type of change,
+    inside a single transaction.
+    Raises Product.DoesNotExist when an unknown product id is given.
+
+    :return: list of products that could not be ordered
+    """
+    products = {
+        product.id: product
+        for product in models.Product.objects.filter(id__in=amounts)
+        .with_availability()
+        .select_related("order_round", "supplier", "unit")
+    }
+    if len(products) != len(amounts):
+        raise models.Product.DoesNotExist("Unknown product id(s): %s" % (set(amounts) - set(products)))
+
+    existing = {op.product_id: op for op in order.orderproducts.filter(product_id__in=amounts)}
+
+    rejected = []
+    to_create = []
+    to_update = []
+    to_delete = []
+    # Change of the products total by the updates and inserts; deleted
+    # order products are subtracted by their post_delete handler
+    total_change = 0
+    for product_id, amount in amounts.items():
+        product = products[product_id]
+        order_product = existing.get(product_id)
+
+        if amount and product.maximum_total_order and amount > product.amount_available:
+            rejected.append(product)
+            amount = 0
+
+        if not amount:
+            if order_product:
+                to_delete.append(order_product.id)
+        elif order_product:
+            if order_product.amount != amount:
+                total_change -= order_product.total_retail_price
+                order_product.amount = amount
+                total_change += order_product.total_retail_price
+                order_product.modified = timezone.now()
+                to_update.append(order_product)
+        else:
+            order_product = models.OrderProduct(
+                order=order,
+                product=product,
+                amount=amount,
+                retail_price=product.retail_price,
+                base_price=product.base_price,
+            )
+            total_change += order_product.total_retail_price
+            to_create.append(order_product)
+
+    with transaction.atomic():
+        if to_delete:
+            order.orderproducts.filter(id__in=to_delete).delete()
+        models.OrderProduct.objects.bulk_update(to_update, ["amount", "modified"])
+        models.OrderProduct.objects.bulk_create(to_create)
+        order.add_to_products_total(total_change)
+    invalidate_cart(order.user_id)
+
+    return rejected
+
+
 def update_totals_for_products_with_max_order_amounts(order, request=None):
     """
     request (Django request) is optional, when given it is used to add
@@ -156,43 +402,66 @@ def find_unit(unit):
     else:
         amount = int(amount)
 
-    by_name = _find_unit_by_name(unit_str)
-    by_desc = _find_unit_by_desc(unit_str)
-    by_abbr = _find_unit_by_abbr(unit_str)
-
-    if by_name:
-        return amount, by_name
-
-    if by_desc:
-        return amount, by_desc
-
-    if by_abbr:
-        return amount, by_abbr
+    index = _unit_index()
+    for lookup in ("name", "description", "abbreviation"):
+        product_unit = index[lookup].get(unit_str)
+        if product_unit is not None:
+            return amount, product_unit
 
     raise RuntimeError("No units could be matched")
 
 
-def _find_unit_by_name(unit):
-    try:
-        return models.ProductUnit.objects.get(name__iexact=unit)
-    except models.ProductUnit.DoesNotExist:
-        return
+def find_units(units):
+    """
+    Like find_unit, for many :units: strings at once (e.g. all rows of a
+    supplier's product list), using one unit index.
+    Return dict of unit string => (amount, ProductUnit); units that can't
+    be matched are left out.
+    """
+    found = {}
+    for unit in set(units):
+        try:
+            found[unit] = find_unit(unit)
+        except (RuntimeError, TypeError):
+            pass
+    return found
 
 
-def _find_unit_by_desc(unit):
-    try:
-        return models.ProductUnit.objects.get(description__iexact=unit)
-    except models.ProductUnit.DoesNotExist:
-        return
-
-
-def _find_unit_by_abbr(unit):
-    for product_unit in models.ProductUnit.objects.all():
-        abbrs = [a.lower() for a in product_unit.abbreviations.split()]
-        if unit in abbrs:
-            return product_unit
-        if unit + "." in abbrs:
-            return product_unit
+def _unit_index():
+    """
+    ProductUnits by lowercased name, description and abbreviation (with and
+    without trailing dot). Memoized per request and shared through Django's
+    cache until a ProductUnit is saved or deleted.
+    """
+    memo = _request_cache.get()
+    if memo is not None and "unit_index" in memo:
+        return memo["unit_index"]
+
+    index = cache.get(UNIT_INDEX_CACHE_KEY)
+    if index is None:
+        index = {"name": {}, "description": {}, "abbreviation": {}}
+        # The first unit wins, like the (former) queries per unit did
+        for product_unit in models.ProductUnit.objects.order_by("id"):
+            index["name"].setdefault(product_unit.name.lower(), product_unit)
+            index["description"].setdefault(product_unit.description.lower(), product_unit)
+            for abbr in product_unit.abbreviations.lower().split():
+                index["abbreviation"].setdefault(abbr, product_unit)
+                index["abbreviation"].setdefault(abbr.rstrip("."), product_unit)
+        cache.set(UNIT_INDEX_CACHE_KEY, index, settings.UNIT_INDEX_CACHE_TIMEOUT)
+
+    if memo is not None:
+        memo["unit_index"] = index
+    return index
+
+
+def invalidate_unit_index():
+    """
+    Drop the cached unit index, e.g. after a ProductUnit changed.
+    """
+    cache.delete(UNIT_INDEX_CACHE_KEY)
+    memo = _request_cache.get()
+    if memo is not None:
+        memo.pop("unit_index", None)
 
 
 def calculate_next_orderround_dates(open_date):
@@ -7,9 +7,9 @@ from constance import config
 from django.core.mail import EmailMultiAlternatives
 from django.db.models.aggregates import Sum
 from django_cron import CronJobBase, Schedule
-from log import log_event
+from log import buffered_events, log_event
 
-from ordering.models import Supplier
+from ordering.models import Order, ProductCounter, RoundStatistics, Supplier
 
 from .core import create_orderround_ahead, get_current_order_round, get_latest_order_round, get_next_order_round
 
@@ -36,6 +36,7 @@ class SendOrderReminders(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.send_order_reminders"
 
+    @buffered_events()
     def do(self):
         order_round = get_current_order_round()
         print(("Order round: %s" % order_round))
@@ -71,6 +72,7 @@ class SendPickupReminders(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.send_pickup_reminders"
 
+    @buffered_events()
     def do(self):
         order_round = get_current_order_round()
         print(("Order round: %s" % order_round))
@@ -104,6 +106,7 @@ class MailOrderLists(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.mail_order_lists_to_suppliers"
 
+    @buffered_events()
     def do(self):
         order_round = get_current_order_round()
         print(("Order round: %s" % order_round))
@@ -219,6 +222,7 @@ class SendRideMails(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.send_ride_mails"
 
+    @buffered_events()
     def do(self):
         order_round = get_current_order_round()
         print("Order round: %s" % order_round)
@@ -243,6 +247,7 @@ class SendPrepareRideMails(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.send_prepare_ride_mails"
 
+    @buffered_events()
     def do(self):
         print("SendPrepareRideMails")
         order_round = get_current_order_round()
@@ -271,6 +276,7 @@ class SendRideCostsRequestMails(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.send_ride_costs_request_mails"
 
+    @buffered_events()
     def do(self):
         print("SendRideCostsRequestMails")
         last_order_round = get_latest_order_round()
@@ -302,6 +308,7 @@ class SendDistributionMails(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.send_distribution_mails"
 
+    @buffered_events()
     def do(self):
         print("SendDistributionMails")
         order_round = get_current_order_round()
@@ -328,6 +335,7 @@ class AutoCreateOrderRoundBatch(CronJobBase):
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "ordering.auto_create_orderrounds"
 
+    @buffered_events()
     def do(self):
         print("AutoCreateOrderRounds cron job running...")
 
@@ -349,3 +357,72 @@ class AutoCreateOrderRoundBatch(CronJobBase):
             import traceback
 
             traceback.print_exc()
+
+
+class CreateRoundStatistics(CronJobBase):
+    """
+    Creates the statistics snapshot of order rounds that just closed
+
+    Cron runs every 30 minutes
+
+    When: order round is closed for orders and has no statistics yet
+    Statistics are served by the orders API
+    """
+
+    RUN_EVERY_MINS = 30
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "ordering.create_round_statistics"
+
+    @buffered_events()
+    def do(self):
+        count = RoundStatistics.objects.fill_missing()
+        print("Created statistics for %d order round(s)" % count)
+
+
+class RecountProductCounters(CronJobBase):
+    """
+    Repairs the product counters (paid amounts and stock)
+
+    Cron runs every 24 hours
+
+    The counters are kept up to date on save and delete, but bulk updates
+    bypass them; otherwise products could wrongly show as sold out
+    """
+
+    RUN_EVERY_MINS = 60 * 24  # 24 hours
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "ordering.recount_product_counters"
+
+    @buffered_events()
+    def do(self):
+        mismatches = ProductCounter.objects.recount()
+        for product_id, stored, counted in mismatches:
+            log_event(event="Fixed counter of product %s: (ordered, stock) %s, counted %s"
+                      % (product_id, stored, counted))
+        print("Fixed %d product counter(s)" % len(mismatches))
+
+
+class CheckOrderTotals(CronJobBase):
+    """
+    Repairs the stored products totals of orders
+
+    Cron runs every 24 hours
+
+    The totals are kept up to date on save and delete, but bulk updates
+    bypass them; see also the check_order_totals management command
+    """
+
+    RUN_EVERY_MINS = 60 * 24  # 24 hours
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "ordering.check_order_totals"
+
+    @buffered_events()
+    def do(self):
+        mismatches = Order.objects.check_totals(fix=True)
+        for order_id, stored, expected in mismatches:
+            log_event(event="Fixed totals of order %s: stored %s, expected %s" % (order_id, stored, expected),
+                      order_id=order_id)
+        print("Fixed %d order(s)" % len(mismatches))
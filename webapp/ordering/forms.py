@@ -33,4 +33,5 @@ class OrderForm(forms.ModelForm):
 
 class UploadProductListForm(forms.Form):
     product_list = forms.FileField()
-    product_list.widget.attrs['accept'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    product_list.widget.attrs['accept'] = \
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet,.csv,text/csv'
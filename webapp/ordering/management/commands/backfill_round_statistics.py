@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ordering.models import OrderRound, RoundStatistics
+
+
+class Command(BaseCommand):
+    help = "Create the statistics snapshot of closed order rounds that don't have one yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recalculate the statistics of every closed order round",
+        )
+
+    def handle(self, *args, **options):
+        if not options["all"]:
+            count = RoundStatistics.objects.fill_missing()
+            self.stdout.write(self.style.SUCCESS("Created statistics for %d order round(s)" % count))
+            return
+
+        order_rounds = OrderRound.objects.filter(statistics__isnull=False)
+        for order_round in order_rounds:
+            RoundStatistics.objects.refresh(order_round)
+        count = RoundStatistics.objects.fill_missing()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Recalculated statistics for %d and created them for %d order round(s)" % (len(order_rounds), count)
+            )
+        )
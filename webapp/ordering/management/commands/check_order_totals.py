@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from ordering.models import Order
+
+
+class Command(BaseCommand):
+    help = "Check the stored order totals (products total, member fee, order number) and fix the ones that are off"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report differences, don't fix them",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = Order.objects.check_totals(fix=not options["dry_run"])
+
+        for order_id, stored, expected in mismatches:
+            self.stdout.write("Order %s: stored %s, expected %s" % (order_id, stored, expected))
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All order totals are correct"))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING("%d order(s) differ" % len(mismatches)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Fixed %d order(s)" % len(mismatches)))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from ordering.models import ProductCounter
+
+
+class Command(BaseCommand):
+    help = "Check the product counters (paid amount and stock) against the order products and stock, and fix them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report differences, don't fix them",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = ProductCounter.objects.recount(dry_run=options["dry_run"])
+
+        for product_id, stored, counted in mismatches:
+            self.stdout.write("Product %s: counter (ordered, stock) %s, counted %s" % (product_id, stored, counted))
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All product counters are correct"))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING("%d product counter(s) differ" % len(mismatches)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Fixed %d product counter(s)" % len(mismatches)))
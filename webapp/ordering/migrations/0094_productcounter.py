@@ -0,0 +1,52 @@
+# Generated by Django 4.2.29 on 2026-10-18 16:22
+
+from django.db import migrations, models
+from django.db.models import Case, F, Sum, When
+import django.db.models.deletion
+
+
+def fill_product_counters(apps, schema_editor):
+    Product = apps.get_model("ordering", "Product")
+    OrderProduct = apps.get_model("ordering", "OrderProduct")
+    ProductStock = apps.get_model("ordering", "ProductStock")
+    ProductCounter = apps.get_model("ordering", "ProductCounter")
+
+    ordered = dict(
+        OrderProduct.objects.filter(order__paid=True).order_by().values_list("product").annotate(Sum("amount"))
+    )
+    stock = dict(
+        ProductStock.objects.order_by()
+        .values_list("product")
+        .annotate(total=Sum(Case(When(type="lost", then=-F("amount")), default=F("amount"))))
+    )
+
+    ProductCounter.objects.bulk_create(
+        [
+            ProductCounter(product_id=product_id, ordered=ordered.get(product_id, 0), stock=stock.get(product_id, 0))
+            for product_id in Product.objects.values_list("id", flat=True).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordering', '0093_alter_orderround_transaction_costs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCounter',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='ordering.product')),
+                ('ordered', models.IntegerField(default=0)),
+                ('stock', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Productteller',
+                'verbose_name_plural': 'Producttellers',
+            },
+        ),
+        migrations.RunPython(fill_product_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.29 on 2026-10-18 16:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordering', '0094_productcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundStatistics',
+            fields=[
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('order_round', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='ordering.orderround')),
+                ('number_of_orders', models.IntegerField(default=0)),
+                ('number_of_ordering_members', models.IntegerField(default=0)),
+                ('number_of_members', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('number_of_products', models.IntegerField(default=0)),
+                ('number_of_suppliers', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Bestelrondestatistiek',
+                'verbose_name_plural': 'Bestelrondestatistieken',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.29 on 2026-10-18 17:07
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model("ordering", "Order")
+    OrderProduct = apps.get_model("ordering", "OrderProduct")
+
+    product_sums = dict(
+        OrderProduct.objects.order_by().values_list("order").annotate(total=Sum(F("amount") * F("retail_price")))
+    )
+
+    batch = []
+    user_id = None
+    for order in Order.objects.order_by("user_id", "pk").only("id", "user_id", "paid", "finalized").iterator():
+        if order.user_id != user_id:
+            user_id, paid_before, finalized_before = order.user_id, 0, 0
+        order.products_total_amount = Decimal(product_sums.get(order.id) or 0).quantize(Decimal(".01"))
+        if order.paid:
+            order.member_fee_amount = Decimal(0) if paid_before else Decimal(settings.MEMBER_FEE)
+            paid_before += 1
+            if order.finalized:
+                finalized_before += 1
+                order.sequence_number = finalized_before
+        batch.append(order)
+        if len(batch) >= 1000:
+            Order.objects.bulk_update(batch, ["products_total_amount", "member_fee_amount", "sequence_number"])
+            batch = []
+    Order.objects.bulk_update(batch, ["products_total_amount", "member_fee_amount", "sequence_number"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordering', '0095_roundstatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='member_fee_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products_total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='sequence_number',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text="Number of this order among the user's finished orders", null=True),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.29 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+def mark_drafts_unvalidated(apps, schema_editor):
+    # Validation used to run on every view; have existing drafts validated once more
+    DraftProduct = apps.get_model("ordering", "DraftProduct")
+    DraftProduct.objects.update(is_valid=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordering', '0096_order_stored_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='draftproduct',
+            name='is_valid',
+            field=models.BooleanField(default=None, null=True),
+        ),
+        migrations.RunPython(mark_drafts_unvalidated, migrations.RunPython.noop),
+    ]
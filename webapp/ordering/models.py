@@ -2,23 +2,57 @@
 from jsonfield import JSONField
 
 import pytz
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from decimal import Decimal, ROUND_UP, ROUND_DOWN
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Case, Count, DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.signals import post_delete, pre_delete
+from django.template.loader import render_to_string
+from django.dispatch import receiver
+from django.utils.functional import cached_property
 from django_extensions.db.models import TimeStampedModel
 from django.core.exceptions import ValidationError
 from accounts.models import Address, VokoUser
 from finance.models import Balance
-from log import log_event
-from mailing.helpers import mail_user, get_template_by_id, render_mail_template
-from ordering.core import get_or_create_order, get_current_order_round, find_unit
+from log import buffered_events, log_event
+from mailing.helpers import (
+    mail_user,
+    queue_mail,
+    get_template_by_id,
+    render_mail_template,
+    render_mail_template_many,
+)
+from ordering.core import (
+    get_or_create_order,
+    get_current_order_round,
+    find_unit,
+    find_units,
+    invalidate_cart,
+    invalidate_corrections,
+    invalidate_current_order_round,
+    invalidate_unit_index,
+)
 from django.conf import settings
 from constance import config
 
 from agenda.models import TransientEvent
 
 
+def _cents(field):
+    """
+    Price field as an integer amount of cents, so sums are exact in SQL
+    """
+    return Cast(Round(F(field) * 100), output_field=models.BigIntegerField())
+
+
+def _from_cents(cents):
+    return (Decimal(cents or 0) / Decimal("100")).quantize(Decimal(".01"))
+
+
 class Supplier(TimeStampedModel):
     class Meta:
         verbose_name = "Leverancier"
@@ -154,6 +188,16 @@ class OrderRound(TimeStampedModel):
         if self.is_over:
             raise ValidationError("Orderrounds which are in the past cannot be saved or changed")
 
+    def save(self, **kwargs):
+        super(OrderRound, self).save(**kwargs)
+        invalidate_current_order_round()
+
+    def delete(self, *args, **kwargs):
+        with grouped_deletes():
+            ret = super(OrderRound, self).delete(*args, **kwargs)
+        invalidate_current_order_round()
+        return ret
+
     def is_not_open_yet(self):
         current_datetime = datetime.now(pytz.utc)
         return current_datetime < self.open_for_orders
@@ -194,18 +238,17 @@ class OrderRound(TimeStampedModel):
 
         return [Supplier.objects.get(id=supplier_id) for supplier_id in supplier_ids]
 
+    def paid_orderproducts(self):
+        return OrderProduct.objects.filter(order__order_round=self).paid()
+
     def supplier_total_order_sum(self, supplier):
         """
         Return sum of total order amount (in euro) for a supplier
         """
-        order_products = OrderProduct.objects.filter(
-            order__order_round=self, order__paid=True, product__supplier=supplier
-        )
-        return sum([o_p.total_cost_price() for o_p in order_products])
+        return self.paid_orderproducts().filter(product__supplier=supplier).totals()["cost"]
 
     def total_order_sum(self):
-        order_products = OrderProduct.objects.filter(order__order_round=self, order__paid=True)
-        return sum([o_p.total_cost_price() for o_p in order_products])
+        return self.paid_orderproducts().totals()["cost"]
 
     def total_corrections(self):
         """
@@ -215,37 +258,21 @@ class OrderRound(TimeStampedModel):
         voko_inc:       Total member refund to be paid by VOKO
                         (e.g. lost/broken products)
         """
-        corrections = OrderProductCorrection.objects.filter(order_product__order__order_round=self)
-
-        supplier_exc = sum([c.calculate_supplier_refund() for c in corrections.filter(charge_supplier=True)])
-
-        supplier_inc = sum([c.calculate_refund() for c in corrections.filter(charge_supplier=True)])
-
-        voko_inc = sum([c.calculate_refund() for c in corrections.filter(charge_supplier=False)])
-
-        return {
-            "supplier_exc": supplier_exc,
-            "supplier_inc": supplier_inc,
-            "voko_inc": voko_inc,
-        }
+        return OrderProductCorrection.objects.filter(order_product__order__order_round=self).totals()
 
     def total_profit(self):
         """
-        Total profit purely by markup on products for this round
+        Total profit purely by markup on products for this round,
+        based on the prices the products were sold and bought for.
         """
         # FIXME: Does not take corrections into account. Is this by design?
-        orderproducts = OrderProduct.objects.filter(order__order_round=self, order__paid=True)
-        return sum([orderprod.product.profit * orderprod.amount for orderprod in orderproducts])
+        return self.paid_orderproducts().totals()["profit"]
 
     def total_revenue(self):
         """
         Total revenue on products for this round
         """
-        order_products = OrderProduct.objects.filter(order__order_round=self, order__paid=True)
-
-        total = sum([o_p.total_retail_price for o_p in order_products])
-        print("  total_revenue: %f" % total)
-        return total
+        return self.paid_orderproducts().totals()["revenue"]
 
     def number_of_orders(self):
         """
@@ -257,28 +284,43 @@ class OrderRound(TimeStampedModel):
     def paid_orders(self):
         return self.orders.filter(paid=True)
 
-    @property
+    @cached_property
     def orders_per_supplier(self):
+        """
+        Paid orders for this round's products, per active supplier:
+        {supplier: {"orderproducts": [{"product", "amount", "sub_total"}],
+                    "sum": total order amount (incl. stock products)}}
+
+        Uses a constant number of queries and is memoized on the instance,
+        so e.g. the rides of a round can reuse it.
+        """
+        supplier_totals = self.paid_orderproducts().totals_per("product__supplier")
+
         data = {}
+        suppliers = {}
         for supplier in Supplier.objects.filter(is_active=True):
-            suppliers_products_this_round = supplier.products.filter(order_round=self)
+            suppliers[supplier.id] = supplier
             data[supplier] = {
                 "orderproducts": [],
-                "sum": self.supplier_total_order_sum(supplier),
+                "sum": supplier_totals[supplier.id]["cost"] if supplier.id in supplier_totals else 0,
             }
 
-            for product in suppliers_products_this_round:
-                order_products = product.orderproducts.filter(order__paid=True)
-                product_sum = sum([op.amount for op in order_products])
-                if product_sum == 0:
-                    continue
-                data[supplier]["orderproducts"].append(
-                    {
-                        "product": product,
-                        "amount": product_sum,
-                        "sub_total": product_sum * product.base_price,
-                    }
-                )
+        products = (
+            self.products.filter(supplier__is_active=True)
+            .annotate(amount_sum=Sum("orderproducts__amount", filter=Q(orderproducts__order__paid=True)))
+            .filter(amount_sum__gt=0)
+            .select_related("unit")
+            .order_by("id")
+        )
+        for product in products:
+            product.supplier = suppliers[product.supplier_id]
+            data[product.supplier]["orderproducts"].append(
+                {
+                    "product": product,
+                    "amount": product.amount_sum,
+                    "sub_total": product.amount_sum * product.base_price,
+                }
+            )
 
         return data
 
@@ -288,24 +330,24 @@ class OrderRound(TimeStampedModel):
         """
         return (datetime.now(tz=pytz.UTC) - self.collect_datetime).days
 
+    def _has_paid_order(self):
+        """
+        Condition for VokoUser querysets: user paid an order in this round
+        """
+        return Exists(Order.objects.filter(order_round=self, user=OuterRef("pk"), paid=True))
+
     def get_users_without_orders(self):
-        def _users_without_orders_filter(voko_user):
-            return not Order.objects.filter(order_round=self, user=voko_user, paid=True).exists()
-
-        return list(
-            filter(
-                _users_without_orders_filter,
-                VokoUser.objects.filter(
-                    Q(is_active=True) & (Q(userprofile__isnull=True) | Q(userprofile__orderround_mail_optout=False))
-                ),
-            )
-        )
+        """
+        Active users without a paid order in this round who didn't opt out of
+        round mails. Returns a queryset (one query, use .iterator() to stream).
+        """
+        return VokoUser.objects.filter(is_active=True).round_mail_recipients().filter(~self._has_paid_order())
 
     def get_users_with_orders(self):
-        def _users_with_orders_filter(voko_user):
-            return Order.objects.filter(order_round=self, user=voko_user, paid=True).exists()
-
-        return list(filter(_users_with_orders_filter, VokoUser.objects.filter(is_active=True)))
+        """
+        Active users with a paid order in this round. Returns a queryset.
+        """
+        return VokoUser.objects.filter(is_active=True).filter(self._has_paid_order())
 
     def send_reminder_mails(self):
         """
@@ -323,9 +365,10 @@ class OrderRound(TimeStampedModel):
         self.reminder_sent = True
         self.save()
 
-        for user in self.get_users_without_orders():
-            rendered_template_vars = render_mail_template(mail_template, user=user, order_round=self)
-            mail_user(user, *rendered_template_vars)
+        users = list(self.get_users_without_orders())
+        rendered = render_mail_template_many(mail_template, ({"user": user, "order_round": self} for user in users))
+        for user, rendered_template_vars in zip(users, rendered):
+            queue_mail(user, *rendered_template_vars)
 
     def send_pickup_reminder_mails(self):
         """
@@ -342,9 +385,10 @@ class OrderRound(TimeStampedModel):
         self.pickup_reminder_sent = True
         self.save()
 
-        for user in self.get_users_with_orders():
-            rendered_template_vars = render_mail_template(mail_template, user=user, order_round=self)
-            mail_user(user, *rendered_template_vars)
+        users = list(self.get_users_with_orders())
+        rendered = render_mail_template_many(mail_template, ({"user": user, "order_round": self} for user in users))
+        for user, rendered_template_vars in zip(users, rendered):
+            queue_mail(user, *rendered_template_vars)
 
     def send_ride_mails(self):
         if self.rides_mails_sent is True:
@@ -458,7 +502,24 @@ class OrderRound(TimeStampedModel):
         return "Bestelronde #%s" % self.pk
 
 
-class OrderManager(models.Manager):
+class OrderQuerySet(models.query.QuerySet):
+    def delete(self):
+        with grouped_deletes():
+            return super(OrderQuerySet, self).delete()
+
+    def with_totals(self):
+        """
+        Annotate whether the member fee applies (pays_member_fee; paid
+        orders have it stored) and fetch the round, so total_price doesn't
+        need extra queries.
+        """
+        earlier_paid_orders = Order.objects.filter(user=OuterRef("user"), paid=True, pk__lt=OuterRef("pk"))
+        return self.select_related("order_round").annotate(
+            pays_member_fee=~Exists(earlier_paid_orders),
+        )
+
+
+class OrderManager(models.Manager.from_queryset(OrderQuerySet)):
     use_for_related_fields = True
 
     def get_current_order(self):
@@ -480,6 +541,65 @@ class OrderManager(models.Manager):
         except IndexError:
             return get_or_create_order(user=self.instance)
 
+    def add_to_products_totals(self, amounts):
+        """
+        Like Order.add_to_products_total(), for a dict of order id =>
+        amount, in one query
+        """
+        amounts = {order_id: amount for order_id, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        Order.objects.filter(pk__in=amounts).update(
+            products_total_amount=F("products_total_amount")
+            + Case(
+                *[When(pk=order_id, then=Value(amount)) for order_id, amount in amounts.items()],
+                output_field=DecimalField(max_digits=8, decimal_places=2),
+            )
+        )
+
+    def expected_totals(self):
+        """
+        Yield (order id, stored totals, expected totals) for every order,
+        where totals is a (products total, member fee, sequence number)
+        tuple. The member fee and sequence number of paid orders were frozen
+        when they were paid (and charged), so only their products total is
+        checked; unpaid orders have neither. Reads the orders in one query
+        and the order product sums in another.
+        """
+        product_sums = dict(
+            OrderProduct.objects.order_by()
+            .values_list("order")
+            .annotate(total=Sum(F("amount") * _cents("retail_price")))
+        )
+        orders = (
+            Order.objects.order_by("pk")
+            .values_list("id", "paid", "products_total_amount", "member_fee_amount", "sequence_number")
+            .iterator()
+        )
+        for order_id, paid, total, member_fee, sequence in orders:
+            expected_fee, expected_sequence = (member_fee, sequence) if paid else (None, None)
+            yield (
+                order_id,
+                (total, member_fee, sequence),
+                (_from_cents(product_sums.get(order_id)), expected_fee, expected_sequence),
+            )
+
+    def check_totals(self, fix=False):
+        """
+        Compare the stored totals of all orders with their order products
+        (see expected_totals()), and correct them if :fix: is set.
+        Returns a list of (order id, stored totals, expected totals) of the
+        orders that differ.
+        """
+        mismatches = [row for row in self.expected_totals() if row[1] != row[2]]
+        if fix:
+            with transaction.atomic():
+                for order_id, _, (total, member_fee, sequence) in mismatches:
+                    Order.objects.filter(pk=order_id).update(
+                        products_total_amount=total, member_fee_amount=member_fee, sequence_number=sequence
+                    )
+        return mismatches
+
     def get_last_paid_order(self):
         """
         Allows us to use:
@@ -517,6 +637,14 @@ class Order(TimeStampedModel):
 
     # TODO: order cannot be 'paid' without having a 'debit'. Add sanity check.
 
+    # Sum of the order products, kept up to date when they change
+    products_total_amount = models.DecimalField(max_digits=8, decimal_places=2, default=0, editable=False)
+    # Frozen when the order is paid, see freeze_totals()
+    member_fee_amount = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, editable=False)
+    sequence_number = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, help_text="Number of this order among the user's finished orders"
+    )
+
     def __str__(self):
         return "Order %d; user: %s" % (self.id, self.user)
 
@@ -528,14 +656,20 @@ class Order(TimeStampedModel):
         """
         return bool(self.orderproducts.all())
 
+    @property
+    def products_total(self):
+        """
+        Return total retail price of the ordered products
+        """
+        return self.products_total_amount
+
     @property
     def total_price(self):
         """
         Return total retail price for this order.
         Includes payment transaction costs and eventual member fee.
         """
-        product_sum = sum([odp.total_retail_price for odp in self.orderproducts.all()])
-        return product_sum + self.order_round.transaction_costs + self.member_fee
+        return self.products_total + self.order_round.transaction_costs + self.member_fee
 
     def total_price_to_pay_with_balances_taken_into_account(self):
         """
@@ -560,6 +694,12 @@ class Order(TimeStampedModel):
         Return contribution fee if this is users'
         first order (non-paid orders not included)
         """
+        if self.member_fee_amount is not None:
+            return self.member_fee_amount
+
+        if hasattr(self, "pays_member_fee"):
+            return Decimal(settings.MEMBER_FEE) if self.pays_member_fee else Decimal(0)
+
         amount_of_paid_orders = self.user.orders.filter(paid=True).exclude(pk=self.pk).exclude(pk__gt=self.pk).count()
 
         if amount_of_paid_orders == 0:
@@ -573,42 +713,212 @@ class Order(TimeStampedModel):
         Counts all user's finished and paid orders, ascending, by ID, and
         returns the number of the current order
         """
-        user_orders = self.user.orders.filter(paid=True, finalized=True).order_by("pk")
-        for index, uo in enumerate(user_orders):
-            if uo == self:
-                return index + 1
+        if self.sequence_number is not None:
+            return self.sequence_number
+        if not (self.paid and self.finalized):
+            return None
+        return self.user.orders.filter(paid=True, finalized=True, pk__lte=self.pk).count()
+
+    # Maintained with updates (see add_to_products_total() and
+    # freeze_totals()), so save() doesn't overwrite them with the possibly
+    # stale values of an instance
+    STORED_TOTALS = ("products_total_amount", "member_fee_amount", "sequence_number")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Order, cls).from_db(db, field_names, values)
+        # Whether the order was paid when it was read, to detect changes
+        instance._loaded_paid = dict(zip(field_names, values)).get("paid")
+        return instance
+
+    def save(self, **kwargs):
+        was_paid = False
+        if not self._state.adding:
+            if kwargs.get("update_fields") is None:
+                kwargs["update_fields"] = [
+                    field.attname
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in self.STORED_TOTALS
+                ]
+            was_paid = getattr(self, "_loaded_paid", None)
+            if was_paid != self.paid:
+                # Check the stored row, in case another request changed it
+                # after this instance was read
+                was_paid = Order.objects.filter(pk=self.pk, paid=True).exists()
+
+        super(Order, self).save(**kwargs)
+        invalidate_cart(self.user_id)
+        self._loaded_paid = self.paid
+
+        if self.paid != was_paid:
+            self.freeze_totals()
+            self._add_to_product_counters(1 if self.paid else -1)
+            self.refresh_round_statistics()
+            invalidate_corrections(self.order_round_id)
+
+    def delete(self, *args, **kwargs):
+        paid = self.paid
+        # The product counters are updated by order_product_deleted()
+        with grouped_deletes():
+            ret = super(Order, self).delete(*args, **kwargs)
+        invalidate_cart(self.user_id)
+        if paid:
+            self.refresh_round_statistics()
+            invalidate_corrections(self.order_round_id)
+        return ret
+
+    def freeze_totals(self):
+        """
+        Store the member fee and the user's order number when the order is
+        paid (and clear them when it isn't anymore)
+        """
+        self.member_fee_amount = None
+        self.sequence_number = None
+        if self.paid:
+            earlier = Order.objects.filter(user_id=self.user_id, paid=True, pk__lt=self.pk).aggregate(
+                paid=Count("id"), finalized=Count("id", filter=Q(finalized=True))
+            )
+            member_fee = Decimal(0) if earlier["paid"] else Decimal(settings.MEMBER_FEE)
+            self.member_fee_amount = member_fee.quantize(Decimal(".01"))
+            if self.finalized:
+                self.sequence_number = earlier["finalized"] + 1
+        Order.objects.filter(pk=self.pk).update(
+            member_fee_amount=self.member_fee_amount, sequence_number=self.sequence_number
+        )
+
+    def add_to_products_total(self, amount):
+        """
+        Atomically add :amount: (negative to subtract) to the stored total
+        of the order products
+        """
+        if not amount:
+            return
+        Order.objects.filter(pk=self.pk).update(products_total_amount=F("products_total_amount") + amount)
+        self.products_total_amount += amount
+
+    def _add_to_product_counters(self, sign):
+        ProductCounter.objects.add_ordered(
+            {product_id: sign * amount for product_id, amount in self.orderproducts.values_list("product", "amount")}
+        )
+
+    def refresh_round_statistics(self):
+        """
+        Update the statistics snapshot when a paid order of a closed round
+        changes (e.g. a late payment)
+        """
+        if self.order_round.is_over:
+            RoundStatistics.objects.refresh(self.order_round)
 
     def complete_after_payment(self):
         """
         Complete order by setting the 'paid' boolean,
         creating debit and mailing the user.
+        Products that sold out while the order was being paid are credited
+        back explicitly and listed in the confirmation mail.
         """
-        log_event(event="Completing (paid) order %s" % self.id, user=self.user)
+        log_event(event="Completing (paid) order %s" % self.id, user=self.user, order_id=self.id)
         with transaction.atomic():
+            shortages = self.reserve_products()
             self.paid = True
             self.save()
-            self.create_debit()
-        self.mail_confirmation()
+            refund = sum((shortage.refund for shortage in shortages), Decimal(0))
+            # Debit what was paid for, so the credit below shows up as such
+            self.create_debit(self.total_price + refund)
+            if shortages:
+                self.create_shortage_credit(shortages)
+        self.mail_confirmation(shortages=shortages)
+
+    def reserve_products(self):
+        """
+        Lock the counters of the capped and stock products in this order and
+        lower the ordered amounts that don't fit anymore, so concurrent
+        payments can't oversell a product.
+        Must be called inside a transaction, right before marking the order
+        as paid; the locks are held until that transaction commits.
+        Returns a list of Shortages for the lowered order products.
+        """
+        order_products = list(
+            self.orderproducts.filter(
+                Q(product__order_round__isnull=True) | Q(product__maximum_total_order__isnull=False)
+            ).select_related("product")
+        )
+        if not order_products:
+            return []
 
-    def create_debit(self):
+        counters = ProductCounter.objects.lock([op.product_id for op in order_products])
+
+        shortages = []
+        for order_product in order_products:
+            counter = counters[order_product.product_id]
+            available = order_product.product.available_for(counter.ordered, counter.stock)
+            if order_product.amount <= available:
+                continue
+
+            log_event(
+                event="Lowering amount of %s in order %s from %d to %d because of availability"
+                % (order_product.product, self.id, order_product.amount, max(available, 0)),
+                user=self.user,
+                order_id=self.id,
+            )
+            delivered = max(available, 0)
+            shortages.append(
+                Shortage(order_product.product, order_product.amount, delivered, order_product.retail_price)
+            )
+            if delivered:
+                order_product.amount = delivered
+                order_product.save()
+            else:
+                order_product.delete()
+        return shortages
+
+    def create_debit(self, amount=None):
         """
-        Create debit for order and create one-to-one relation
+        Create debit for order (default: its total price) and create
+        one-to-one relation
         """
-        log_event(event="Creating debit for order %s" % self.id)
+        amount = self.total_price if amount is None else amount
+        log_event(event="Creating debit for order %s" % self.id, order_id=self.id)
         self.debit = Balance.objects.create(
             user=self.user,
             type="DR",
-            amount=self.total_price,
-            notes="Debit van %s voor bestelling #%d" % (self.total_price, self.pk),
+            amount=amount,
+            notes="Debit van %s voor bestelling #%d" % (amount, self.pk),
         )
         self.save()
 
-    def mail_confirmation(self):
+    def create_shortage_credit(self, shortages):
         """
-        Send confirmation mail to user about successful order placement
+        Credit the user for the :shortages: (products that couldn't be
+        delivered after all)
+        """
+        amount = sum(shortage.refund for shortage in shortages)
+        log_event(event="Creating credit of %s for sold out products in order %s" % (amount, self.id),
+                  user=self.user, order_id=self.id)
+        return Balance.objects.create(
+            user=self.user,
+            type="CR",
+            amount=amount,
+            notes="Tegoed voor uitverkochte producten van bestelling #%d: %s"
+            % (self.pk, ", ".join("%d x %s" % (s.ordered - s.delivered, s.product.name) for s in shortages)),
+        )
+
+    def mail_confirmation(self, shortages=()):
+        """
+        Send confirmation mail to user about successful order placement,
+        telling which products sold out while paying (:shortages:)
         """
         mail_template = get_template_by_id(config.ORDER_CONFIRM_MAIL)
         rendered_template_vars = render_mail_template(mail_template, user=self.user, order=self)
+        if shortages:
+            subject, html_body, plain_body, from_email = rendered_template_vars
+            context = {"order": self, "shortages": shortages,
+                       "refund": sum(shortage.refund for shortage in shortages)}
+            rendered_template_vars = (
+                subject,
+                render_to_string("ordering/mail/shortages.html", context) + html_body,
+                render_to_string("ordering/mail/shortages.txt", context) + plain_body,
+                from_email,
+            )
         mail_user(self.user, *rendered_template_vars)
 
     def mail_failure_notification(self):
@@ -620,11 +930,62 @@ class Order(TimeStampedModel):
         mail_user(self.user, *rendered_template_vars)
 
 
+class Shortage(namedtuple("Shortage", "product ordered delivered retail_price")):
+    """
+    An ordered product that sold out while the order was being paid, so
+    only :delivered: of the :ordered: amount could be reserved
+    """
+
+    @property
+    def refund(self):
+        return (self.ordered - self.delivered) * self.retail_price
+
+
+class OrderProductQuerySet(models.query.QuerySet):
+    def delete(self):
+        with grouped_deletes():
+            return super(OrderProductQuerySet, self).delete()
+
+    def paid(self):
+        return self.filter(order__paid=True)
+
+    @staticmethod
+    def _totals_aggregates():
+        return {
+            "cost_cents": Sum(F("amount") * _cents("base_price"), output_field=models.BigIntegerField()),
+            "revenue_cents": Sum(F("amount") * _cents("retail_price"), output_field=models.BigIntegerField()),
+        }
+
+    @staticmethod
+    def _totals_from_cents(row):
+        cost = _from_cents(row["cost_cents"])
+        revenue = _from_cents(row["revenue_cents"])
+        return {"cost": cost, "revenue": revenue, "profit": revenue - cost}
+
+    def totals(self):
+        """
+        Return cost (base price), revenue (retail price) and profit
+        totals of these OrderProducts, calculated in one query.
+        """
+        return self._totals_from_cents(self.aggregate(**self._totals_aggregates()))
+
+    def totals_per(self, field):
+        """
+        Like totals(), but grouped by :field: (e.g. "product__supplier" or
+        "order__order_round") in one query.
+        Returns {<value of field>: totals}
+        """
+        rows = self.order_by().values(field).annotate(**self._totals_aggregates())
+        return {row[field]: self._totals_from_cents(row) for row in rows}
+
+
 class OrderProduct(TimeStampedModel):
     """
     Represents an order of one particular product
     """
 
+    objects = OrderProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Productbestelling"
         verbose_name_plural = "Productbestellingen"
@@ -642,6 +1003,37 @@ class OrderProduct(TimeStampedModel):
     def __str__(self):
         return "%d x %s door %s" % (self.amount, self.product, self.order.user)
 
+    def save(self, **kwargs):
+        invalidate_cart(self.order.user_id)
+
+        orig = None
+        if self.pk is not None:
+            orig = OrderProduct.objects.filter(pk=self.pk).values_list("product", "amount", "retail_price").first()
+
+        super(OrderProduct, self).save(**kwargs)
+
+        orig_total = Decimal(orig[1]) * orig[2] if orig else 0
+        self.order.add_to_products_total(self.total_retail_price - orig_total)
+        if not self.order.paid:
+            return
+
+        changes = {self.product_id: self.amount}
+        if orig:
+            changes[orig[0]] = changes.get(orig[0], 0) - orig[1]
+        ProductCounter.objects.add_ordered(changes)
+        self.order.refresh_round_statistics()
+        invalidate_corrections(self.order.order_round_id)
+
+    def delete(self, *args, **kwargs):
+        invalidate_cart(self.order.user_id)
+        ret = super(OrderProduct, self).delete(*args, **kwargs)
+        if not self.order.paid:
+            return ret
+
+        self.order.refresh_round_statistics()
+        invalidate_corrections(self.order.order_round_id)
+        return ret
+
     @property
     def total_retail_price(self):
         """
@@ -659,19 +1051,251 @@ class OrderProduct(TimeStampedModel):
         return Decimal(self.amount) * Decimal(str(self.base_price))
 
 
+# Order products deleted inside grouped_deletes()
+_pending_deletes = ContextVar("ordering_pending_deletes", default=None)
+
+
+class _PendingDeletes(object):
+    def __init__(self):
+        # (order id, product id, amount, total retail price)
+        self.order_products = []
+        # order id => paid, of the orders deleted in the meantime
+        self.deleted_orders = {}
+        # order id => paid, of the orders that were at hand already
+        self.known_orders = {}
+
+    def apply(self):
+        """
+        Take the deleted order products out of the totals of their (still
+        existing) orders and, if paid, the product counters. Uses one
+        query per type of change.
+        """
+        if not self.order_products:
+            return
+        order_ids = {order_id for order_id, _, _, _ in self.order_products}
+        paid = dict(self.known_orders)
+        paid.update(self.deleted_orders)
+        if order_ids - set(paid):
+            paid.update(Order.objects.filter(pk__in=order_ids - set(paid)).values_list("pk", "paid"))
+
+        totals = defaultdict(Decimal)
+        ordered = defaultdict(int)
+        for order_id, product_id, amount, price in self.order_products:
+            if order_id not in self.deleted_orders:
+                totals[order_id] -= price
+            if paid.get(order_id):
+                ordered[product_id] += amount
+        Order.objects.add_to_products_totals(totals)
+        ProductCounter.objects.remove_ordered(ordered)
+        self.order_products = []
+        self.known_orders = {}
+
+
+@contextmanager
+def grouped_deletes():
+    """
+    Update the order totals and product counters for the order products
+    deleted inside the block (directly or by a cascade) with one grouped
+    update at the end, instead of one per order product.
+    Used by the delete methods of the models that cascade to order
+    products; nested blocks are part of the outer one.
+    """
+    if _pending_deletes.get() is not None:
+        yield
+        return
+
+    pending = _PendingDeletes()
+    token = _pending_deletes.set(pending)
+    try:
+        with transaction.atomic(savepoint=False):
+            yield
+            pending.apply()
+    finally:
+        _pending_deletes.reset(token)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleting(sender, instance, **kwargs):
+    pending = _pending_deletes.get()
+    if pending is not None:
+        # Gone by the time the deleted order products are applied
+        pending.deleted_orders[instance.pk] = instance.paid
+
+
+@receiver(post_delete, sender=OrderProduct)
+def order_product_deleted(sender, instance, **kwargs):
+    """
+    Take a deleted order product out of its order's products total and, if
+    paid, the product counters. A signal handler, so queryset deletes and
+    cascades (of an order, product or user) are covered too; see
+    grouped_deletes().
+    """
+    with grouped_deletes():
+        pending = _pending_deletes.get()
+        if OrderProduct.order.is_cached(instance):
+            instance.order.products_total_amount -= instance.total_retail_price
+            pending.known_orders[instance.order_id] = instance.order.paid
+        pending.order_products.append(
+            (instance.order_id, instance.product_id, instance.amount, instance.total_retail_price)
+        )
+
+
 class CorrectionQuerySet(models.query.QuerySet):
     def delete(self):
+        """
+        Delete these corrections and their credits in bulk
+        """
         # OneToOne relation isn't cascaded in this direction :(
-        # Make sure credit is deleted anyway when correction is deleted
-        for obj in self:
-            obj.credit.delete()
-        return super(CorrectionQuerySet, self).delete()
+        # Delete the credits instead, which cascades to the corrections
+        rows = list(self.values_list("credit", "order_product__order__order_round"))
+        ret = Balance.objects.delete_many([credit_id for credit_id, _ in rows])
+        for order_round_id in set(order_round_id for _, order_round_id in rows):
+            invalidate_corrections(order_round_id)
+        return ret
+
+    @staticmethod
+    def _totals_aggregates():
+        # Same rounding (down, per correction) as calculate_refund() and
+        # calculate_supplier_refund(), on integer cents
+        missing = 100 - F("supplied_percentage")
+        refund = F("order_product__amount") * _cents("order_product__retail_price") * missing / 100
+        supplier_refund = F("order_product__amount") * _cents("order_product__base_price") * missing / 100
+        output_field = models.BigIntegerField()
+        return {
+            "supplier_exc": Sum(supplier_refund, filter=Q(charge_supplier=True), output_field=output_field),
+            "supplier_inc": Sum(refund, filter=Q(charge_supplier=True), output_field=output_field),
+            "voko_inc": Sum(refund, filter=Q(charge_supplier=False), output_field=output_field),
+        }
+
+    @staticmethod
+    def _totals_from_cents(row):
+        return {key: _from_cents(row[key]) for key in ("supplier_exc", "supplier_inc", "voko_inc")}
+
+    def totals(self):
+        """
+        Return supplier_exc, supplier_inc and voko_inc totals of these
+        corrections (see OrderRound.total_corrections), in one query.
+        """
+        return self._totals_from_cents(self.aggregate(**self._totals_aggregates()))
+
+    def totals_per(self, field):
+        """
+        Like totals(), but grouped by :field: in one query.
+        Returns {<value of field>: totals}
+        """
+        rows = self.order_by().values(field).annotate(**self._totals_aggregates())
+        return {row[field]: self._totals_from_cents(row) for row in rows}
+
+    def report(self):
+        """
+        Report of these corrections: the ones charged to suppliers per
+        supplier and product, with per product the ordered amount, the
+        supplied percentage weighted by amount and the refunds (see
+        totals()), and the ones charged to VOKO.
+        The totals come from one grouped query. Returns plain data, so it
+        can be cached (see ordering.core.get_correction_report).
+        """
+        product_totals = {
+            row["order_product__product"]: row
+            for row in self.filter(charge_supplier=True)
+            .order_by()
+            .values("order_product__product")
+            .annotate(
+                amount=Sum("order_product__amount"),
+                supplied=Sum(F("order_product__amount") * F("supplied_percentage")),
+                **self._totals_aggregates(),
+            )
+        }
+
+        corrections = self.select_related(
+            "credit", "order_product__order__user", "order_product__product__supplier"
+        ).order_by(
+            "order_product__product__supplier__name",
+            "order_product__product__name",
+            "order_product__order__user__first_name",
+            "id",
+        )
+
+        suppliers = {}
+        voko = []
+        for correction in corrections:
+            order_product = correction.order_product
+            product = order_product.product
+            row = {
+                "member": order_product.order.user.get_full_name(),
+                "order_id": order_product.order_id,
+                "product": product.name,
+                "supplier": product.supplier.name,
+                "amount": order_product.amount,
+                "supplied_percentage": correction.supplied_percentage,
+                "credit": correction.credit.amount,
+            }
+            if not correction.charge_supplier:
+                voko.append(row)
+                continue
+
+            supplier = suppliers.setdefault(
+                product.supplier_id, {"name": product.supplier.name, "refund": Decimal(0), "products": {}}
+            )
+            if product.id not in supplier["products"]:
+                totals = product_totals[product.id]
+                supplier["products"][product.id] = {
+                    "name": product.name,
+                    "amount": totals["amount"],
+                    "perc_supplied": (Decimal(totals["supplied"]) / totals["amount"]).quantize(
+                        Decimal(".01"), rounding=ROUND_DOWN
+                    ),
+                    "supplier_refund": _from_cents(totals["supplier_exc"]),
+                    "member_refund": _from_cents(totals["supplier_inc"]),
+                    "corrections": [],
+                }
+                supplier["refund"] += supplier["products"][product.id]["supplier_refund"]
+            supplier["products"][product.id]["corrections"].append(row)
+
+        for supplier in suppliers.values():
+            supplier["products"] = list(supplier["products"].values())
+        return {
+            "suppliers": list(suppliers.values()),
+            "voko": sorted(voko, key=lambda row: row["member"]),
+        }
 
 
 class CorrectionManager(models.Manager):
     def get_queryset(self):
         return CorrectionQuerySet(self.model, using=self._db)
 
+    def create_many(self, order_products, supplied_percentage, notes="", charge_supplier=True):
+        """
+        Create corrections for the uncorrected ones of the :order_products:
+        queryset, with their credits, in bulk. :notes: is a string or a
+        function returning the notes for an order product.
+        Returns the corrections.
+        """
+        with transaction.atomic():
+            order_products = (
+                order_products.filter(correction__isnull=True)
+                .select_related("order", "product__supplier", "product__order_round")
+                .select_for_update(of=("self",))
+                .order_by("id")
+            )
+            corrections = [
+                self.model(
+                    order_product=order_product,
+                    supplied_percentage=supplied_percentage,
+                    notes=notes(order_product) if callable(notes) else notes,
+                    charge_supplier=charge_supplier,
+                )
+                for order_product in order_products
+            ]
+            credits = Balance.objects.create_many([correction.build_credit() for correction in corrections])
+            for correction, credit in zip(corrections, credits):
+                correction.credit = credit
+            corrections = self.bulk_create(corrections)
+
+        for order_round_id in set(correction.order_product.order.order_round_id for correction in corrections):
+            invalidate_corrections(order_round_id)
+        return corrections
+
 
 class OrderProductCorrection(TimeStampedModel):
     """
@@ -726,14 +1350,17 @@ class OrderProductCorrection(TimeStampedModel):
             (self.order_product.total_cost_price() / Decimal("100")) * (Decimal("100") - self.supplied_percentage)
         ).quantize(Decimal(".01"), rounding=ROUND_DOWN)
 
-    def _create_credit(self):
+    def build_credit(self):
+        """
+        Return the (unsaved) credit for the member
+        """
         if self.order_product.product.order_round is None:
             order_round = get_current_order_round()
         else:
             order_round = self.order_product.product.order_round
 
-        return Balance.objects.create(
-            user=self.order_product.order.user,
+        return Balance(
+            user_id=self.order_product.order.user_id,
             type="CR",
             amount=self.calculate_refund(),
             notes="Correctie in ronde %d, %dx %s, geleverd: %s%%"
@@ -747,14 +1374,82 @@ class OrderProductCorrection(TimeStampedModel):
 
     def save(self, **kwargs):
         if self.pk is None:
-            self.credit = self._create_credit()
+            self.credit = self.build_credit()
+            self.credit.save()
         super(OrderProductCorrection, self).save(**kwargs)
+        invalidate_corrections(self.order_product.order.order_round_id)
 
     def delete(self, *args, **kwargs):
         # OneToOne relation isn't cascaded in this direction :(
         # Make sure credit is deleted anyway when correction is deleted
         self.credit.delete()
         super(OrderProductCorrection, self).delete(*args, **kwargs)
+        invalidate_corrections(self.order_product.order.order_round_id)
+
+
+class RoundStatisticsManager(models.Manager):
+    def refresh(self, order_round):
+        """
+        (Re)calculate the statistics of :order_round: and return them
+        """
+        orders = Order.objects.filter(order_round=order_round, paid=True).aggregate(
+            number_of_orders=Count("id"), number_of_ordering_members=Count("user", distinct=True)
+        )
+        products = order_round.products.aggregate(
+            number_of_products=Count("id"), number_of_suppliers=Count("supplier__name", distinct=True)
+        )
+        statistics, _ = self.update_or_create(
+            order_round=order_round,
+            defaults=dict(
+                number_of_members=VokoUser.objects.filter(created__lt=order_round.open_for_orders).count(),
+                total_revenue=order_round.total_revenue(),
+                **orders,
+                **products,
+            ),
+        )
+        return statistics
+
+    def fill_missing(self, order_rounds=None):
+        """
+        Create statistics for closed :order_rounds: (default: all) that don't
+        have them yet. Return the number of rounds filled.
+        """
+        if order_rounds is None:
+            order_rounds = OrderRound.objects.all()
+        missing = order_rounds.filter(closed_for_orders__lt=datetime.now(pytz.utc), statistics__isnull=True)
+        count = 0
+        for order_round in missing:
+            self.refresh(order_round)
+            count += 1
+        return count
+
+
+class RoundStatistics(TimeStampedModel):
+    """
+    Snapshot of the figures of a closed order round, as served by the
+    orders API. Created when the round closes and refreshed when paid
+    orders of the round change afterwards.
+    """
+
+    class Meta:
+        verbose_name = "Bestelrondestatistiek"
+        verbose_name_plural = "Bestelrondestatistieken"
+
+    objects = RoundStatisticsManager()
+
+    order_round = models.OneToOneField(
+        "OrderRound", primary_key=True, related_name="statistics", on_delete=models.CASCADE
+    )
+    number_of_orders = models.IntegerField(default=0)
+    number_of_ordering_members = models.IntegerField(default=0)
+    # Members who had signed up before the round opened
+    number_of_members = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    number_of_products = models.IntegerField(default=0)
+    number_of_suppliers = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "Statistieken van %s" % self.order_round_id
 
 
 class ProductCategory(TimeStampedModel):
@@ -782,6 +1477,15 @@ class ProductUnit(TimeStampedModel):
     def __str__(self):
         return self.description
 
+    def save(self, **kwargs):
+        super(ProductUnit, self).save(**kwargs)
+        invalidate_unit_index()
+
+    def delete(self, *args, **kwargs):
+        ret = super(ProductUnit, self).delete(*args, **kwargs)
+        invalidate_unit_index()
+        return ret
+
 
 class ProductStock(TimeStampedModel):
     """Product purchase / stock"""
@@ -814,8 +1518,202 @@ class ProductStock(TimeStampedModel):
             assert orig.amount == self.amount, "Amount may not be changed!"
             assert orig.product == self.product, "Product may not be changed!"
             assert orig.type == self.type, "Type may not be changed!"
+            return super(ProductStock, self).save(**kwargs)
 
         super(ProductStock, self).save(**kwargs)
+        ProductCounter.objects.add_stock({self.product_id: self.signed_amount})
+
+    def delete(self, *args, **kwargs):
+        ProductCounter.objects.add_stock({self.product_id: -self.signed_amount})
+        return super(ProductStock, self).delete(*args, **kwargs)
+
+    @property
+    def signed_amount(self):
+        return self.amount if self.type == self.TYPE_ADDED else -self.amount
+
+
+class ProductCounterManager(models.Manager):
+    def ensure(self, product_ids):
+        """
+        Create missing counters for :product_ids:
+        """
+        self.bulk_create([ProductCounter(product_id=pid) for pid in set(product_ids)], ignore_conflicts=True)
+
+    def _add(self, field, changes):
+        changes = {pid: delta for pid, delta in changes.items() if delta}
+        if not changes:
+            return
+        self.ensure(changes)
+        for product_id, delta in changes.items():
+            self.filter(product_id=product_id).update(**{field: F(field) + delta})
+
+    def add_ordered(self, changes):
+        """
+        Atomically add to the paid amounts. :changes: is a dict of
+        product id => (positive or negative) amount.
+        """
+        self._add("ordered", changes)
+
+    def remove_ordered(self, changes):
+        """
+        Atomically subtract from the paid amounts of existing counters, in
+        one query. Missing counters aren't created, as their product may be
+        in the middle of being deleted. :changes: is a dict of
+        product id => amount.
+        """
+        changes = {pid: amount for pid, amount in changes.items() if amount}
+        if not changes:
+            return
+        self.filter(product_id__in=changes).update(
+            ordered=F("ordered")
+            - Case(
+                *[When(product_id=pid, then=Value(amount)) for pid, amount in changes.items()],
+                output_field=models.IntegerField(),
+            )
+        )
+
+    def add_stock(self, changes):
+        """
+        Atomically add to the stock. :changes: is a dict of
+        product id => (positive or negative) amount.
+        """
+        self._add("stock", changes)
+
+    def lock(self, product_ids):
+        """
+        Lock the counters of :product_ids: until the end of the current
+        transaction (in a fixed order, to prevent deadlocks).
+        Return {product id: counter}
+        """
+        self.ensure(product_ids)
+        counters = self.select_for_update().filter(product_id__in=product_ids).order_by("product_id")
+        return {counter.product_id: counter for counter in counters}
+
+    def recount(self, products=None, dry_run=False):
+        """
+        Recalculate counters from the paid order products and stock of
+        :products: (default: all products), e.g. after bulk updates that
+        bypassed the counters. Return list of (product id, stored
+        (ordered, stock), counted (ordered, stock)) for all counters that
+        were off; they're fixed unless :dry_run: is set.
+        """
+        product_ids = Product.objects.values_list("id", flat=True) if products is None else [p.pk for p in products]
+        product_ids = list(product_ids)
+        ordered = dict(
+            OrderProduct.objects.filter(order__paid=True, product_id__in=product_ids)
+            .order_by()
+            .values_list("product")
+            .annotate(Sum("amount"))
+        )
+        stock = dict(
+            ProductStock.objects.filter(product_id__in=product_ids)
+            .order_by()
+            .values_list("product")
+            .annotate(
+                total=Sum(
+                    Case(
+                        When(type=ProductStock.TYPE_LOST, then=-F("amount")),
+                        default=F("amount"),
+                    )
+                )
+            )
+        )
+        with transaction.atomic():
+            if not dry_run:
+                self.ensure(product_ids)
+            counters = {
+                counter.product_id: counter
+                for counter in self.select_for_update().filter(product_id__in=product_ids).order_by("product_id")
+            }
+            mismatches = []
+            for product_id in sorted(product_ids):
+                counter = counters.get(product_id, ProductCounter(product_id=product_id))
+                counted = (ordered.get(product_id, 0), stock.get(product_id, 0))
+                if (counter.ordered, counter.stock) != counted:
+                    mismatches.append((product_id, (counter.ordered, counter.stock), counted))
+                    counter.ordered, counter.stock = counted
+            if not dry_run:
+                self.bulk_update([counters[product_id] for product_id, _, _ in mismatches], ["ordered", "stock"])
+        return mismatches
+
+
+class ProductCounter(models.Model):
+    """
+    Running totals of a product, updated atomically whenever orders are paid
+    or stock changes, so availability is read from a single row instead of
+    being summed, and can be locked while reserving products.
+    """
+
+    class Meta:
+        verbose_name = "Productteller"
+        verbose_name_plural = "Producttellers"
+
+    objects = ProductCounterManager()
+
+    product = models.OneToOneField("Product", primary_key=True, related_name="counter", on_delete=models.CASCADE)
+    # Total amount in paid orders
+    ordered = models.IntegerField(default=0)
+    # Stock added minus stock lost
+    stock = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "%s: %d besteld, %d voorraad" % (self.product_id, self.ordered, self.stock)
+
+
+class ProductQuerySet(models.query.QuerySet):
+    def delete(self):
+        with grouped_deletes():
+            return super(ProductQuerySet, self).delete()
+
+    def uncorrected_order_products(self):
+        """
+        Return the paid OrderProducts of these products that have no
+        correction yet, i.e. the ones create_corrections() would credit.
+        """
+        return OrderProduct.objects.filter(product__in=self, order__paid=True, correction__isnull=True)
+
+    def create_corrections(self):
+        """
+        Create 0% delivered-corrections for all paid OrderProducts of these
+        products, in bulk (see Product.create_corrections).
+        Returns the corrections.
+        """
+        return OrderProductCorrection.objects.create_many(
+            self.uncorrected_order_products(),
+            supplied_percentage=0,
+            notes=lambda order_product: 'Product niet geleverd: "%s" (%s) [%s]'
+            % (order_product.product.name, order_product.product.supplier.name, order_product.product_id),
+            charge_supplier=True,
+        )
+
+    def with_availability(self, user_order=None):
+        """
+        Annotate products with their paid ordered amount (ordered_total),
+        stock (stock_total) and the resulting stock_available, read from
+        their counters, so the availability properties of Product don't
+        need extra queries.
+        When :user_order: is given, also annotate the amount ordered in that
+        order (ordered_amount, None when not ordered).
+        """
+        qs = self.annotate(
+            ordered_total=Coalesce(F("counter__ordered"), 0),
+            stock_total=Coalesce(F("counter__stock"), 0),
+        ).annotate(stock_available=F("stock_total") - F("ordered_total"))
+
+        if user_order is not None:
+            qs = qs.annotate(
+                ordered_amount=Subquery(
+                    OrderProduct.objects.filter(order=user_order, product=OuterRef("pk")).values("amount")[:1]
+                )
+            )
+        return qs
+
+    def exclude_sold_out_stock(self):
+        """
+        Leave out stock products without stock left.
+        Requires with_availability().
+        """
+        return self.filter(Q(order_round__isnull=False) | Q(stock_available__gt=0))
 
 
 class Product(TimeStampedModel):
@@ -823,6 +1721,8 @@ class Product(TimeStampedModel):
         verbose_name = "Product"
         verbose_name_plural = "Producten"
 
+    objects = ProductQuerySet.as_manager()
+
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -852,6 +1752,10 @@ class Product(TimeStampedModel):
 
     # TODO: Prevent deleting of product when it has (paid) orders
 
+    def delete(self, *args, **kwargs):
+        with grouped_deletes():
+            return super(Product, self).delete(*args, **kwargs)
+
     def __str__(self):
         if self.is_stock_product():
             return "[voorraadproduct] %s (%s)" % (self.name, self.supplier)
@@ -893,33 +1797,43 @@ class Product(TimeStampedModel):
         rounded = new_price.quantize(Decimal(".01"), rounding=ROUND_UP)
         return rounded
 
+    def _counts(self):
+        """
+        Return (amount ordered, stock), from the with_availability()
+        annotations or else from the product's counter.
+        """
+        if hasattr(self, "ordered_total"):
+            return self.ordered_total, self.stock_total
+
+        return ProductCounter.objects.filter(product=self).values_list("ordered", "stock").first() or (0, 0)
+
     def all_stock(self):
         """
         Total stock bought and lost, can be used to calculate current stock by
         subtracting total orders.
         """
-        stock_added = self.stock.filter(type=ProductStock.TYPE_ADDED)
-        stock_lost = self.stock.filter(type=ProductStock.TYPE_LOST)
-        total_added = sum([s.amount for s in stock_added])
-        total_lost = sum([s.amount for s in stock_lost])
-
-        return total_added - total_lost
+        return self._counts()[1]
 
-    @property
-    def amount_available(self):
+    def available_for(self, ordered, stock):
         """
-        Return how many items of this product are available.
-        Returns None when there is no maximum.
+        Return how many items are available, given the amount :ordered: and
+        the :stock:. Returns None when there is no maximum.
         """
         if self.is_stock_product():
-            return self.all_stock() - self.amount_ordered
+            return stock - ordered
 
         if self.maximum_total_order is None:
             return
 
-        maximum = self.maximum_total_order
-        total = self.amount_ordered
-        return maximum - total
+        return self.maximum_total_order - ordered
+
+    @property
+    def amount_available(self):
+        """
+        Return how many items of this product are available.
+        Returns None when there is no maximum.
+        """
+        return self.available_for(*self._counts())
 
     def verbose_availability(self):
         """
@@ -943,9 +1857,7 @@ class Product(TimeStampedModel):
         """
         Return how many items of this product are ordered
         """
-        orderproducts = self.orderproducts.filter(order__paid=True)
-        total = sum(op.amount for op in orderproducts)
-        return total
+        return self._counts()[0]
 
     @property
     def percentage_available(self):
@@ -981,13 +1893,7 @@ class Product(TimeStampedModel):
         Can be used to automatically create OrderProductCorrections
         when the product was ordered, but not supplied at all.
         """
-        for order_product in self.orderproducts.filter(correction__isnull=True, order__paid=True):
-            OrderProductCorrection.objects.create(
-                order_product=order_product,
-                supplied_percentage=0,
-                notes='Product niet geleverd: "%s" (%s) [%s]' % (self.name, self.supplier.name, self.id),
-                charge_supplier=True,
-            )
+        return Product.objects.filter(pk=self.pk).create_corrections()
 
     def determine_if_product_is_new_and_set_label(self):
         """
@@ -1012,35 +1918,114 @@ class Product(TimeStampedModel):
         return self.order_round is None
 
 
+def label_new_products(products):
+    """
+    Set new=True on the (unsaved) :products: of which no similar product
+    (same name, supplier and unit) was in the previous order round, like
+    Product.determine_if_product_is_new_and_set_label does for one.
+    Return the products labeled new, with the id of that previous round.
+    """
+    previous_round_ids = set(product.order_round_id - 1 for product in products if product.order_round_id)
+    existing_round_ids = set(OrderRound.objects.filter(id__in=previous_round_ids).values_list("id", flat=True))
+    signatures = set(
+        Product.objects.filter(order_round_id__in=existing_round_ids).values_list(
+            "order_round", "name", "supplier", "unit"
+        )
+    )
+
+    labeled = []
+    for product in products:
+        if not product.order_round_id or product.order_round_id - 1 not in existing_round_ids:
+            continue
+        previous_round_id = product.order_round_id - 1
+        if (previous_round_id, product.name, product.supplier_id, product.unit_id) not in signatures:
+            product.new = True
+            labeled.append((product, previous_round_id))
+    return labeled
+
+
+class DraftProductManager(models.Manager):
+    def create_many(self, supplier, order_round, data):
+        """
+        Create validated DraftProducts for the :data: dicts in bulk
+        """
+        drafts = [self.model(supplier=supplier, order_round=order_round, data=product_data) for product_data in data]
+        self.validate_many(drafts, save=False)
+        return self.bulk_create(drafts)
+
+    def publish(self, drafts):
+        """
+        Create the Products of the valid :drafts: (a queryset) in bulk,
+        with their 'new' label set (see label_new_products), and
+        delete all :drafts:. Returns the products.
+        """
+        with transaction.atomic():
+            draft_list = list(drafts.select_related("supplier", "order_round"))
+            units = find_units(draft.data["unit"] for draft in draft_list if draft.is_valid)
+            categories = {category.name.lower(): category for category in ProductCategory.objects.all()}
+            products = [draft.build_product(units, categories) for draft in draft_list if draft.is_valid]
+
+            labeled = label_new_products(products)
+            products = Product.objects.bulk_create(products)
+            drafts.delete()
+
+        with buffered_events():
+            for product, previous_round_id in labeled:
+                log_event(
+                    event="Setting product %s to 'new' because I could not find a "
+                    "similar product in order round %d" % (product, previous_round_id)
+                )
+        return products
+
+    def validate_many(self, drafts, save=True):
+        """
+        Validate :drafts: resolving all their units at once, and save the
+        outcome with one query
+        """
+        units = find_units(draft.data["unit"] for draft in drafts)
+        for draft in drafts:
+            draft.validate(units, save=False)
+        if save:
+            self.bulk_update(drafts, ["is_valid", "validation_error"])
+
+
 class DraftProduct(TimeStampedModel):
     """
     Product Draft, used to create new products in the backend
     """
 
+    objects = DraftProductManager()
+
     id = models.AutoField(primary_key=True)
     data = JSONField()
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
     order_round = models.ForeignKey(OrderRound, on_delete=models.CASCADE)
-    is_valid = models.BooleanField(default=False)
+    # None until validated
+    is_valid = models.BooleanField(default=None, null=True)
     validation_error = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
         return "[%d] Draft Product [%s]" % (self.id, self.data)
 
-    def validate(self):
+    def validate(self, units=None, save=True):
+        """
+        :units: optionally the find_units() result for the units of all
+        drafts being validated
+        """
         self.is_valid = False
         if not self._valid_name(self.data["name"]):
             self.validation_error = "Naam onjuist"
         elif not self._valid_price(self.data["base_price"]):
             self.validation_error = "Prijs onjuist"
-        elif not self._valid_unit(self.data["unit"]):
+        elif not self._valid_unit(self.data["unit"], units):
             self.validation_error = "Eenheid onjuist"
         elif not self._valid_max(self.data["maximum_total_order"]):
             self.validation_error = "Aantal onjuist"
         else:
             self.is_valid = True
             self.validation_error = None
-        self.save()
+        if save:
+            self.save()
 
     @staticmethod
     def _valid_name(name):
@@ -1058,7 +2043,9 @@ class DraftProduct(TimeStampedModel):
             return False
 
     @staticmethod
-    def _valid_unit(unit):
+    def _valid_unit(unit, units=None):
+        if units is not None and unit in units:
+            return True
         try:
             find_unit(unit)
             return True
@@ -1072,15 +2059,39 @@ class DraftProduct(TimeStampedModel):
         except ValueError:
             return False
 
-    def create_product(self):
+    def create_product(self, units=None, categories=None):
+        """
+        :units: optionally the find_units() result for the units of all
+        drafts being created, :categories: optionally a dict of lowercased
+        name => ProductCategory
+        """
         if not self.is_valid:
             return
 
+        product = self.build_product(units, categories)
+        product.save()
+        return product
+
+    def build_product(self, units=None, categories=None):
+        """
+        Return the (unsaved) Product of this valid draft, see create_product
+        """
         # Decide on unit & amount
         unit = self.data["unit"]
-        unit_amount, unit = find_unit(unit)
+        if units is not None and unit in units:
+            unit_amount, unit = units[unit]
+        else:
+            unit_amount, unit = find_unit(unit)
 
-        prod = Product.objects.create(
+        category = None
+        if self.data["category"]:
+            name = self.data["category"].strip()
+            if categories is not None:
+                category = categories.get(name.lower())
+            else:
+                category = ProductCategory.objects.filter(name__iexact=name).first()
+
+        return Product(
             name=self.data["name"],
             description=(self.data["description"] if self.data["description"] else ""),
             unit=unit,
@@ -1089,17 +2100,9 @@ class DraftProduct(TimeStampedModel):
             maximum_total_order=self.data["maximum_total_order"],
             supplier=self.supplier,
             order_round=self.order_round,
+            category=category,
         )
 
-        if self.data["category"]:
-            try:
-                prod.category = ProductCategory.objects.get(name__iexact=self.data["category"].strip())
-                prod.save()
-            except ProductCategory.DoesNotExist:
-                pass
-
-        return prod
-
     @property
     def product_data(self):
         return self.data["product_data"]
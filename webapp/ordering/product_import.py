@@ -0,0 +1,157 @@
+"""
+Import of supplier product lists (xlsx or csv) as DraftProducts.
+
+Columns: name, description, unit, price, maximum, category. The first row
+is a header; rows without a name are skipped.
+"""
+import csv
+import io
+
+import openpyxl
+from django.db import transaction
+
+from .models import DraftProduct
+
+COLUMNS = ("name", "description", "unit", "price", "maximum", "category")
+
+# Number of invalid rows listed in the import report
+REPORTED_ERRORS = 10
+
+
+class ImportReport(object):
+    """
+    Outcome of a product list import
+    """
+
+    def __init__(self, drafts, skipped):
+        self.drafts = drafts
+        self.skipped = skipped
+
+    @property
+    def valid(self):
+        return sum(1 for draft in self.drafts if draft.is_valid)
+
+    @property
+    def invalid(self):
+        return len(self.drafts) - self.valid
+
+    def errors(self, limit=REPORTED_ERRORS):
+        """
+        Return (row number, product name, validation error) of the first
+        :limit: invalid rows
+        """
+        errors = [(draft.data.get("row"), draft.data["name"], draft.validation_error)
+                  for draft in self.drafts if not draft.is_valid]
+        return errors[:limit]
+
+    def __str__(self):
+        return "%d producten ingelezen (%d geldig, %d ongeldig), %d lege rijen overgeslagen." % (
+            len(self.drafts), self.valid, self.invalid, self.skipped)
+
+
+def convert_price(price):
+    if type(price) is str:
+        # Strip off euro sign, accept a decimal comma
+        price = price.strip().lstrip("€").replace(",", ".")
+    else:
+        price = str(price)
+    price = price.strip()
+    return price
+
+
+def convert_number(value):
+    if isinstance(value, (int, float)):
+        return value
+    str_value = str(value or "").strip()  # Treat whitespace, empty string and None as None
+    if len(str_value) == 0:
+        return None
+    try:
+        return float(str_value.replace(",", "."))
+    except ValueError:
+        return str_value  # Reported by DraftProduct.validate()
+
+
+def read_xlsx(file):
+    """
+    Yield the rows of the active sheet of the xlsx :file: as tuples of
+    values, reading it in read-only mode straight from the upload
+    """
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def read_csv(file):
+    """
+    Yield the rows of the csv :file: as tuples of values (None for empty
+    cells). Accepts UTF-8 and, as saved by Excel, Windows-1252; the
+    delimiter (comma, semicolon or tab) is detected.
+    """
+    content = file.read()
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("cp1252")
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    for row in csv.reader(io.StringIO(text), dialect):
+        yield tuple(value.strip() or None for value in row)
+
+
+def read_product_list(file):
+    """
+    Yield the rows of the uploaded product list :file:, by extension
+    """
+    if file.name.lower().endswith(".csv"):
+        return read_csv(file)
+    return read_xlsx(file)
+
+
+def parse_rows(rows):
+    """
+    Return (list of DraftProduct data dicts, number of skipped rows) for
+    the product list :rows:
+    """
+    data = []
+    skipped = 0
+    for idx, row in enumerate(rows):
+        if idx == 0:
+            continue  # header
+
+        row = tuple(row[:len(COLUMNS)]) + (None,) * (len(COLUMNS) - len(row))
+        name, description, unit, price, maximum, category = row
+        if not name:
+            skipped += 1
+            continue
+
+        data.append({
+            'name': name,
+            'description': description if description else "",
+            'unit': unit,
+            'base_price': convert_price(price),
+            'maximum_total_order': convert_number(maximum),
+            'category': category,
+            'row': idx + 1,
+        })
+    return data, skipped
+
+
+def import_product_list(file, supplier, order_round):
+    """
+    Replace the DraftProducts of :supplier: in :order_round: with the
+    products in the uploaded list :file:, validated and inserted in bulk.
+    Returns an ImportReport.
+    """
+    data, skipped = parse_rows(read_product_list(file))
+
+    with transaction.atomic():
+        DraftProduct.objects.filter(order_round=order_round, supplier=supplier).delete()
+        drafts = DraftProduct.objects.create_many(supplier, order_round, data)
+    return ImportReport(drafts, skipped)
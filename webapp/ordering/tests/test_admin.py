@@ -0,0 +1,147 @@
+import csv
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.tests.factories import VokoUserFactory
+from finance.models import Balance
+from finance.tests.factories import PaymentFactory
+from ordering.admin import dutch_decimal, export_orders_for_financial_admin
+from ordering.models import Order, OrderProductCorrection
+from ordering.tests.factories import OrderFactory, OrderProductFactory, OrderRoundFactory, ProductFactory
+from vokou.testing import VokoTestCase
+
+
+class TestOrderAdmin(VokoTestCase):
+    def setUp(self):
+        self.admin_user = VokoUserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin_user)
+
+    def _create_orders(self, count):
+        for _ in range(count):
+            order = OrderFactory(paid=True, finalized=True)
+            OrderProductFactory(order=order)
+            OrderProductFactory(order=order)
+
+    def test_changelist_queries_do_not_depend_on_number_of_orders(self):
+        url = reverse("admin:ordering_order_changelist")
+        self.client.get(url)  # warm up caches
+
+        self._create_orders(2)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self._create_orders(5)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(few), len(many))
+
+    def test_change_page_shows_order_products(self):
+        order = OrderFactory(paid=True, finalized=True)
+        order_product = OrderProductFactory(order=order)
+
+        response = self.client.get(reverse("admin:ordering_order_change", args=(order.pk,)))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'name="orderproducts-0-product" value="%d"' % order_product.product_id)
+
+
+class TestExportOrdersForFinancialAdmin(VokoTestCase):
+    def setUp(self):
+        self.round = OrderRoundFactory(transaction_costs=Decimal("0.35"))
+
+    def _create_paid_order(self, paid=Decimal("10.00")):
+        order = OrderFactory(order_round=self.round)
+        OrderProductFactory(order=order, amount=2, retail_price=Decimal("3.50"))
+        order.debit = Balance.objects.create(user=order.user, type="DR", amount=order.total_price)
+        order.paid = True
+        order.save()
+        PaymentFactory(order=order, amount=paid, succeeded=True)
+        PaymentFactory(order=order, amount=Decimal("99.00"), succeeded=False)
+        return order
+
+    def _export(self):
+        response = export_orders_for_financial_admin(None, None, Order.objects.all())
+        return list(csv.reader(line.decode("utf-8") for line in response.streaming_content))
+
+    def test_export_streams_one_row_per_paid_order(self):
+        order = self._create_paid_order()
+        OrderFactory(order_round=self.round)
+        total = order.total_price
+
+        rows = self._export()
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][0], "Bestelling ID")
+        self.assertEqual(
+            rows[1],
+            [
+                str(order.id),
+                "{0} ({1})".format(order.user, order.user_id),
+                str(order.modified.date()),
+                str(self.round.id),
+                "7,00",
+                dutch_decimal(order.member_fee),
+                "0,35",
+                "10,00",
+                dutch_decimal(total - Decimal("10.00")),
+                dutch_decimal(total),
+            ],
+        )
+
+    def test_export_queries_do_not_depend_on_number_of_orders(self):
+        self._create_paid_order()
+        with CaptureQueriesContext(connection) as few:
+            self._export()
+
+        for _ in range(4):
+            self._create_paid_order()
+        with CaptureQueriesContext(connection) as many:
+            self._export()
+
+        self.assertEqual(len(few), len(many))
+
+
+class TestProductAdmin(VokoTestCase):
+    def setUp(self):
+        self.admin_user = VokoUserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin_user)
+
+    def _create_corrections(self, products, **extra):
+        return self.client.post(
+            reverse("admin:ordering_product_changelist"),
+            {"action": "create_corrections_for_products", "_selected_action": [p.pk for p in products], **extra},
+        )
+
+    def test_create_corrections_action_asks_for_confirmation(self):
+        products = [ProductFactory(), ProductFactory()]
+        order_products = [
+            OrderProductFactory(product=product, order__paid=True, amount=2, retail_price=Decimal("1.50"))
+            for product in products
+        ]
+        unpaid = OrderProductFactory(product=products[0], order__paid=False)
+
+        response = self._create_corrections(products)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "ordering/admin/confirm_corrections.html")
+        self.assertCountEqual(response.context["order_products"], order_products)
+        self.assertNotIn(unpaid, response.context["order_products"])
+        self.assertEqual(response.context["total"], Decimal("6.00"))
+        self.assertFalse(OrderProductCorrection.objects.exists())
+
+    def test_create_corrections_action(self):
+        products = [ProductFactory(), ProductFactory()]
+        order_products = [OrderProductFactory(product=product, order__paid=True) for product in products]
+        OrderProductFactory(product=products[0], order__paid=False)
+
+        response = self._create_corrections(products, post="yes")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertCountEqual(
+            OrderProductCorrection.objects.values_list("order_product", flat=True), [op.pk for op in order_products]
+        )
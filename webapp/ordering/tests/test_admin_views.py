@@ -1,10 +1,16 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ordering.models import ProductStock, Product
+from ordering.models import ProductStock, Product, OrderProductCorrection
 from ordering.tests.factories import (
     ProductFactory, ProductStockFactory,
     OrderRoundFactory, SupplierFactory, ProductCategoryFactory,
-    ProductUnitFactory)
+    ProductUnitFactory, OrderFactory, OrderProductFactory,
+    OrderProductCorrectionFactory)
 from vokou.testing import VokoTestCase, suppressWarnings
 
 
@@ -274,3 +280,157 @@ class TestProductApiView(VokoTestCase):
 
         self.assertEqual(stock.amount, 13)
         self.assertEqual(stock.product, product)
+
+
+class TestOrderAdminCorrectionJson(VokoTestCase):
+    def setUp(self):
+        self.login(group="Uitdeelcoordinatoren")
+        self.round = OrderRoundFactory()
+        self.url = reverse('orderadmin_correction_json', args=(self.round.pk,))
+
+    def _order_product(self, **kwargs):
+        order = OrderFactory(order_round=self.round, paid=True, **kwargs)
+        return OrderProductFactory(order=order, product__order_round=self.round)
+
+    def _get(self, **params):
+        ret = self.client.get(self.url, params)
+        self.assertEqual(ret.status_code, 200)
+        return ret
+
+    def test_lists_uncorrected_products_of_paid_orders(self):
+        order_product = self._order_product()
+        OrderProductCorrectionFactory(
+            order_product=OrderProductFactory(order=order_product.order,
+                                              product__order_round=self.round))
+        unpaid = OrderFactory(order_round=self.round, paid=False)
+        OrderProductFactory(order=unpaid, product__order_round=self.round)
+        order = order_product.order
+
+        data = json.loads(self._get().content)
+
+        self.assertEqual(data, [{
+            "name": order.user.get_full_name(),
+            "id": order.user.id,
+            "orders": [{
+                "id": order.id,
+                "total_price": float(order.total_price),
+                "order_products": [{
+                    "id": order_product.id,
+                    "name": "%s (%s)" % (order_product.product.name,
+                                         order_product.product.supplier.name),
+                    "amount": order_product.amount,
+                }],
+            }],
+        }])
+
+    def test_queries_do_not_depend_on_number_of_orders(self):
+        self._order_product()
+        self._get()
+        cache.clear()
+        with CaptureQueriesContext(connection) as one_order:
+            self._get()
+
+        for _ in range(3):
+            self._order_product()
+        cache.clear()
+        self._get()
+        cache.clear()
+        with CaptureQueriesContext(connection) as four_orders:
+            self._get()
+
+        self.assertEqual(len(four_orders), len(one_order))
+
+    def test_json_is_cached_until_a_correction_is_made(self):
+        order_product = self._order_product()
+        self._get()
+
+        with CaptureQueriesContext(connection) as cached:
+            self._get()
+        self.assertFalse([q for q in cached if "ordering_orderproduct" in q["sql"]])
+
+        OrderProductCorrectionFactory(order_product=order_product)
+        self.assertEqual(json.loads(self._get().content), [])
+
+    def test_changes_since_version(self):
+        first = self._order_product()
+        second = self._order_product()
+        correction = OrderProductCorrectionFactory(order_product=first)
+
+        version = int(self._get()["X-Correction-Version"])
+        self.assertEqual(version, correction.id)
+        self.assertEqual(self._get(since=version).json(),
+                         {"version": version, "corrected": []})
+
+        new_correction = OrderProductCorrectionFactory(order_product=second)
+        self.assertEqual(self._get(since=version).json(),
+                         {"version": new_correction.id,
+                          "corrected": [second.id]})
+
+    def test_invalid_since(self):
+        ret = self.client.get(self.url, {"since": "foo"})
+        self.assertEqual(ret.status_code, 400)
+
+
+class TestOrderAdminCorrection(VokoTestCase):
+    def setUp(self):
+        self.login(group="Uitdeelcoordinatoren")
+        self.round = OrderRoundFactory()
+        self.url = reverse('orderadmin_correction', args=(self.round.pk,))
+        order = OrderFactory(order_round=self.round, paid=True)
+        self.order_product = OrderProductFactory(
+            order=order, product__order_round=self.round)
+        self.data = {
+            "member_id": order.user_id,
+            "order_id": order.id,
+            "order_product_id": self.order_product.id,
+            "supplied_percentage": 50,
+            "notes": "",
+        }
+
+    def test_correction_report_is_cached_until_corrections_change(self):
+        OrderProductCorrectionFactory(order_product=self.order_product)
+        ret = self.client.get(self.url)
+        self.assertEqual(ret.status_code, 200)
+        self.assertContains(ret, self.order_product.product.name)
+
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(self.url)
+        self.assertFalse([q for q in cached if "ordering_orderproductcorrection" in q["sql"]])
+
+        other = OrderProductFactory(order__order_round=self.round, order__paid=True,
+                                    product__order_round=self.round)
+        OrderProductCorrectionFactory(order_product=other)
+        self.assertContains(self.client.get(self.url), other.product.name)
+
+    def test_correction_report_queries_do_not_depend_on_number_of_corrections(self):
+        def corrections_page(count):
+            for _ in range(count):
+                OrderProductCorrectionFactory(
+                    order_product__order__order_round=self.round,
+                    order_product__product__order_round=self.round,
+                    charge_supplier=bool(count % 2))
+            self.client.get(self.url)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(self.url).status_code, 200)
+            return len(queries)
+
+        self.assertEqual(corrections_page(1), corrections_page(4))
+
+    def test_creates_correction_and_redirects(self):
+        ret = self.client.post(self.url, self.data)
+        self.assertRedirects(ret, self.url, fetch_redirect_response=False)
+        self.assertTrue(OrderProductCorrection.objects.filter(
+            order_product=self.order_product).exists())
+
+    def test_ajax_post_returns_correction(self):
+        ret = self.client.post(self.url, self.data,
+                               HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(ret.status_code, 200)
+
+        correction = OrderProductCorrection.objects.get()
+        self.assertEqual(ret.json(), {
+            "id": correction.id,
+            "order_product_id": self.order_product.id,
+            "credit": str(correction.credit.amount),
+        })
@@ -2,19 +2,29 @@ from datetime import datetime, timedelta
 from pytz import UTC
 from freezegun import freeze_time
 from constance import config
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from ordering.core import (
+    find_unit,
+    find_units,
+    get_cart,
     get_current_order_round,
+    request_cache,
     get_latest_order_round,
+    update_order_products,
     update_totals_for_products_with_max_order_amounts,
     create_orderround_ahead,
 )
-from ordering.models import OrderProduct
+from ordering.models import Order, OrderProduct, Product
 from ordering.tests.factories import (
     OrderRoundFactory,
     OrderFactory,
     ProductFactory,
     OrderProductFactory,
     ProductStockFactory,
+    ProductUnitFactory,
 )
 from vokou.testing import VokoTestCase
 
@@ -130,6 +140,139 @@ class TestGetCurrentOrderRound(VokoTestCase):
         self.assertEqual(get_current_order_round(), round1)
 
 
+class TestCurrentOrderRoundCache(VokoTestCase):
+    def setUp(self):
+        self.mock_datetime = self.patch("ordering.core.datetime")
+        self.mock_datetime.now.return_value = datetime(2014, 10, 28, 0, 0, tzinfo=UTC)
+        self.round = OrderRoundFactory(
+            open_for_orders=datetime(2014, 10, 27, 0, 0, tzinfo=UTC),
+            closed_for_orders=datetime(2014, 10, 31, 19, 0, tzinfo=UTC),
+            collect_datetime=datetime(2014, 11, 5, 17, 30, tzinfo=UTC),
+        )
+
+    def test_cached_round_is_returned_without_queries(self):
+        self.assertEqual(get_current_order_round(), self.round)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_current_order_round(), self.round)
+
+    def test_saving_a_round_invalidates_cache(self):
+        self.assertEqual(get_current_order_round(), self.round)
+        self.round.collect_datetime = datetime(2014, 10, 27, 12, 0, tzinfo=UTC)
+        self.round.save()
+        self.assertEqual(get_current_order_round().collect_datetime, self.round.collect_datetime)
+
+    def test_crossing_a_boundary_invalidates_cache(self):
+        future = OrderRoundFactory(
+            open_for_orders=datetime(2014, 11, 10, 0, 0, tzinfo=UTC),
+            closed_for_orders=datetime(2014, 11, 14, 19, 0, tzinfo=UTC),
+            collect_datetime=datetime(2014, 11, 19, 17, 30, tzinfo=UTC),
+        )
+        self.assertEqual(get_current_order_round(), self.round)
+
+        self.mock_datetime.now.return_value = datetime(2014, 11, 6, 0, 0, tzinfo=UTC)
+        self.assertEqual(get_current_order_round(), future)
+
+    def test_request_cache_memoizes_within_scope(self):
+        with request_cache():
+            first = get_current_order_round()
+            self.assertIs(get_current_order_round(), first)
+        self.assertIsNot(get_current_order_round(), first)
+
+
+class TestFindUnit(VokoTestCase):
+    def setUp(self):
+        self.kilo = ProductUnitFactory(name="Kilogram", description="Kilo", abbreviations="kg. KGR")
+        self.piece = ProductUnitFactory(name="Stuk", description="Stuks", abbreviations="st")
+
+    def test_finds_unit_by_name_description_and_abbreviation(self):
+        self.assertEqual(find_unit("kilogram"), (1, self.kilo))
+        self.assertEqual(find_unit("2 KILO"), (2, self.kilo))
+        self.assertEqual(find_unit("500 kg"), (500, self.kilo))
+        self.assertEqual(find_unit("3kgr"), (3, self.kilo))
+        self.assertEqual(find_unit("6 stuks"), (6, self.piece))
+
+    def test_name_goes_before_description_and_abbreviation(self):
+        other = ProductUnitFactory(name="st", description="Stapel", abbreviations="")
+        self.assertEqual(find_unit("st"), (1, other))
+
+    def test_unknown_unit_raises(self):
+        with self.assertRaises(RuntimeError):
+            find_unit("liter")
+        with self.assertRaises(RuntimeError):
+            find_unit("!")
+
+    def test_index_is_invalidated_when_a_unit_changes(self):
+        find_unit("kg")
+        ProductUnitFactory(name="Liter", description="Liter", abbreviations="l")
+        self.assertEqual(find_unit("1 l")[1].name, "Liter")
+
+        self.piece.abbreviations = "stk"
+        self.piece.save()
+        self.assertEqual(find_unit("stk"), (1, self.piece))
+
+        self.kilo.delete()
+        with self.assertRaises(RuntimeError):
+            find_unit("kg")
+
+    def test_find_units_without_extra_queries(self):
+        rows = ["1 kg", "2 stuks", "1 kg", "foo!", None]
+        with request_cache():
+            find_unit("kg")
+            with CaptureQueriesContext(connection) as queries:
+                units = find_units(rows)
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(units, {"1 kg": (1, self.kilo), "2 stuks": (2, self.piece)})
+
+
+class TestGetCart(VokoTestCase):
+    def setUp(self):
+        self.round = OrderRoundFactory()
+        self.order = OrderFactory(order_round=self.round)
+        self.user = self.order.user
+
+    def test_cart_has_count_and_total_of_open_order(self):
+        OrderProductFactory(order=self.order, amount=2, retail_price=Decimal("1.25"))
+        OrderProductFactory(order=self.order, amount=1, retail_price=Decimal("3.00"))
+
+        cart = get_cart(self.user)
+
+        self.assertEqual(cart.order, self.order)
+        self.assertEqual(cart.count, 2)
+        self.assertEqual(cart.total_price, Order.objects.get(pk=self.order.pk).total_price)
+
+    def test_cart_is_empty_without_open_order(self):
+        self.order.paid = True
+        self.order.save()
+
+        cart = get_cart(self.user)
+
+        self.assertIsNone(cart.order)
+        self.assertEqual((cart.count, cart.total_price), (0, 0))
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_cart_is_memoized_per_request(self):
+        with request_cache():
+            get_current_order_round()
+            with CaptureQueriesContext(connection) as queries:
+                first = get_cart(self.user)
+                self.assertIs(get_cart(self.user), first)
+            self.assertEqual(len(queries), 1)
+
+    def test_cart_is_invalidated_when_order_products_change(self):
+        with request_cache():
+            self.assertEqual(get_cart(self.user).count, 0)
+
+            order_product = OrderProductFactory(order=self.order)
+            self.assertEqual(get_cart(self.user).count, 1)
+
+            order_product.delete()
+            self.assertEqual(get_cart(self.user).count, 0)
+
+            update_order_products(self.order, {ProductFactory(order_round=self.round).id: 2})
+            self.assertEqual(get_cart(self.user).count, 1)
+
+
 class TestUpdateOrderTotals(VokoTestCase):
     def setUp(self):
         self.round = OrderRoundFactory()
@@ -219,6 +362,72 @@ class TestUpdateOrderTotals(VokoTestCase):
         self.assertEqual(2, order2_product.amount)
 
 
+class TestUpdateOrderProducts(VokoTestCase):
+    def setUp(self):
+        self.round = OrderRoundFactory()
+        self.order = OrderFactory(order_round=self.round)
+
+    def test_creates_updates_and_deletes_order_products(self):
+        new_product = ProductFactory(order_round=self.round)
+        changed = OrderProductFactory(order=self.order, product__order_round=self.round, amount=1)
+        removed = OrderProductFactory(order=self.order, product__order_round=self.round, amount=1)
+
+        rejected = update_order_products(
+            self.order,
+            {new_product.id: 3, changed.product_id: 5, removed.product_id: 0},
+        )
+
+        self.assertEqual(rejected, [])
+        created = self.order.orderproducts.get(product=new_product)
+        self.assertEqual(created.amount, 3)
+        self.assertEqual(created.retail_price, new_product.retail_price)
+        self.assertEqual(created.base_price, new_product.base_price)
+        self.assertEqual(OrderProduct.objects.get(pk=changed.pk).amount, 5)
+        self.assertFalse(OrderProduct.objects.filter(pk=removed.pk).exists())
+
+    def test_product_exceeding_availability_is_rejected(self):
+        product = ProductFactory(order_round=self.round, maximum_total_order=10)
+        other_order = OrderFactory(order_round=self.round, finalized=True, paid=True)
+        OrderProductFactory(order=other_order, product=product, amount=8)
+
+        rejected = update_order_products(self.order, {product.id: 5})
+
+        self.assertEqual(rejected, [product])
+        self.assertFalse(self.order.orderproducts.exists())
+
+    def test_unknown_product_raises_and_changes_nothing(self):
+        product = ProductFactory(order_round=self.round)
+
+        with self.assertRaises(Product.DoesNotExist):
+            update_order_products(self.order, {product.id: 1, product.id + 1000: 1})
+
+        self.assertFalse(self.order.orderproducts.exists())
+
+    def test_number_of_queries_does_not_depend_on_number_of_products(self):
+        products = ProductFactory.create_batch(5, order_round=self.round, maximum_total_order=100)
+        for product in products[:2]:
+            OrderProductFactory(order=self.order, product=product, amount=1)
+        amounts = {products[0].id: 0, products[1].id: 2}
+        amounts.update({product.id: 1 for product in products[2:]})
+
+        # products, order products, begin, collect + cascade + delete +
+        # order total, update, insert, order total, commit
+        with self.assertNumQueries(11):
+            update_order_products(self.order, amounts)
+
+        self.assertEqual(self.order.orderproducts.count(), 4)
+
+    def test_order_total_is_updated(self):
+        products = ProductFactory.create_batch(2, order_round=self.round)
+        OrderProductFactory(order=self.order, product=products[0], amount=1)
+
+        update_order_products(self.order, {products[0].id: 3, products[1].id: 2})
+
+        expected = sum(op.total_retail_price for op in self.order.orderproducts.all())
+        self.assertEqual(self.order.products_total, expected)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).products_total_amount, expected)
+
+
 class TestGetLastOrderRound(VokoTestCase):
     def setUp(self):
         now = datetime.now(tz=UTC)
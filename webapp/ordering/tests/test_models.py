@@ -1,13 +1,29 @@
+import threading
+from io import StringIO
 from decimal import Decimal
-from unittest import skip
+from unittest import skip, skipUnless
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch
 from pytz import UTC
+from accounts.models import UserProfile
 from accounts.tests.factories import VokoUserFactory
 from finance.models import Balance
 from finance.tests.factories import BalanceFactory
-from ordering.models import Order, OrderProduct, OrderProductCorrection, OrderRound, Product, ProductStock
+from ordering.models import (
+    Order,
+    OrderProduct,
+    OrderProductCorrection,
+    OrderRound,
+    Product,
+    ProductCounter,
+    ProductStock,
+    RoundStatistics,
+    label_new_products,
+)
 from ordering.tests.factories import (
     SupplierFactory,
     OrderFactory,
@@ -186,6 +202,110 @@ class TestOrderRoundModel(VokoTestCase):
         OrderProductCorrectionFactory(order_product__order__order_round=order_round, order_product__order__paid=True)
         # TODO: How do we handle (partly) lost profit of corrections?
 
+    def test_total_revenue(self):
+        order_round = OrderRoundFactory()
+        orderprod1 = OrderProductFactory(order__order_round=order_round, order__paid=True)
+        orderprod2 = OrderProductFactory(order__order_round=order_round, order__paid=True)
+        OrderProductFactory(order__order_round=order_round, order__paid=False)
+
+        self.assertEqual(
+            order_round.total_revenue(), orderprod1.total_retail_price + orderprod2.total_retail_price
+        )
+
+    def test_total_corrections_are_rounded_down_per_correction(self):
+        order_round = OrderRoundFactory()
+        for _ in range(3):
+            OrderProductCorrectionFactory(
+                order_product__order__order_round=order_round,
+                order_product__amount=3,
+                order_product__retail_price=Decimal("0.35"),
+                order_product__base_price=Decimal("0.33"),
+                supplied_percentage=33,
+            )
+
+        # 3 x 0.35 x 67% = 0.7035 -> 0.70; 3 x 0.33 x 67% = 0.6633 -> 0.66
+        self.assertEqual(
+            order_round.total_corrections(),
+            {"supplier_inc": Decimal("2.10"), "voko_inc": Decimal("0"), "supplier_exc": Decimal("1.98")},
+        )
+
+    def test_order_totals_per_supplier_in_one_query(self):
+        order_round = OrderRoundFactory()
+        supplier1 = SupplierFactory()
+        supplier2 = SupplierFactory()
+        op1 = OrderProductFactory(product__supplier=supplier1, order__order_round=order_round, order__paid=True)
+        op2 = OrderProductFactory(product__supplier=supplier1, order__order_round=order_round, order__paid=True)
+        op3 = OrderProductFactory(product__supplier=supplier2, order__order_round=order_round, order__paid=True)
+
+        with self.assertNumQueries(1):
+            totals = order_round.paid_orderproducts().totals_per("product__supplier")
+
+        self.assertEqual(totals[supplier1.id]["cost"], op1.total_cost_price() + op2.total_cost_price())
+        self.assertEqual(totals[supplier2.id]["revenue"], op3.total_retail_price)
+        self.assertEqual(
+            totals[supplier2.id]["profit"], op3.total_retail_price - op3.total_cost_price()
+        )
+
+    def _create_paid_orderproducts(self, order_round, supplier_count):
+        for _ in range(supplier_count):
+            supplier = SupplierFactory()
+            for _ in range(2):
+                OrderProductFactory(
+                    product__supplier=supplier,
+                    product__order_round=order_round,
+                    order__order_round=order_round,
+                    order__paid=True,
+                )
+
+    def test_orders_per_supplier(self):
+        order_round = OrderRoundFactory()
+        supplier = SupplierFactory()
+        op1 = OrderProductFactory(
+            product__supplier=supplier,
+            product__order_round=order_round,
+            order__order_round=order_round,
+            order__paid=True,
+        )
+        OrderProductFactory(product=op1.product, order__order_round=order_round, order__paid=True, amount=2)
+        # Not paid
+        OrderProductFactory(product=op1.product, order__order_round=order_round, order__paid=False)
+        supplier_without_orders = SupplierFactory()
+
+        data = order_round.orders_per_supplier
+
+        self.assertEqual(data[supplier_without_orders], {"orderproducts": [], "sum": 0})
+        self.assertEqual(
+            data[supplier]["orderproducts"],
+            [
+                {
+                    "product": op1.product,
+                    "amount": op1.amount + 2,
+                    "sub_total": (op1.amount + 2) * op1.product.base_price,
+                }
+            ],
+        )
+        self.assertEqual(data[supplier]["sum"], order_round.supplier_total_order_sum(supplier))
+
+    def test_orders_per_supplier_uses_constant_number_of_queries(self):
+        order_round = OrderRoundFactory()
+        self._create_paid_orderproducts(order_round, 1)
+        fresh_round = OrderRound.objects.get(pk=order_round.pk)
+        with self.assertNumQueries(3):
+            fresh_round.orders_per_supplier
+
+        self._create_paid_orderproducts(order_round, 5)
+        fresh_round = OrderRound.objects.get(pk=order_round.pk)
+        with self.assertNumQueries(3):
+            data = fresh_round.orders_per_supplier
+            for items in data.values():
+                for item in items["orderproducts"]:
+                    item["product"].unit_of_measurement
+        self.assertEqual(len(data), 6)
+
+        # Memoized per instance
+        with self.assertNumQueries(0):
+            fresh_round.orders_per_supplier
+
     def test_number_of_orders_with_no_orders(self):
         order_round = OrderRoundFactory()
         self.assertEqual(order_round.number_of_orders(), 0)
@@ -208,10 +328,30 @@ class TestOrderRoundModel(VokoTestCase):
     def test_get_previous_order_round(self):
         self.assertTrue(self.cur_order_round.get_previous_order_round().id == self.prev_order_round.id)
 
+    def test_get_users_with_and_without_orders(self):
+        order_round = OrderRoundFactory()
+        with_order = VokoUserFactory()
+        OrderFactory(order_round=order_round, paid=True, finalized=True, user=with_order)
+        unpaid_order = VokoUserFactory()
+        OrderFactory(order_round=order_round, paid=False, user=unpaid_order)
+        other_round = VokoUserFactory()
+        OrderFactory(paid=True, finalized=True, user=other_round)
+        opted_out = VokoUserFactory()
+        UserProfile.objects.create(user=opted_out, orderround_mail_optout=True)
+        VokoUserFactory(is_active=False)
+
+        with self.assertNumQueries(2):
+            with_orders = list(order_round.get_users_with_orders())
+            without_orders = set(order_round.get_users_without_orders().iterator())
+
+        self.assertEqual(with_orders, [with_order])
+        self.assertEqual(without_orders, {unpaid_order, other_round})
+
     def test_pickup_reminder_send_to_user_with_orders(self):
-        self.mail_user = self.patch("ordering.models.mail_user")
+        self.queue_mail = self.patch("ordering.models.queue_mail")
         self.get_template_by_id = self.patch("ordering.models.get_template_by_id")
-        self.render_mail_template = self.patch("ordering.models.render_mail_template")
+        self.render_mail_template_many = self.patch("ordering.models.render_mail_template_many")
+        self.render_mail_template_many.side_effect = lambda template, contexts: [() for _ in contexts]
 
         order_round = OrderRoundFactory()
         user_with_order = VokoUserFactory()
@@ -225,11 +365,9 @@ class TestOrderRoundModel(VokoTestCase):
         order_round.send_pickup_reminder_mails()
 
         self.get_template_by_id.assert_called_once_with(config.PICKUP_REMINDER_MAIL)
-        self.render_mail_template.assert_called_once_with(
-            self.get_template_by_id.return_value, user=user_with_order, order_round=order_round
-        )
-        # only one user with an order, so mail_user is called only once
-        self.mail_user.assert_called_once_with(user_with_order)
+        self.render_mail_template_many.assert_called_once()
+        # only one user with an order, so queue_mail is called only once
+        self.queue_mail.assert_called_once_with(user_with_order)
 
     def test_send_ridecosts_request_mails(self):
         self.mail_user = self.patch("ordering.models.mail_user")
@@ -277,7 +415,7 @@ class TestOrderModel(VokoTestCase):
             self.assertEqual(debit.amount, order.total_price)
             self.assertEqual(debit.notes, "Debit van %.2f voor bestelling #%s" % (order.total_price, order.id))
 
-            mock_mail.assert_called_once_with()
+            mock_mail.assert_called_once_with(shortages=[])
 
     def test_user_order_number_with_one_paid_order(self):
         order = OrderFactory(paid=True, finalized=True)
@@ -393,6 +531,142 @@ class TestOrderModel(VokoTestCase):
         self.assertEqual(order2.member_fee, settings.MEMBER_FEE)
         self.assertEqual(order3.member_fee, Decimal("0"))
 
+    def test_with_totals_matches_total_price(self):
+        user = VokoUserFactory()
+        orders = [OrderFactory(paid=paid, user=user) for paid in (False, True, False)]
+        for order in orders:
+            OrderProductFactory(order=order, amount=3)
+            OrderProductFactory(order=order, amount=1)
+
+        with self.assertNumQueries(1):
+            annotated = list(Order.objects.filter(user=user).order_by("id").with_totals())
+            totals = [order.total_price for order in annotated]
+
+        self.assertEqual(totals, [Order.objects.get(pk=order.pk).total_price for order in orders])
+        self.assertEqual([order.member_fee for order in annotated], [settings.MEMBER_FEE] * 2 + [Decimal("0")])
+
+    def test_products_total_is_maintained_on_write(self):
+        order = OrderFactory()
+        odp = OrderProductFactory(order=order, amount=2, retail_price=Decimal("1.25"))
+        OrderProductFactory(order=order, amount=1, retail_price=Decimal("3.10"))
+        self.assertEqual(Order.objects.get(pk=order.pk).products_total, Decimal("5.60"))
+
+        odp.amount = 4
+        odp.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).products_total, Decimal("8.10"))
+
+        odp.delete()
+        self.assertEqual(Order.objects.get(pk=order.pk).products_total, Decimal("3.10"))
+        self.assertEqual(order.products_total, Decimal("3.10"))
+
+    def test_products_total_is_maintained_on_queryset_and_cascade_deletes(self):
+        order = OrderFactory()
+        first = OrderProductFactory(order=order, amount=2, retail_price=Decimal("1.25"))
+        second = OrderProductFactory(order=order, amount=1, retail_price=Decimal("3.10"))
+
+        OrderProduct.objects.filter(pk=first.pk).delete()
+        self.assertEqual(Order.objects.get(pk=order.pk).products_total, Decimal("3.10"))
+
+        Product.objects.filter(pk=second.product_id).delete()
+        self.assertEqual(Order.objects.get(pk=order.pk).products_total, Decimal("0.00"))
+
+    def test_deleting_product_updates_totals_in_one_query(self):
+        def delete_product(count):
+            product = ProductFactory()
+            orders = OrderFactory.create_batch(count, order_round=product.order_round, paid=True)
+            for order in orders:
+                OrderProductFactory(order=order, product=product)
+            OrderProductFactory(order=orders[0], amount=1, retail_price=Decimal("1.50"))
+            with CaptureQueriesContext(connection) as queries:
+                Product.objects.filter(pk=product.pk).delete()
+            self.assertEqual(Order.objects.get(pk=orders[0].pk).products_total, Decimal("1.50"))
+            self.assertEqual(Order.objects.get(pk=orders[-1].pk).products_total, Decimal("0.00"))
+            return len([q for q in queries if q["sql"].startswith("UPDATE")])
+
+        self.assertEqual(delete_product(2), delete_product(10))
+
+    def test_saving_stale_order_keeps_products_total(self):
+        order = OrderFactory()
+        stale = Order.objects.get(pk=order.pk)
+        OrderProductFactory(order=order, amount=1, retail_price=Decimal("2.00"))
+
+        stale.finalized = True
+        stale.save()
+
+        self.assertEqual(Order.objects.get(pk=order.pk).products_total, Decimal("2.00"))
+
+    def test_saving_order_without_paying_it_is_one_query(self):
+        order = Order.objects.get(pk=OrderFactory().pk)
+        order.finalized = True
+
+        with self.assertNumQueries(1):
+            order.save()
+
+    def test_paying_stale_order_that_was_paid_already(self):
+        order = OrderFactory(order_round=OrderRoundFactory())
+        product = OrderProductFactory(order=order, amount=2).product
+        stale = Order.objects.get(pk=order.pk)
+        order.paid = True
+        order.save()
+
+        stale.paid = True
+        stale.save()
+
+        self.assertEqual(ProductCounter.objects.get(product=product).ordered, 2)
+
+    def test_member_fee_and_order_number_are_frozen_when_paid(self):
+        user = VokoUserFactory()
+        first = OrderFactory(user=user, finalized=True)
+        second = OrderFactory(user=user, finalized=True, paid=True)
+
+        first.paid = True
+        first.save()
+
+        first = Order.objects.get(pk=first.pk)
+        second = Order.objects.get(pk=second.pk)
+        self.assertEqual((first.member_fee_amount, first.sequence_number), (settings.MEMBER_FEE, 1))
+        # Frozen when it was paid, as the first paid order
+        self.assertEqual((second.member_fee_amount, second.sequence_number), (settings.MEMBER_FEE, 1))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(second.user_order_number, 1)
+
+        second.paid = False
+        second.save()
+        second = Order.objects.get(pk=second.pk)
+        self.assertEqual((second.member_fee_amount, second.sequence_number), (None, None))
+
+    def test_check_totals_reports_and_fixes_differences(self):
+        order = OrderFactory()
+        OrderProductFactory(order=order, amount=1, retail_price=Decimal("2.00"))
+        Order.objects.filter(pk=order.pk).update(products_total_amount=0, member_fee_amount=1)
+
+        self.assertEqual(Order.objects.check_totals(), [
+            (order.pk, (Decimal("0.00"), Decimal("1.00"), None), (Decimal("2.00"), None, None)),
+        ])
+        Order.objects.check_totals(fix=True)
+
+        self.assertEqual(Order.objects.check_totals(), [])
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((order.products_total, order.member_fee_amount), (Decimal("2.00"), None))
+
+    def test_check_totals_leaves_frozen_totals_of_paid_orders(self):
+        user = VokoUserFactory()
+        first = OrderFactory(user=user, finalized=True)
+        OrderProductFactory(order=first, amount=1, retail_price=Decimal("2.00"))
+        second = OrderFactory(user=user, finalized=True, paid=True)
+        first.paid = True
+        first.save()
+        self.assertEqual(Order.objects.check_totals(), [])
+
+        Order.objects.filter(pk=first.pk).update(products_total_amount=0)
+        Order.objects.check_totals(fix=True)
+
+        self.assertEqual(Order.objects.get(pk=first.pk).products_total, Decimal("2.00"))
+        second = Order.objects.get(pk=second.pk)
+        # Charged as the first paid order
+        self.assertEqual((second.member_fee_amount, second.user_order_number), (settings.MEMBER_FEE, 1))
+
     def test_create_debit(self):
         order = OrderFactory()
         OrderProductFactory(order=order)
@@ -518,6 +792,35 @@ class TestProductModel(VokoTestCase):
         OrderProductFactory(product=product, order__paid=False, amount=1)
         self.assertEqual(product.amount_available, 10)
 
+    def test_with_availability_annotations_are_used_without_queries(self):
+        product = ProductFactory(maximum_total_order=None, order_round=None)
+        ProductStockFactory(product=product, type=ProductStock.TYPE_ADDED, amount=10)
+        ProductStockFactory(product=product, type=ProductStock.TYPE_LOST, amount=2)
+        OrderProductFactory(product=product, order__paid=True, amount=3)
+        user_op = OrderProductFactory(product=product, order__paid=False, amount=4)
+
+        annotated = Product.objects.with_availability(user_order=user_op.order).get(pk=product.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(annotated.all_stock(), 8)
+            self.assertEqual(annotated.amount_ordered, 3)
+            self.assertEqual(annotated.amount_available, 5)
+            self.assertEqual(annotated.verbose_availability(), "5 in voorraad")
+            self.assertEqual(annotated.ordered_amount, 4)
+        self.assertEqual(annotated.amount_available, product.amount_available)
+
+    def test_exclude_sold_out_stock(self):
+        round_product = ProductFactory(maximum_total_order=1)
+        OrderProductFactory(product=round_product, order__paid=True, amount=1)
+        stock_product = ProductFactory(order_round=None)
+        ProductStockFactory(product=stock_product, type=ProductStock.TYPE_ADDED, amount=1)
+        sold_out_stock_product = ProductFactory(order_round=None)
+
+        self.assertCountEqual(
+            Product.objects.with_availability().exclude_sold_out_stock(), [round_product, stock_product]
+        )
+        self.assertNotIn(sold_out_stock_product, Product.objects.with_availability().exclude_sold_out_stock())
+
     def test_percentage_available_with_no_max(self):
         product = ProductFactory(maximum_total_order=None)
         self.assertEqual(product.percentage_available, 100)
@@ -599,6 +902,18 @@ class TestProductModel(VokoTestCase):
 
         self.assertEqual(corrections[1].order_product, paid_odp2)
 
+    def test_creates_corrections_for_multiple_products(self):
+        products = [ProductFactory(), ProductFactory()]
+        for product in products:
+            OrderProductFactory(product=product, order__paid=True)
+        other = OrderProductFactory(order__paid=True)
+
+        corrections = Product.objects.filter(id__in=[p.id for p in products]).create_corrections()
+
+        self.assertEqual(len(corrections), 2)
+        self.assertCountEqual([c.order_product.product for c in corrections], products)
+        self.assertFalse(OrderProductCorrection.objects.filter(order_product=other).exists())
+
     def test_determine_new_product_with_one_order_round(self):
         product = ProductFactory()
         self.assertEqual(len(OrderRound.objects.all()), 1)
@@ -632,6 +947,23 @@ class TestProductModel(VokoTestCase):
         new_product = Product.objects.get(id=new_product.id)
         self.assertFalse(new_product.new)
 
+    def test_label_new_products(self):
+        round1 = OrderRoundFactory()
+        round2 = OrderRoundFactory()
+        supplier = SupplierFactory()
+        unit = UnitFactory()
+        ProductFactory(order_round=round1, name="Appels", supplier=supplier, unit=unit)
+
+        known = Product(order_round=round2, name="Appels", supplier=supplier, unit=unit, base_price=1)
+        unknown = Product(order_round=round2, name="Peren", supplier=supplier, unit=unit, base_price=1)
+        first_round = Product(order_round=round1, name="Peren", supplier=supplier, unit=unit, base_price=1)
+
+        with self.assertNumQueries(2):
+            labeled = label_new_products([known, unknown, first_round])
+
+        self.assertEqual(labeled, [(unknown, round1.id)])
+        self.assertEqual([known.new, unknown.new, first_round.new], [False, True, False])
+
     def test_verbose_availability_1(self):
         product = ProductFactory(maximum_total_order=99)
         o1 = OrderProductFactory(product=product, order__paid=True).amount
@@ -903,6 +1235,89 @@ class TestOrderProductCorrectionModel(VokoTestCase):
         OrderProductCorrection.objects.all().delete()
         self.assertEqual(len(Balance.objects.all()), 0)
 
+    def test_deletion_of_queryset_updates_running_balances(self):
+        corr = OrderProductCorrectionFactory()
+        user = corr.order_product.order.user
+        BalanceFactory(user=user, type="CR", amount=Decimal("5"))
+
+        OrderProductCorrection.objects.all().delete()
+
+        self.assertEqual(user.balance.credit(), Decimal("5"))
+
+    def test_report(self):
+        order_round = OrderRoundFactory()
+        product = ProductFactory(order_round=order_round, base_price=Decimal("2"))
+        first = OrderProductCorrectionFactory(
+            order_product__product=product, order_product__amount=1, supplied_percentage=0
+        )
+        second = OrderProductCorrectionFactory(
+            order_product__product=product, order_product__amount=2, supplied_percentage=50
+        )
+        voko = OrderProductCorrectionFactory(charge_supplier=False)
+
+        report = OrderProductCorrection.objects.all().report()
+
+        supplier_refund = first.calculate_supplier_refund() + second.calculate_supplier_refund()
+        self.assertEqual(len(report["suppliers"]), 1)
+        supplier = report["suppliers"][0]
+        self.assertEqual(supplier["name"], product.supplier.name)
+        self.assertEqual(supplier["refund"], supplier_refund)
+        self.assertEqual(len(supplier["products"]), 1)
+        totals = supplier["products"][0]
+        self.assertEqual(totals["name"], product.name)
+        self.assertEqual(totals["amount"], 3)
+        # (1 * 0 + 2 * 50) / 3
+        self.assertEqual(totals["perc_supplied"], Decimal("33.33"))
+        self.assertEqual(totals["supplier_refund"], supplier_refund)
+        self.assertEqual(totals["member_refund"], first.calculate_refund() + second.calculate_refund())
+        self.assertCountEqual([c["order_id"] for c in totals["corrections"]],
+                              [first.order_product.order_id, second.order_product.order_id])
+
+        self.assertEqual(report["voko"], [{
+            "member": voko.order_product.order.user.get_full_name(),
+            "order_id": voko.order_product.order_id,
+            "product": voko.order_product.product.name,
+            "supplier": voko.order_product.product.supplier.name,
+            "amount": voko.order_product.amount,
+            "supplied_percentage": voko.supplied_percentage,
+            "credit": voko.credit.amount,
+        }])
+
+    def test_create_many(self):
+        order_round = OrderRoundFactory()
+        first = OrderProductFactory(order__paid=True, order__order_round=order_round, product__order_round=order_round)
+        second = OrderProductFactory(order__paid=True, order__order_round=order_round, product__order_round=order_round)
+        OrderProductCorrectionFactory(order_product=second)
+
+        corrections = OrderProductCorrection.objects.create_many(
+            OrderProduct.objects.filter(id__in=[first.id, second.id]), supplied_percentage=20, notes="foo"
+        )
+
+        self.assertEqual([c.order_product for c in corrections], [first])
+        corr = OrderProductCorrection.objects.get(order_product=first)
+        self.assertEqual(corr.supplied_percentage, 20)
+        self.assertEqual(corr.notes, "foo")
+        self.assertTrue(corr.charge_supplier)
+        self.assertEqual(corr.credit.user, first.order.user)
+        self.assertEqual(corr.credit.amount, corr.calculate_refund())
+        self.assertEqual(
+            corr.credit.notes,
+            "Correctie in ronde %s, %dx %s, geleverd: 20%%" % (order_round.id, first.amount, first.product.name),
+        )
+        self.assertEqual(first.order.user.balance.credit(), corr.credit.amount)
+
+    def test_create_many_queries_do_not_depend_on_number_of_order_products(self):
+        def create(count):
+            ids = [OrderProductFactory(order__paid=True).id for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                OrderProductCorrection.objects.create_many(
+                    OrderProduct.objects.filter(id__in=ids), supplied_percentage=0
+                )
+            return len(queries)
+
+        self.assertEqual(create(5), create(1))
+        self.assertEqual(OrderProductCorrection.objects.count(), 6)
+
 
 class TestProductStockModel(VokoTestCase):
     def test_changing_amount_is_prohibited(self):
@@ -932,3 +1347,250 @@ class TestProductStockModel(VokoTestCase):
     def test_regular_save(self):
         ps = ProductStockFactory()
         ps.save()
+
+
+class TestProductCounterModel(VokoTestCase):
+    def setUp(self):
+        self.round = OrderRoundFactory()
+        self.product = ProductFactory(order_round=self.round, maximum_total_order=10)
+
+    def counter(self, product=None):
+        return ProductCounter.objects.get(product=product or self.product)
+
+    def test_paid_order_products_are_counted(self):
+        order = OrderFactory(order_round=self.round, paid=True)
+        order_product = OrderProductFactory(order=order, product=self.product, amount=3)
+        self.assertEqual(self.counter().ordered, 3)
+
+        order_product.amount = 5
+        order_product.save()
+        self.assertEqual(self.counter().ordered, 5)
+
+        order_product.delete()
+        self.assertEqual(self.counter().ordered, 0)
+
+    def test_unpaid_order_products_are_not_counted(self):
+        OrderProductFactory(order__order_round=self.round, product=self.product, amount=3)
+        self.assertFalse(ProductCounter.objects.filter(product=self.product).exists())
+        self.assertEqual(self.product.amount_ordered, 0)
+
+    def test_paying_and_deleting_order_updates_counter(self):
+        order = OrderFactory(order_round=self.round)
+        OrderProductFactory(order=order, product=self.product, amount=4)
+
+        order.paid = True
+        order.save()
+        self.assertEqual(self.counter().ordered, 4)
+
+        order.delete()
+        self.assertEqual(self.counter().ordered, 0)
+
+    def test_queryset_and_cascade_deletes_update_counter(self):
+        first = OrderFactory(order_round=self.round, paid=True)
+        OrderProductFactory(order=first, product=self.product, amount=4)
+        second = OrderFactory(order_round=self.round, paid=True)
+        OrderProductFactory(order=second, product=self.product, amount=3)
+        self.assertEqual(self.product.amount_available, 3)
+
+        Order.objects.filter(pk=first.pk).delete()
+        self.assertEqual(self.counter().ordered, 3)
+
+        second.user.delete()
+        self.assertEqual(self.counter().ordered, 0)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).amount_available, 10)
+
+    def test_deleting_product_with_paid_orders(self):
+        OrderProductFactory(order__order_round=self.round, order__paid=True, product=self.product, amount=4)
+
+        Product.objects.filter(pk=self.product.pk).delete()
+
+        self.assertFalse(ProductCounter.objects.exists())
+        self.assertFalse(OrderProduct.objects.exists())
+
+    def test_stock_is_counted(self):
+        product = ProductFactory(order_round=None)
+        ProductStockFactory(product=product, amount=10, type=ProductStock.TYPE_ADDED)
+        lost = ProductStockFactory(product=product, amount=3, type=ProductStock.TYPE_LOST)
+        self.assertEqual(self.counter(product).stock, 7)
+
+        lost.delete()
+        self.assertEqual(self.counter(product).stock, 10)
+
+    def test_recount_repairs_counters(self):
+        product = ProductFactory(order_round=None)
+        ProductStockFactory(product=product, amount=10)
+        OrderProductFactory(order__paid=True, product=product, amount=2)
+        ProductCounter.objects.filter(product=product).update(ordered=0, stock=0)
+
+        self.assertEqual(ProductCounter.objects.recount([product], dry_run=True), [(product.pk, (0, 0), (2, 10))])
+        self.assertEqual(self.counter(product).ordered, 0)
+
+        ProductCounter.objects.recount([product])
+
+        counter = self.counter(product)
+        self.assertEqual((counter.ordered, counter.stock), (2, 10))
+        self.assertEqual(ProductCounter.objects.recount([product]), [])
+
+    def test_recount_product_counters_command(self):
+        OrderProductFactory(order__order_round=self.round, order__paid=True, product=self.product, amount=2)
+        ProductCounter.objects.filter(product=self.product).update(ordered=5)
+
+        out = StringIO()
+        call_command("recount_product_counters", stdout=out)
+
+        self.assertIn("Fixed 1 product counter(s)", out.getvalue())
+        self.assertEqual(self.counter().ordered, 2)
+
+    def test_reserve_products_lowers_amount_to_availability(self):
+        OrderProductFactory(order__order_round=self.round, order__paid=True, product=self.product, amount=8)
+        order = OrderFactory(order_round=self.round, finalized=True)
+        order_product = OrderProductFactory(order=order, product=self.product, amount=5)
+
+        order.reserve_products()
+
+        self.assertEqual(OrderProduct.objects.get(pk=order_product.pk).amount, 2)
+
+    def test_reserve_products_removes_sold_out_product(self):
+        OrderProductFactory(order__order_round=self.round, order__paid=True, product=self.product, amount=10)
+        order = OrderFactory(order_round=self.round, finalized=True)
+        OrderProductFactory(order=order, product=self.product, amount=1)
+
+        order.reserve_products()
+
+        self.assertFalse(order.orderproducts.exists())
+
+    def test_complete_after_payment_reserves_products(self):
+        order = OrderFactory(order_round=self.round, finalized=True)
+        OrderProductFactory(order=order, product=self.product, amount=12)
+
+        with patch("ordering.models.Order.mail_confirmation"):
+            order.complete_after_payment()
+
+        self.assertEqual(order.orderproducts.get().amount, 10)
+        self.assertEqual(self.counter().ordered, 10)
+        # Debited for what was paid, with the sold out products credited
+        refund = 2 * self.product.retail_price
+        self.assertEqual(order.debit.amount, order.total_price + refund)
+        credit = Balance.objects.get(user=order.user, type="CR")
+        self.assertEqual(credit.amount, refund)
+        self.assertEqual(credit.notes, "Tegoed voor uitverkochte producten van bestelling #%d: 2 x %s"
+                         % (order.pk, self.product.name))
+
+    def test_confirmation_mail_lists_sold_out_products(self):
+        order = OrderFactory(order_round=self.round, finalized=True)
+        OrderProductFactory(order=order, product=self.product, amount=12)
+
+        rendered = ("Bestelling", "<p>Bedankt</p>", "Bedankt", None)
+        with patch("ordering.models.get_template_by_id"), \
+                patch("ordering.models.render_mail_template", return_value=rendered), \
+                patch("ordering.models.mail_user") as mail_user:
+            order.complete_after_payment()
+
+        _, subject, html_body, plain_body, _ = mail_user.call_args[0]
+        self.assertIn("%s: 12 besteld, 10 geleverd" % self.product.name, html_body)
+        self.assertTrue(html_body.endswith("<p>Bedankt</p>"))
+        self.assertIn("%s: 12 besteld, 10 geleverd" % self.product.name, plain_body)
+
+
+class TestRoundStatisticsModel(VokoTestCase):
+    def setUp(self):
+        now = datetime.now(UTC)
+        self.round = OrderRoundFactory(
+            open_for_orders=now - timedelta(days=7), closed_for_orders=now - timedelta(days=1)
+        )
+        self.supplier = SupplierFactory()
+        self.product = ProductFactory(order_round=self.round, supplier=self.supplier)
+        ProductFactory(order_round=self.round, supplier=self.supplier)
+        ProductFactory(order_round=self.round)
+
+    def _paid_order_product(self, user=None, **kwargs):
+        order = OrderFactory(order_round=self.round, paid=True, **({"user": user} if user else {}))
+        return OrderProductFactory(order=order, product=self.product, **kwargs)
+
+    def test_refresh_calculates_statistics(self):
+        order_product = self._paid_order_product(amount=2, retail_price=Decimal("1.50"))
+        self._paid_order_product(user=order_product.order.user, amount=1, retail_price=Decimal("1.50"))
+        OrderProductFactory(order__order_round=self.round, product=self.product)
+
+        statistics = RoundStatistics.objects.refresh(self.round)
+
+        self.assertEqual(statistics.number_of_orders, 2)
+        self.assertEqual(statistics.number_of_ordering_members, 1)
+        self.assertEqual(statistics.total_revenue, Decimal("4.50"))
+        self.assertEqual(statistics.total_revenue, self.round.total_revenue())
+        self.assertEqual(statistics.number_of_products, 3)
+        self.assertEqual(statistics.number_of_suppliers, 2)
+
+    def test_late_payment_refreshes_statistics(self):
+        RoundStatistics.objects.refresh(self.round)
+        order = OrderFactory(order_round=self.round)
+        OrderProductFactory(order=order, product=self.product, amount=2, retail_price=Decimal("2.00"))
+
+        order.paid = True
+        order.save()
+
+        statistics = RoundStatistics.objects.get(order_round=self.round)
+        self.assertEqual(statistics.number_of_orders, 1)
+        self.assertEqual(statistics.total_revenue, Decimal("4.00"))
+
+        order.delete()
+        self.assertEqual(RoundStatistics.objects.get(order_round=self.round).number_of_orders, 0)
+
+    def test_changed_paid_order_product_refreshes_statistics(self):
+        order_product = self._paid_order_product(amount=2, retail_price=Decimal("2.00"))
+
+        order_product.amount = 3
+        order_product.save()
+        self.assertEqual(RoundStatistics.objects.get(order_round=self.round).total_revenue, Decimal("6.00"))
+
+        order_product.delete()
+        self.assertEqual(RoundStatistics.objects.get(order_round=self.round).total_revenue, Decimal("0.00"))
+
+    def test_payment_in_open_round_does_not_create_statistics(self):
+        OrderProductFactory(order__paid=True)
+        self.assertFalse(RoundStatistics.objects.exists())
+
+    def test_fill_missing_only_fills_closed_rounds_without_statistics(self):
+        OrderRoundFactory()
+        other = OrderRoundFactory(
+            open_for_orders=self.round.open_for_orders, closed_for_orders=self.round.closed_for_orders
+        )
+        RoundStatistics.objects.refresh(other)
+
+        self.assertEqual(RoundStatistics.objects.fill_missing(), 1)
+        self.assertEqual(
+            set(RoundStatistics.objects.values_list("order_round", flat=True)), {self.round.pk, other.pk}
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Requires row locking (PostgreSQL)")
+class TestProductCounterConcurrency(VokoTestCase):
+    def test_concurrent_payments_do_not_oversell(self):
+        order_round = OrderRoundFactory()
+        product = ProductFactory(order_round=order_round, maximum_total_order=5)
+        orders = []
+        for _ in range(20):
+            order = OrderFactory(order_round=order_round, finalized=True)
+            OrderProductFactory(order=order, product=product, amount=1)
+            orders.append(order)
+
+        barrier = threading.Barrier(len(orders))
+
+        def pay(order):
+            try:
+                barrier.wait()
+                order.complete_after_payment()
+            finally:
+                connection.close()
+
+        with patch("ordering.models.Order.mail_confirmation"):
+            threads = [threading.Thread(target=pay, args=(order,)) for order in orders]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(Order.objects.filter(paid=True).count(), 20)
+        self.assertEqual(OrderProduct.objects.filter(order__paid=True).count(), 5)
+        self.assertEqual(product.amount_ordered, 5)
+        self.assertEqual(product.amount_available, 0)
@@ -0,0 +1,176 @@
+from io import BytesIO
+
+import openpyxl
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ordering.models import DraftProduct, Product
+from ordering.product_import import import_product_list, parse_rows
+from ordering.tests.factories import (
+    OrderRoundFactory, ProductCategoryFactory, ProductUnitFactory,
+    SupplierFactory)
+from vokou.testing import VokoTestCase
+
+HEADER = ("Naam", "Omschrijving", "Eenheid", "Prijs", "Max", "Categorie")
+
+
+def xlsx_file(rows, name="producten.xlsx"):
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    content = BytesIO()
+    workbook.save(content)
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+def csv_file(text, name="producten.csv", encoding="utf-8"):
+    return SimpleUploadedFile(name, text.encode(encoding))
+
+
+class TestParseRows(VokoTestCase):
+    def test_skips_header_and_rows_without_name(self):
+        data, skipped = parse_rows([
+            HEADER,
+            ("Appels", "Lekker", "kg", "€ 2,50", "10", "Fruit"),
+            (None, "Geen naam", "kg", 1, None, None),
+            ("Peren", None, "stuk", 1.5, None),
+        ])
+
+        self.assertEqual(skipped, 1)
+        self.assertEqual(data, [
+            {"name": "Appels", "description": "Lekker", "unit": "kg",
+             "base_price": "2.50", "maximum_total_order": 10.0,
+             "category": "Fruit", "row": 2},
+            {"name": "Peren", "description": "", "unit": "stuk",
+             "base_price": "1.5", "maximum_total_order": None,
+             "category": None, "row": 4},
+        ])
+
+    def test_invalid_maximum_is_left_for_validation(self):
+        data, _ = parse_rows([HEADER, ("Appels", None, "kg", 1, "veel", None)])
+        self.assertEqual(data[0]["maximum_total_order"], "veel")
+
+
+class TestImportProductList(VokoTestCase):
+    def setUp(self):
+        self.supplier = SupplierFactory()
+        self.round = OrderRoundFactory()
+        self.unit = ProductUnitFactory(name="Kilogram", description="Kilo",
+                                       abbreviations="kg")
+
+    def test_import_xlsx(self):
+        upload = xlsx_file([
+            HEADER,
+            ("Appels", "Lekker", "2 kg", 2.5, None, None),
+            ("Peren", "", "liter", 1, None, None),
+        ])
+
+        report = import_product_list(upload, self.supplier, self.round)
+
+        self.assertEqual((report.valid, report.invalid, report.skipped), (1, 1, 0))
+        self.assertEqual(report.errors(), [(3, "Peren", "Eenheid onjuist")])
+        drafts = DraftProduct.objects.order_by("id")
+        self.assertEqual([d.data["name"] for d in drafts], ["Appels", "Peren"])
+        self.assertEqual([d.is_valid for d in drafts], [True, False])
+
+    def test_import_csv_with_semicolons_from_excel(self):
+        upload = csv_file("Naam;Omschrijving;Eenheid;Prijs;Max;Categorie\n"
+                          "Crème fraîche;;kg;€ 1,25;;\n"
+                          ";;;;;\n", encoding="cp1252")
+
+        report = import_product_list(upload, self.supplier, self.round)
+
+        self.assertEqual((report.valid, report.invalid, report.skipped), (1, 0, 1))
+        draft = DraftProduct.objects.get()
+        self.assertEqual(draft.data["name"], "Crème fraîche")
+        self.assertEqual(draft.data["base_price"], "1.25")
+
+    def test_import_replaces_drafts_with_one_insert(self):
+        DraftProduct.objects.create(supplier=self.supplier, order_round=self.round,
+                                    data={"name": "Oud"})
+        rows = "\n".join("Product %d,,kg,1,," % i for i in range(20))
+
+        with CaptureQueriesContext(connection) as queries:
+            import_product_list(csv_file("Naam,Omschrijving,Eenheid,Prijs,Max,Categorie\n" + rows),
+                                self.supplier, self.round)
+
+        self.assertEqual(DraftProduct.objects.count(), 20)
+        self.assertFalse(DraftProduct.objects.filter(data__contains="Oud").exists())
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("INSERT")]), 1)
+
+
+class TestProductListViews(VokoTestCase):
+    def setUp(self):
+        self.login(group="Boeren")
+        self.supplier = SupplierFactory()
+        self.round = OrderRoundFactory()
+        ProductUnitFactory(name="Kilogram", description="Kilo", abbreviations="kg")
+        self.kwargs = {"supplier": self.supplier.id}
+
+    def test_upload_reports_import(self):
+        upload = csv_file("Naam,Omschrijving,Eenheid,Prijs,Max,Categorie\n"
+                          "Appels,,kg,1,,\nPeren,,kg,gratis,,\n")
+
+        ret = self.client.post(reverse("upload_products", kwargs=self.kwargs),
+                               {"product_list": upload}, follow=True)
+
+        self.assertContains(ret, "2 producten ingelezen (1 geldig, 1 ongeldig)")
+        self.assertContains(ret, "rij 3 (Peren): Prijs onjuist")
+
+    def test_draft_products_are_not_validated_again_on_view(self):
+        import_product_list(csv_file("Naam,Omschrijving,Eenheid,Prijs,Max,Categorie\nAppels,,kg,1,,\n"),
+                            self.supplier, self.round)
+        url = reverse("create_draft_products", kwargs=self.kwargs)
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([q for q in queries if q["sql"].startswith("UPDATE \"ordering_draftproduct\"")])
+
+    def test_create_real_products(self):
+        category = ProductCategoryFactory(name="Fruit")
+        import_product_list(csv_file("Naam,Omschrijving,Eenheid,Prijs,Max,Categorie\n"
+                                     "Appels,,2 kg,1,,fruit\n"),
+                            self.supplier, self.round)
+
+        self.client.get(reverse("create_real_products", kwargs=self.kwargs))
+
+        product = Product.objects.get()
+        self.assertEqual((product.name, product.unit_amount, product.category), ("Appels", 2, category))
+        self.assertFalse(DraftProduct.objects.exists())
+
+
+class TestPublishDraftProducts(VokoTestCase):
+    def setUp(self):
+        self.supplier = SupplierFactory()
+        self.previous_round = OrderRoundFactory()
+        self.round = OrderRoundFactory()
+        self.unit = ProductUnitFactory(name="Kilogram", description="Kilo", abbreviations="kg")
+        ProductCategoryFactory(name="Fruit")
+
+    def _import(self, *rows):
+        import_product_list(csv_file("\n".join((",".join(HEADER),) + rows)), self.supplier, self.round)
+        return DraftProduct.objects.filter(supplier=self.supplier, order_round=self.round)
+
+    def test_publish_creates_products_with_new_label(self):
+        Product.objects.create(name="Appels", supplier=self.supplier, unit=self.unit,
+                               order_round=self.previous_round, base_price=1)
+        drafts = self._import("Appels,,kg,1,,", "Peren,,2 kg,1.5,,Fruit", "Kapot,,kg,gratis,,")
+
+        products = DraftProduct.objects.publish(drafts)
+
+        self.assertEqual([(p.name, p.new) for p in products], [("Appels", False), ("Peren", True)])
+        peren = Product.objects.get(name="Peren")
+        self.assertEqual((peren.unit_amount, peren.category.name), (2, "Fruit"))
+        self.assertFalse(DraftProduct.objects.exists())
+
+    def test_publish_queries_do_not_depend_on_number_of_drafts(self):
+        def publish(count):
+            drafts = self._import(*["Product %d,,kg,1,,Fruit" % i for i in range(count)])
+            with CaptureQueriesContext(connection) as queries:
+                DraftProduct.objects.publish(drafts)
+            return len(queries)
+
+        self.assertEqual(publish(1), publish(30))
@@ -1,6 +1,9 @@
 from unittest import skip
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.formats import localize
 from ordering.models import Product, OrderProduct
 from ordering.tests.factories import (ProductFactory, OrderRoundFactory,
                                       OrderProductFactory, OrderFactory,
@@ -235,3 +238,28 @@ class TestProductsView(VokoTestCase):
             (product.name, product.supplier.name, product.amount_available,
              product.unit_of_measurement.lower())
         )
+
+    def test_menu_shows_cart_total(self):
+        OrderProductFactory(order=self.order, product__order_round=self.round)
+        total = self.order.total_price
+
+        ret = self.client.get(self.url)
+
+        self.assertContains(ret, "Bestelling (&euro; %s)" % localize(total))
+        self.assertContains(ret, reverse('finish_order', args=(self.order.pk,)))
+
+    def test_menu_cart_queries_do_not_depend_on_number_of_products(self):
+        url = reverse('contact')
+
+        def get():
+            self.client.get(url)  # warm up caches
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            return queries
+
+        OrderProductFactory(order=self.order, product__order_round=self.round)
+        few = get()
+        OrderProductFactory.create_batch(5, order=self.order, product__order_round=self.round)
+        many = get()
+
+        self.assertEqual(len(few), len(many))
@@ -11,11 +11,12 @@ from django.views.generic import (
 from django.views.generic.detail import SingleObjectMixin
 
 from ordering.core import (get_or_create_order, get_order_product,
+                           update_order_products,
                            update_totals_for_products_with_max_order_amounts)
 
 from ordering.forms import OrderProductForm
 from ordering.mixins import UserOwnsObjectMixin
-from ordering.models import (Product, OrderProduct, Order, Supplier,
+from ordering.models import (Product, Order, Supplier,
                              OrderRound, ProductCategory)
 
 
@@ -35,7 +36,7 @@ class ProductsView(LoginRequiredMixin, ListView):
             Q(order_round=order_round) | Q(order_round__isnull=True)
         ).order_by('name').select_related(
             'category', 'supplier', 'order_round', 'unit'
-        ).prefetch_related('orderproducts')
+        )
 
     def get(self, *args, **kwargs):
         ret = super(ProductsView, self).get(*args, **kwargs)
@@ -48,7 +49,7 @@ class ProductsView(LoginRequiredMixin, ListView):
             return HttpResponseRedirect(reverse('finish_order', args=(order.pk,)))
         return ret
 
-    def post(self, request, *args, **kwargs):  # noqa: C901
+    def post(self, request, *args, **kwargs):
         """
         Handling complex forms using Django's forms framework is nearly
         impossible without all kinds of trickery that don't necessarily
@@ -61,59 +62,30 @@ class ProductsView(LoginRequiredMixin, ListView):
         assert order.finalized is False
         assert order.paid is False
 
-        for key, value in list(request.POST.items()):
+        amounts = {}
+        for key, value in request.POST.items():
             if (key.startswith("order-product-")
                     and (value.isdigit() or value == "")):
                 try:
                     prod_id = int(key.split("-")[-1])
-                    value = value.strip()
-                    product = Product.objects.get(id=prod_id)
-                except (IndexError, ValueError, Product.DoesNotExist):
+                except (IndexError, ValueError):
                     self._message_unknown_error()
                     return redirect('view_products')
 
-                try:
-                    order_product = OrderProduct.objects.get(order=order,
-                                                             product=product)
-                except OrderProduct.DoesNotExist:
-                    order_product = None
-
-                if (value.isdigit()
-                        and product.maximum_total_order
-                        and int(value) > product.amount_available):
-
-                    if product.is_available:
-                        self._message_insufficient_available(product)
-                    else:
-                        self._message_sold_out(product)
-
-                    value = 0
-
-                # User deleted a product
-                if not isinstance(value, int) and not value.isdigit():
-                    value = 0
-                if not int(value):
-                    if order_product:
-                        order_product.delete()
-                    continue
-
-                # Update order_product
-                if order_product:
-                    if order_product.amount != int(value):
-                        order_product.amount = int(value)
-                        order_product.save()
-
-                    continue
-
-                # Create order_product
-                if value and int(value) > 0:
-                    OrderProduct.objects.create(
-                        order=order,
-                        product=product,
-                        amount=int(value),
-                        retail_price=product.retail_price,
-                        base_price=product.base_price
-                    )
+                # An empty value means: user deleted a product
+                amounts[prod_id] = int(value) if value else 0
+
+        try:
+            rejected_products = update_order_products(order, amounts)
+        except Product.DoesNotExist:
+            self._message_unknown_error()
+            return redirect('view_products')
+
+        for product in rejected_products:
+            if product.is_available:
+                self._message_insufficient_available(product)
+            else:
+                self._message_sold_out(product)
 
         return redirect(reverse('finish_order', args=(order.pk,)))
 
@@ -162,24 +134,14 @@ class ProductsView(LoginRequiredMixin, ListView):
 
     def products(self):
         """
-        Return all products in this round.
-        Assign an 'ordered_amount' attribute to any product for which an
-        OrderProduct exists for the current open order and the product.
+        Return all products in this round, annotated with their availability
+        and the 'ordered_amount' of the current open order.
+        Unavailable stock products are left out.
         """
         user_open_order = get_or_create_order(self.request.user)
-        qs = list(self.get_queryset())
-
-        for product in qs:
-            if product.orderproducts.filter(order=user_open_order):
-                product.ordered_amount = product.orderproducts.get(
-                    order=user_open_order).amount
-
-            # Don't show unavailable stock products.
-            # This is not very efficient, it should be done at DB level
-            if product.is_stock_product() and not product.is_available:
-                continue
-
-            yield product
+        return self.get_queryset() \
+            .with_availability(user_order=user_open_order) \
+            .exclude_sold_out_stock()
 
     @staticmethod
     def categories():
@@ -1,5 +1,6 @@
 from django.db import models
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django_extensions.db.models import TimeStampedModel
 from ordering.models import Supplier, OrderRound
@@ -75,7 +76,7 @@ class Ride(TimeStampedModel):
     def transport_coordinator(self):
         return self.order_round.transport_coordinator
 
-    @property
+    @cached_property
     def orders_per_supplier(self):
         orders_per_supplier = self.order_round.orders_per_supplier
         suppliers_in_route = self.route.suppliers.all()
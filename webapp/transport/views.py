@@ -36,6 +36,7 @@ class Schedule(LoginRequiredMixin, ListView):
 class Ride(LoginRequiredMixin, UserIsInvolvedMixin, DetailView):
     template_name = "transport/ride.html"
     model = models.Ride
+    queryset = models.Ride.objects.select_related("order_round", "route")
 
 
 class Cars(LoginRequiredMixin, GroupRequiredMixin, ListView):
@@ -1,11 +1,12 @@
 import csv
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.contrib import admin
 from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
 from django.utils.html import escape
 from django.urls import reverse, NoReverseMatch
 
 from accounts.models import VokoUser
+from vokou.utils import CSV_EXPORT_CHUNK_SIZE, Echo
 
 
 class DeleteDisabledMixin(object):
@@ -20,13 +21,36 @@ class DeleteDisabledMixin(object):
         return False
 
 
+def streaming_csv_response(filename, rows, header=None):
+    """
+    Return a StreamingHttpResponse that writes :rows: as CSV while the
+    response is being sent, so exports don't have to fit in memory.
+    :rows: should be lazy (e.g. built from a queryset's .iterator()).
+    """
+    writer = csv.writer(Echo())
+
+    def lines():
+        if header:
+            yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(),
+                                     content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
+
+
 # copied from https://gist.github.com/mgerring/3645889
 def export_as_csv_action(description="Export selected objects as CSV file",
-                         fields=None, exclude=None, header=True):
+                         fields=None, exclude=None, header=True,
+                         select_related=None):
     """
     This function returns an export csv action
     'fields' and 'exclude' work like in django ModelForm
     'header' is whether or not to output the column names as the first row
+    'select_related' lists relations used by 'fields', so they are fetched
+    in the same query
     """
 
     def export_as_csv(modeladmin, request, queryset):
@@ -37,20 +61,18 @@ def export_as_csv_action(description="Export selected objects as CSV file",
         else:
             field_names = fields
 
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response[
-            'Content-Disposition'] = 'attachment; filename=%s.csv' % str(
-            opts).replace('.', '_')
+        if select_related:
+            queryset = queryset.select_related(*select_related)
 
-        writer = csv.writer(response)
-        if header:
-            writer.writerow(field_names)
-        for obj in queryset:
-            row = [getattr(obj, field)() if callable(
-                getattr(obj, field)) else getattr(obj, field)
-                for field in field_names]
-            writer.writerow(row)
-        return response
+        def rows():
+            for obj in queryset.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+                yield [getattr(obj, field)() if callable(
+                    getattr(obj, field)) else getattr(obj, field)
+                    for field in field_names]
+
+        return streaming_csv_response(
+            '%s.csv' % str(opts).replace('.', '_'), rows(),
+            header=field_names if header else None)
 
     export_as_csv.short_description = description
     return export_as_csv
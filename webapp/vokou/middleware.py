@@ -1,4 +1,5 @@
-from ordering.core import get_current_order_round
+from log import buffered_events
+from ordering.core import get_current_order_round, request_cache
 
 
 class OrderRoundMiddleware(object):
@@ -7,7 +8,20 @@ class OrderRoundMiddleware(object):
         # One-time configuration and initialization.
 
     def __call__(self, request):
-        request.current_order_round = get_current_order_round()
+        with request_cache():
+            request.current_order_round = get_current_order_round()
 
-        response = self.get_response(request)
+            response = self.get_response(request)
         return response
+
+
+class EventLogMiddleware(object):
+    """
+    Write the events logged during a request in one go when it's done
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffered_events():
+            return self.get_response(request)
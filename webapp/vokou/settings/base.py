@@ -1,4 +1,5 @@
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+import logging
 import os
 from pathlib import Path
 
@@ -29,6 +30,7 @@ TEMPLATES = [
                 "django.template.context_processors.static",
                 "django.template.context_processors.tz",
                 "ordering.context_processors.pickup_locations",
+                "ordering.context_processors.cart",
             ],
         },
     },
@@ -70,6 +72,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "vokou.middleware.EventLogMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -90,10 +93,28 @@ CRON_CLASSES = [
     "ordering.cron.SendDistributionMails",
     "ordering.cron.SendRideCostsRequestMails",
     "ordering.cron.AutoCreateOrderRoundBatch",
+    "ordering.cron.CreateRoundStatistics",
+    "ordering.cron.RecountProductCounters",
+    "ordering.cron.CheckOrderTotals",
+    "finance.cron.RebuildRunningBalances",
+    "mailing.cron.SendQueuedMail",
+    "log.cron.PruneEventLog",
 ]
 
 DJANGO_CRON_DELETE_LOGS_OLDER_THAN = 365
 
+# Upper bound (seconds) for caching the current order round; the cache is
+# also invalidated on OrderRound save/delete and at round boundaries.
+CURRENT_ORDER_ROUND_CACHE_TIMEOUT = 60 * 60
+
+# Seconds to cache the correction admin JSON and correction report of a
+# round (invalidated when corrections are made and when paid orders change)
+CORRECTION_CACHE_TIMEOUT = 60 * 60
+
+# Seconds to cache the index used to find product units (invalidated when
+# a ProductUnit is saved or deleted)
+UNIT_INDEX_CACHE_TIMEOUT = 60 * 60 * 24
+
 ROOT_URLCONF = "vokou.urls"
 WSGI_APPLICATION = "vokou.wsgi.application"
 
@@ -122,6 +143,34 @@ MOLLIE_API_KEY = "SETME"
 BASE_URL = "https://leden.vokoutrecht.nl"
 DEFAULT_FROM_EMAIL = "VOKO Utrecht <info@vokoutrecht.nl>"
 
+# Outbox (mailing.models.OutgoingMail): mails sent per SMTP connection,
+# seconds to wait between batches and attempts before giving up on a mail
+MAIL_QUEUE_BATCH_SIZE = 50
+MAIL_QUEUE_THROTTLE = 1
+MAIL_QUEUE_MAX_ATTEMPTS = 5
+
+# Seconds to cache mail templates fetched by id (invalidated on save)
+MAIL_TEMPLATE_CACHE_TIMEOUT = 60 * 60
+
+# EventLog (log.log_event): events below EVENT_LOG_LEVEL are dropped, except
+# for a random EVENT_LOG_SAMPLE_RATE fraction of them. Buffered events
+# (log.buffered_events) are written per EVENT_LOG_BUFFER_SIZE.
+EVENT_LOG_LEVEL = logging.DEBUG
+EVENT_LOG_SAMPLE_RATE = 0
+EVENT_LOG_BUFFER_SIZE = 100
+
+# Days to keep EventLog rows, per category of events. An event falls under
+# the first policy whose filter it matches. Expired events are appended to
+# a gzipped JSON lines file in EVENT_LOG_ARCHIVE_DIR (if set) and deleted
+# by the log.cron.PruneEventLog cron job (or the prune_eventlog command).
+EVENT_LOG_RETENTION = (
+    {"filter": {"level__lte": logging.DEBUG}, "days": 30},
+    {"filter": {"event__startswith": "Mail "}, "days": 365},
+    {"days": 365 * 7},
+)
+# Outside the checkout, so deploys don't touch the archives.
+EVENT_LOG_ARCHIVE_DIR = os.environ.get("EVENT_LOG_ARCHIVE_DIR", "/var/lib/voko/archive/eventlog")
+
 TINYMCE_DEFAULT_CONFIG = {
     "plugins": "table,xhtmlxtras,paste,searchreplace",
     "theme_advanced_buttons3_add": "cite,abbr",
@@ -33,6 +33,7 @@ ADMIN_USER_LIST_COUNT = 20
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = "/tmp/app-messages"
+EVENT_LOG_ARCHIVE_DIR = "/tmp/app-archive/eventlog"
 
 INSTALLED_APPS += [  # noqa: F405
     "debug_toolbar",
@@ -1,3 +1,4 @@
+import logging
 import os
 
 from .base import *  # noqa: F401, F403
@@ -14,8 +15,20 @@ DATABASES = {
     }
 }
 
+# Shared between uwsgi workers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": "/var/tmp/voko_cache",
+    }
+}
+
 SERVER_EMAIL = "info@vokoutrecht.nl"
 
+# Keep one in ten [DEBUG] events, e.g. of the payment flow
+EVENT_LOG_LEVEL = logging.INFO
+EVENT_LOG_SAMPLE_RATE = 0.1
+
 ADMINS = (("Voko Utrecht", os.getenv("ADMIN_EMAIL", "info@vokoutrecht.nl")),)
 
 ALLOWED_HOSTS = ("ldn.vokoutrecht.nl", "leden.vokoutrecht.nl", "acc.vokoutrecht.nl", "dev.vokoutrecht.nl", "127.0.0.1")
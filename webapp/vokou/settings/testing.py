@@ -12,4 +12,18 @@ DATABASES = {
     }
 }
 
+# Run the tests against PostgreSQL (needed for the concurrency tests) by
+# setting TEST_POSTGRES_DB, e.g. TEST_POSTGRES_DB=voko pytest
+if os.environ.get("TEST_POSTGRES_DB"):
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ["TEST_POSTGRES_DB"],
+        "USER": os.environ.get("TEST_POSTGRES_USER", "voko"),
+        "PASSWORD": os.environ.get("TEST_POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("TEST_POSTGRES_HOST", "localhost"),
+    }
+
 DEBUG = False
+
+# Tests pass their own archive directory to EventLog.objects.prune
+EVENT_LOG_ARCHIVE_DIR = None
@@ -0,0 +1,11 @@
+# Number of rows fetched from the database per round trip by CSV exports
+CSV_EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo(object):
+    """
+    File-like object that hands every written line back to the caller, so
+    a csv.writer can produce the lines of a StreamingHttpResponse
+    """
+    def write(self, value):
+        return value